@@ -0,0 +1,9 @@
+import logging
+import sys
+from be import conf
+from be.aio.app import serve
+
+# usage: python -m be.aio [port]
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    serve(port=int(sys.argv[1]) if len(sys.argv) > 1 else conf.Port)
@@ -0,0 +1,353 @@
+# ASGI front end with the routes of the be/view blueprints, on the asyncio
+# models of be/aio. Run with any ASGI server, e.g. `uvicorn be.aio.app:app`,
+# or with python -m be.aio, which also serves /shutdown
+import asyncio
+import json
+import logging
+import re
+import time
+from urllib.parse import parse_qs
+import uvicorn
+from werkzeug.http import parse_range_header
+from be.aio import store
+from be.aio.book import Book
+from be.aio.buyer import Buyer
+from be.aio.seller import Seller
+from be.aio.user import User
+from be import conf
+from be.model import metrics
+from be.model.buyer import History_Page_Size, start_expiry_sweep, stop_expiry_sweep
+from be.view.search import dumps
+
+
+class Request:
+    def __init__(self, scope, body: bytes):
+        self.path = scope["path"]
+        self.args = {k: v[0] for k, v in parse_qs(scope["query_string"].decode("latin-1")).items()}
+        self.headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        self.json = json.loads(body) if body else {}
+        self.params = {}
+
+
+# (method, path pattern, handler, path) with handlers returning (status,
+# payload); a payload of bytes is sent as it is with the (content type,
+# extra headers) after it
+routes = []
+
+
+def route(path: str, method: str = "POST"):
+    pattern = re.compile("^" + re.sub(r"<(int:)?(\w+)>", lambda m: "(?P<{}>{})".format(
+        m.group(2), r"\d+" if m.group(1) else "[^/]+"), path) + "$")
+
+    def register(handler):
+        routes.append((method, pattern, handler, path))
+        return handler
+    return register
+
+
+# the uvicorn server started by serve(); /shutdown stops it
+server = None
+
+
+@route("/shutdown", "GET")
+async def shutdown(request):
+    if server is None:
+        return 500, {"message": "Not running with be.aio.app.serve"}
+    server.should_exit = True
+    return 200, {"message": "Server shutting down..."}
+
+
+@route("/metrics", "GET")
+async def get_metrics(request):
+    return 200, metrics.render().encode(), "text/plain; version=0.0.4; charset=utf-8", []
+
+
+@route("/auth/login")
+async def login(request):
+    code, message, token = await User().login(
+        user_id=request.json.get("user_id", ""), password=request.json.get("password", ""),
+        terminal=request.json.get("terminal", ""))
+    return code, {"message": message, "token": token}
+
+
+@route("/auth/logout")
+async def logout(request):
+    code, message = await User().logout(user_id=request.json.get("user_id"), token=request.headers.get("token"))
+    return code, {"message": message}
+
+
+@route("/auth/register")
+async def register(request):
+    code, message = await User().register(
+        user_id=request.json.get("user_id", ""), password=request.json.get("password", ""))
+    return code, {"message": message}
+
+
+@route("/auth/unregister")
+async def unregister(request):
+    code, message = await User().unregister(
+        user_id=request.json.get("user_id", ""), password=request.json.get("password", ""))
+    return code, {"message": message}
+
+
+@route("/auth/password")
+async def change_password(request):
+    code, message = await User().change_password(
+        user_id=request.json.get("user_id", ""), old_password=request.json.get("oldPassword", ""),
+        new_password=request.json.get("newPassword", ""))
+    return code, {"message": message}
+
+
+@route("/seller/create_store")
+async def seller_create_store(request):
+    code, message = await Seller().create_store(request.json.get("user_id"), request.json.get("store_id"))
+    return code, {"message": message}
+
+
+@route("/seller/add_book")
+async def seller_add_book(request):
+    book_info = request.json.get("book_info")
+    code, message = await Seller().add_book(
+        request.json.get("user_id"), request.json.get("store_id"), book_info.get("id"), json.dumps(book_info),
+        request.json.get("stock_level", 0))
+    return code, {"message": message}
+
+
+@route("/seller/add_stock_level")
+async def add_stock_level(request):
+    code, message = await Seller().add_stock_level(
+        request.json.get("user_id"), request.json.get("store_id"), request.json.get("book_id"),
+        request.json.get("add_stock_level", 0))
+    return code, {"message": message}
+
+
+@route("/seller/deliver")
+async def deliver(request):
+    code, message = await Seller().deliver(request.json.get("user_id"), request.json.get("order_id"))
+    return code, {"message": message}
+
+
+@route("/buyer/new_order")
+async def new_order(request):
+    id_and_count = [(book.get("id"), book.get("count")) for book in request.json.get("books")]
+    code, message, order_id = await Buyer().new_order(
+        request.json.get("user_id"), request.json.get("store_id"), id_and_count)
+    return code, {"message": message, "order_id": order_id}
+
+
+@route("/buyer/payment")
+async def payment(request):
+    code, message = await Buyer().payment(
+        request.json.get("user_id"), request.json.get("password"), request.json.get("order_id"))
+    return code, {"message": message}
+
+
+@route("/buyer/add_funds")
+async def add_funds(request):
+    code, message = await Buyer().add_funds(
+        request.json.get("user_id"), request.json.get("password"), request.json.get("add_value"))
+    return code, {"message": message}
+
+
+@route("/buyer/cancel_order")
+async def cancel_order(request):
+    code, message = await Buyer().cancel_order(request.json.get("user_id"), request.json.get("order_id"))
+    return code, {"message": message}
+
+
+@route("/buyer/auto_cancel_order")
+async def auto_cancel_order(request):
+    code, message = await Buyer().auto_cancel_order(request.json.get("order_id"))
+    return code, {"message": message}
+
+
+@route("/buyer/is_order_cancelled")
+async def is_order_cancelled(request):
+    code, message = await Buyer().is_order_cancelled(request.json.get("order_id"))
+    return code, {"message": message}
+
+
+@route("/buyer/check_hist_order")
+async def check_hist_order(request):
+    code, message, res, next_cursor = await Buyer().check_hist_order(
+        request.json.get("user_id"), request.json.get("status"), request.json.get("cursor"),
+        request.json.get("page_size", History_Page_Size))
+    return code, {"message": message, "history orders": res, "next_cursor": next_cursor}
+
+
+@route("/buyer/search")
+async def search_books(request):
+    code, message = await Buyer().search(
+        request.json.get("keyword"), request.json.get("store_id"), request.json.get("page", 1),
+        engine=request.json.get("engine"))
+    return code, {"message": message}
+
+
+@route("/buyer/receive")
+async def receive(request):
+    code, message = await Buyer().receive(request.json.get("user_id"), request.json.get("order_id"))
+    return code, {"message": message}
+
+
+def search_args(request, name: str):
+    return (request.args.get(name) or "", request.args.get("store_id") or "", request.args.get("page_num", 1),
+            request.args.get("page_size", 10))
+
+
+def search_page(result):
+    # search responses always carry status 200, the code is in the body
+    code, message, books, next_cursor = result
+    return 200, {"data": books, "message": message, "code": code, "next_cursor": next_cursor}
+
+
+@route("/search/title", "GET")
+@route("/search/title_in_store", "GET")
+async def search_title_in_store(request):
+    return search_page(await Book().search_title_in_store(
+        *search_args(request, "title"), request.args.get("fields"), request.args.get("cursor")))
+
+
+@route("/search/tag", "GET")
+@route("/search/tag_in_store", "GET")
+async def search_tag_in_store(request):
+    return search_page(await Book().search_tag_in_store(
+        *search_args(request, "tag"), request.args.get("mode", "prefix"), request.args.get("fields"),
+        request.args.get("cursor")))
+
+
+@route("/search/tags", "GET")
+async def tag_dictionary(request):
+    code, message, tags = await Book().tag_dictionary(request.args.get("prefix", ""),
+                                                      request.args.get("limit", 20))
+    return 200, {"data": tags, "message": message, "code": code}
+
+
+@route("/search/content", "GET")
+@route("/search/content_in_store", "GET")
+async def search_content_in_store(request):
+    return search_page(await Book().search_content_in_store(
+        *search_args(request, "content"), request.args.get("engine"), request.args.get("fields"),
+        request.args.get("cursor")))
+
+
+@route("/search/author", "GET")
+@route("/search/author_in_store", "GET")
+async def search_author_in_store(request):
+    return search_page(await Book().search_author_in_store(
+        *search_args(request, "author"), request.args.get("fields"), request.args.get("cursor")))
+
+
+def byte_range(request, etag: str, length: int):
+    # the Range handling of Flask's send_file: (start, stop) of a
+    # satisfiable single range, None to send the whole body (no Range, an
+    # If-Range for another version, an empty body) and False when the range
+    # cannot be satisfied
+    header = request.headers.get("range")
+    if header is None or length == 0:
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range != etag:
+        return None
+    parsed = parse_range_header(header)
+    span = parsed.range_for_length(length) if parsed is not None else None
+    return span if span is not None else False
+
+
+@route("/book/<book_id>/picture/<int:n>", "GET")
+async def get_picture(request):
+    code, message, blob = await Book().get_picture(request.params["book_id"], int(request.params["n"]))
+    if code != 200:
+        return code, {"message": message}
+    etag = '"{}"'.format(blob._id)
+    headers = [("etag", etag), ("cache-control", "no-cache")]
+    if etag in request.headers.get("if-none-match", ""):
+        return 304, b"", None, headers
+    data = await asyncio.to_thread(blob.read)
+    span = byte_range(request, etag, len(data))
+    if span is False:
+        return 416, b"", None, headers + [("content-range", "bytes */{}".format(len(data)))]
+    headers.append(("accept-ranges", "bytes"))
+    if span is not None:
+        start, stop = span
+        headers.append(("content-range", "bytes {}-{}/{}".format(start, stop - 1, len(data))))
+        return 206, data[start:stop], blob.metadata["content_type"], headers
+    return 200, data, blob.metadata["content_type"], headers
+
+
+def resolve(method: str, path: str):
+    # handler, path parameters and route path; no handler and the status
+    # when nothing matches
+    allowed = False
+    for route_method, pattern, handler, route_path in routes:
+        m = pattern.match(path)
+        if m is None:
+            continue
+        if route_method == method:
+            return handler, m.groupdict(), route_path
+        allowed = True
+    return None, 405 if allowed else 404, "unmatched"
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await store.init_database()
+                start_expiry_sweep()
+            except BaseException as e:
+                logging.exception("startup failed")
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.to_thread(stop_expiry_sweep)
+            await store.release_database()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    body = b""
+    more = True
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+
+    start = time.perf_counter()
+    handler, params, route_path = resolve(scope["method"], scope["path"])
+    try:
+        if handler is None:
+            response = params, {"message": "not found" if params == 404 else "method not allowed"}
+        else:
+            request = Request(scope, body)
+            request.params = params
+            response = await handler(request)
+    except BaseException as e:
+        logging.exception("{} {}".format(scope["method"], scope["path"]))
+        response = 500, {"message": str(e)}
+
+    if isinstance(response[1], bytes):
+        status, payload, content_type, headers = response
+    else:
+        status, payload, content_type, headers = response[0], dumps(response[1]), "application/json", []
+    headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+    if content_type is not None:
+        headers.append((b"content-type", content_type.encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": payload})
+    if conf.Metrics:
+        metrics.http_request_seconds.observe((route_path, scope["method"], str(status)), time.perf_counter() - start)
+
+
+def serve(host: str = conf.Host, port: int = conf.Port):
+    # runs the app with uvicorn until /shutdown or SIGTERM; requests in
+    # flight get up to Drain_Seconds to finish, like be/serve.py
+    global server
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, lifespan="on", log_level="error",
+                                           timeout_graceful_shutdown=conf.Drain_Seconds))
+    server.run()
@@ -0,0 +1,80 @@
+from be.aio import db_conn
+from be.aio.store import to_list
+from be.model import book
+from be.model import store
+from be.model.book import plan_page, store_page, finish_page, search_pipeline, tag_condition, tag_query, \
+    TAG_PROJECTION
+
+
+class Book(db_conn.DBConn):
+
+    def __init__(self):
+        db_conn.DBConn.__init__(self)
+
+    async def _search(self, condition: dict, store_id: str, skip: int, limit: int,
+                      projection: dict = None, after: str = None) -> [dict]:
+        if projection is None:
+            projection = {"_id": 0}
+        if after is not None:
+            condition = dict(condition, id={"$gt": after})
+        catalog = self.conn.for_profile(store.CATALOG_READ)
+        if store_id == "":
+            return await to_list(catalog.col_book.find(condition, projection).sort("id", 1).skip(skip).limit(limit))
+        return await to_list(catalog.col_book.aggregate(
+            search_pipeline(catalog, condition, store_id, skip, limit, projection)))
+
+    async def _page(self, query: tuple, condition: dict, store_id: str, page_num, page_size, fields,
+                    cursor: str) -> (int, str, [dict], str):
+        # the keyset searches of be.model.book.Book._page
+        plan = plan_page(query, store_id, page_num, page_size, fields, cursor, True)
+        if plan[0] != 200:
+            return plan
+        _, projection, skip, after, key, versions, cached, page_size = plan
+        if cached is None:
+            rows = await self._search(condition, store_id, skip, page_size + 1, projection, after)
+            cached = store_page(key, versions, rows, skip, page_size, True)
+        return finish_page(query, cached)
+
+    async def search_title_in_store(self, title: str, store_id: str, page_num: int, page_size: int,
+                                    fields=None, cursor: str = None):
+        return await self._page(("title", title), {"title": title}, store_id, page_num, page_size, fields, cursor)
+
+    async def search_title(self, title: str, page_num: int, page_size: int, fields=None, cursor: str = None):
+        return await self.search_title_in_store(title, "", page_num, page_size, fields, cursor)
+
+    async def search_tag_in_store(self, tag: str, store_id: str, page_num: int, page_size: int,
+                                  mode: str = "prefix", fields=None, cursor: str = None):
+        condition = tag_condition(tag, mode)
+        if condition is None:
+            return 501, f"{mode} tag search mode not exist", [], None
+        return await self._page(("tag", tag, mode), condition, store_id, page_num, page_size, fields, cursor)
+
+    async def search_tag(self, tag: str, page_num: int, page_size: int, mode: str = "prefix", fields=None,
+                         cursor: str = None):
+        return await self.search_tag_in_store(tag, "", page_num, page_size, mode, fields, cursor)
+
+    async def search_author_in_store(self, author: str, store_id: str, page_num: int, page_size: int,
+                                     fields=None, cursor: str = None):
+        return await self._page(("author", author), {"author": author}, store_id, page_num, page_size, fields,
+                                cursor)
+
+    async def search_author(self, author: str, page_num: int, page_size: int, fields=None, cursor: str = None):
+        return await self.search_author_in_store(author, "", page_num, page_size, fields, cursor)
+
+    async def tag_dictionary(self, prefix: str, limit):
+        failure, condition, limit = tag_query(prefix, limit)
+        if failure is not None:
+            return failure + ([],)
+        try:
+            result = await to_list(self.conn.for_profile(store.CATALOG_READ).col_tag
+                                   .find(condition, TAG_PROJECTION).sort("count", -1).limit(limit))
+        except BaseException as e:
+            return 528, "{}".format(str(e)), []
+        return 200, "ok", result
+
+    # Not ported, on the synchronous model in worker threads: content
+    # search (the in-process search engines are CPU work) and pictures
+    # (GridFS on the synchronous client)
+    search_content_in_store = db_conn.threaded(book.Book, "search_content_in_store")
+    search_content = db_conn.threaded(book.Book, "search_content")
+    get_picture = db_conn.threaded(book.Book, "get_picture")
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from datetime import datetime
+from pymongo import DeleteOne
+from pymongo.errors import BulkWriteError
+from be.aio import db_conn
+from be.aio.store import to_list
+from be import conf
+from be.model import buyer
+from be.model import error
+from be.model import store
+from be.model.buyer import expiry_queue
+from be.model.cursor import page_args
+from be.model.user import check_user_password
+
+
+class Buyer(db_conn.DBConn):
+    def __init__(self):
+        db_conn.DBConn.__init__(self)
+
+    async def new_order(self, user_id: str, store_id: str, id_and_count: [(str, int)]) -> (int, str, str):
+        order_id = ""
+        try:
+            orders = self.conn.for_profile(store.ORDER_WRITE)
+            book_ids = list({book_id for book_id, _ in id_and_count})
+            # the buyer and the store (with stock and prices) are independent reads
+            user_exist, result = await asyncio.gather(
+                self.user_id_exist(user_id),
+                to_list(orders.col_store.aggregate(buyer.order_pipeline(self.conn, store_id, book_ids))),
+            )
+            if not user_exist:
+                return error.error_non_exist_user_id(user_id) + (order_id,)
+            if not result:
+                return error.error_non_exist_store_id(store_id) + (order_id,)
+
+            uid = buyer.new_order_id(user_id, store_id)
+            failure, details, total_price = buyer.order_lines(uid, id_and_count, result[0])
+            if failure is not None:
+                return failure + (order_id,)
+
+            ok, book_id = await self._reserve_stock(store_id, id_and_count)
+            if not ok:
+                return error.error_stock_level_low(book_id) + (order_id,)
+
+            try:
+                if details:
+                    await orders.col_order_detail.insert_many(details)
+                now_time = datetime.utcnow()
+                await orders.col_order.insert_one(buyer.order_row(uid, store_id, user_id, total_price, now_time))
+                expiry_queue.push(uid, now_time)
+            except BaseException:
+                await self._release_stock(store_id, id_and_count)
+                await orders.col_order_detail.delete_many({"order_id": uid})
+                raise
+            order_id = uid
+        except BaseException as e:
+            logging.info("530, {}".format(str(e)))
+            return 530, "{}".format(str(e)), ""
+
+        return 200, "ok", order_id
+
+    async def _reserve_stock(self, store_id: str, id_and_count: [(str, int)]) -> (bool, str):
+        # be.model.buyer.Buyer._reserve_stock
+        col_inventory = self.conn.for_profile(store.ORDER_WRITE).col_inventory
+        try:
+            result = await col_inventory.bulk_write(buyer.reserve_requests(store_id, id_and_count), ordered=True)
+        except BulkWriteError as e:
+            i = buyer.reserved_count(e, len(id_and_count))
+            await self._release_stock(store_id, id_and_count[:i])
+            if buyer.guard_index(e) is None:
+                raise
+            return False, id_and_count[i][0]
+        if result.upserted_count:
+            await col_inventory.bulk_write([DeleteOne({"_id": _id}) for _id in result.upserted_ids.values()])
+            await self._release_stock(store_id, [line for i, line in enumerate(id_and_count)
+                                                 if i not in result.upserted_ids])
+            return False, id_and_count[min(result.upserted_ids)][0]
+        return True, ""
+
+    async def _release_stock(self, store_id: str, id_and_count: [(str, int)]):
+        if not id_and_count:
+            return
+        await self.conn.for_profile(store.ORDER_WRITE).col_inventory.bulk_write(
+            buyer.release_requests(store_id, id_and_count), ordered=False)
+
+    async def payment(self, user_id: str, password: str, order_id: str) -> (int, str):
+        try:
+            settlement = self.conn.for_profile(store.SETTLEMENT)
+            result = await to_list(settlement.col_order.aggregate(buyer.payment_pipeline(self.conn, order_id)))
+            if not result:
+                return error.error_invalid_order_id(order_id)
+            order = result[0]
+            failure = buyer.check_payment(order, user_id, password)
+            if failure is not None:
+                return failure
+
+            seller_id = await self.store_owner(order["store_id"])
+            if seller_id is None:
+                return error.error_non_exist_store_id(order["store_id"])
+
+            return await self._settle(order_id, order["buyer"][0]["_id"], seller_id, order["price"])
+        except BaseException as e:
+            return 530, "{}".format(str(e))
+
+    async def _settle(self, order_id: str, buyer_oid, seller_id: str, amount) -> (int, str):
+        # be.model.buyer.Buyer._settle
+        settlement = self.conn.for_profile(store.SETTLEMENT)
+        if await settlement.col_order.find_one_and_update(*buyer.claim_order(order_id), projection={"_id": 1}) is None:
+            return error.error_invalid_order_id(order_id)
+        try:
+            result = await settlement.col_user.bulk_write(
+                buyer.settle_requests(buyer_oid, seller_id, amount), ordered=True)
+        except BulkWriteError as e:
+            if e.details.get("nMatched"):
+                await settlement.col_user.update_one(*buyer.refund(buyer_oid, amount))
+            await settlement.col_order.update_one(*buyer.unclaim_order(order_id))
+            if buyer.guard_index(e) == 0:
+                return error.error_not_sufficient_funds(order_id)
+            raise
+        undo = buyer.settle_undo(result, buyer_oid, seller_id, amount)
+        if undo:
+            await settlement.col_user.bulk_write(undo, ordered=False)
+            await settlement.col_order.update_one(*buyer.unclaim_order(order_id))
+            if result.upserted_count:
+                return error.error_not_sufficient_funds(order_id)
+            return error.error_non_exist_user_id(seller_id)
+        return 200, "ok"
+
+    async def add_funds(self, user_id, password, add_value) -> (int, str):
+        try:
+            result = await self.conn.col_user.find_one({"user_id": user_id}, {"_id": 0, "password": 1})
+            failure = check_user_password(result, password)
+            if failure is not None:
+                return failure
+
+            result = await self.conn.for_profile(store.SETTLEMENT).col_user.update_one(
+                *buyer.funds_update(user_id, add_value))
+            if result.matched_count == 0:
+                return error.error_non_exist_user_id(user_id)
+        except BaseException as e:
+            return 528, "{}".format(str(e))
+
+        return 200, ""
+
+    async def check_hist_order(self, user_id: str, status: str = None, cursor: str = None,
+                               page_size: int = buyer.History_Page_Size):
+        try:
+            try:
+                _, page_size = page_args(1, page_size, conf.Max_Page_Size)
+            except ValueError:
+                return error.error_invalid_page(1, page_size) + (None, None)
+            failure, condition = buyer.history_condition(user_id, status, cursor)
+            if failure is not None:
+                return failure + (None, None)
+            # the user check and the page are independent reads
+            user_exist, result = await asyncio.gather(
+                self.user_id_exist(user_id),
+                to_list(self.conn.for_profile(store.HISTORY_READ).col_order.aggregate(
+                    buyer.history_pipeline(self.conn, condition, page_size))),
+            )
+            if not user_exist:
+                return error.error_non_exist_user_id(user_id) + (None, None)
+            ans, next_cursor = buyer.history_page(result, page_size)
+        except BaseException as e:
+            return 528, "{}".format(str(e)), None, None
+        if not ans:
+            return 200, "ok", "No orders found ", None
+        return 200, "ok", ans, next_cursor
+
+    async def is_order_cancelled(self, order_id: str) -> (int, str):
+        if not await self.exists(self.conn.col_order, {"order_id": order_id, "status": 4}):
+            return error.error_auto_cancel_fail(order_id)
+        return 200, "ok"
+
+    async def receive(self, user_id: str, order_id: str) -> (int, str):
+        try:
+            result = await self.conn.col_order.find_one(buyer.paid_order(order_id),
+                                                        {"_id": 0, "user_id": 1, "status": 1})
+            failure = buyer.check_receive(result, order_id, user_id)
+            if failure is not None:
+                return failure
+            await self.conn.col_order.update_one({"order_id": order_id}, {"$set": {"status": 3}})
+        except BaseException as e:
+            return 530, "{}".format(str(e))
+        return 200, "ok"
+
+    # Not ported, on the synchronous model in worker threads: cancel_order
+    # (a multi-step restock and refund), auto_cancel_order (the expiry
+    # queue sweeps through the synchronous client it shares with the
+    # scheduler) and search (the in-process search engines are CPU work).
+    cancel_order = db_conn.threaded(buyer.Buyer, "cancel_order")
+    auto_cancel_order = db_conn.threaded(buyer.Buyer, "auto_cancel_order")
+    search = db_conn.threaded(buyer.Buyer, "search")
@@ -0,0 +1,47 @@
+import asyncio
+from be.aio import store
+from be.model.bloom import user_filter, store_filter, book_filter, book_key
+from be.model.cache import store_owner_cache
+from be.model.store import key_projection
+
+
+def threaded(model, name: str):
+    # an async method running the synchronous model's method in a worker
+    # thread, for the routes not ported to the asyncio driver
+    async def method(self, *args, **kwargs):
+        return await asyncio.to_thread(lambda: getattr(model(), name)(*args, **kwargs))
+    method.__name__ = name
+    return method
+
+
+class DBConn:
+    def __init__(self):
+        self.conn = store.get_db_conn()
+
+    async def exists(self, col, condition: dict) -> bool:
+        return await col.find_one(condition, key_projection(condition)) is not None
+
+    async def user_id_exist(self, user_id):
+        if not user_filter.might_contain(user_id):
+            return False
+        return await self.exists(self.conn.col_user, {"user_id": user_id})
+
+    async def book_id_exist(self, store_id, book_id):
+        if not book_filter.might_contain(book_key(store_id, book_id)):
+            return False
+        return await self.exists(self.conn.col_inventory, {"store_id": store_id, "book_id": book_id})
+
+    async def store_id_exist(self, store_id):
+        if not store_filter.might_contain(store_id):
+            return False
+        return await self.exists(self.conn.col_store, {"store_id": store_id})
+
+    async def store_owner(self, store_id):
+        seller_id = store_owner_cache.get(store_id)
+        if seller_id is None:
+            result = await self.conn.col_store.find_one({"store_id": store_id}, {"_id": 0, "user_id": 1})
+            if result is None:
+                return None
+            seller_id = result.get("user_id")
+            store_owner_cache.put(store_id, seller_id)
+        return seller_id
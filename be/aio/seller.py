@@ -0,0 +1,94 @@
+import asyncio
+import json
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from be.aio import db_conn
+from be.model import buyer
+from be.model import seller
+from be.model import store
+from be.model.bloom import store_filter, book_filter, book_key
+from be.model.cache import version_stamps, store_version
+
+
+class Seller(db_conn.DBConn):
+    def __init__(self):
+        db_conn.DBConn.__init__(self)
+
+    async def add_book(self, user_id: str, store_id: str, book_id: str, book_json_str: str, stock_level: int):
+        try:
+            user_exist, store_exist, book_exist = await asyncio.gather(
+                self.user_id_exist(user_id),
+                self.store_id_exist(store_id),
+                self.book_id_exist(store_id, book_id),
+            )
+            failure = seller.check_listing(user_id, store_id, book_id, user_exist, store_exist, book_exist, False)
+            if failure is not None:
+                return failure
+
+            # GridFS stays on the synchronous client
+            book = json.loads(book_json_str)
+            book["pictures"] = await asyncio.to_thread(
+                store.store_pictures, store.get_db_conn().pictures, book.get("pictures"))
+
+            book_filter.add(book_key(store_id, book_id))
+            await self.conn.col_inventory.insert_one(seller.inventory_row(store_id, book_id, stock_level, book))
+            if await self._insert_book(book_id, book):
+                changes = seller.catalog_added(book)
+                if changes:
+                    await self.conn.col_tag.bulk_write(changes, ordered=False)
+            version_stamps.bump(store_version(store_id))
+        except BaseException as e:
+            return 530, "{}".format(str(e))
+        return 200, "ok"
+
+    async def _insert_book(self, book_id: str, book: dict) -> bool:
+        try:
+            return await self.conn.col_book.find_one_and_update(
+                *seller.catalog_upsert(book_id, book), projection={"_id": 1},
+                upsert=True, return_document=ReturnDocument.BEFORE) is None
+        except DuplicateKeyError:
+            return False
+
+    async def add_stock_level(self, user_id: str, store_id: str, book_id: str, add_stock_level: int):
+        try:
+            user_exist, store_exist, book_exist = await asyncio.gather(
+                self.user_id_exist(user_id),
+                self.store_id_exist(store_id),
+                self.book_id_exist(store_id, book_id),
+            )
+            failure = seller.check_listing(user_id, store_id, book_id, user_exist, store_exist, book_exist, True)
+            if failure is not None:
+                return failure
+
+            await self.conn.col_inventory.update_one(*seller.stock_update(store_id, book_id, add_stock_level))
+            version_stamps.bump(store_version(store_id))
+        except BaseException as e:
+            return 530, "{}".format(str(e))
+        return 200, "ok"
+
+    async def create_store(self, user_id: str, store_id: str) -> (int, str):
+        try:
+            user_exist, store_exist = await asyncio.gather(
+                self.user_id_exist(user_id),
+                self.store_id_exist(store_id),
+            )
+            failure = seller.check_new_store(user_id, store_id, user_exist, store_exist)
+            if failure is not None:
+                return failure
+            store_filter.add(store_id)
+            await self.conn.col_store.insert_one({"store_id": store_id, "user_id": user_id})
+        except BaseException as e:
+            return 530, "{}".format(str(e))
+        return 200, "ok"
+
+    async def deliver(self, user_id: str, order_id: str) -> (int, str):
+        try:
+            query = buyer.paid_order(order_id)
+            result = await self.conn.col_order.find_one(query, store.key_projection(query))
+            failure = seller.check_deliver(result, order_id)
+            if failure is not None:
+                return failure
+            await self.conn.col_order.update_one({"order_id": order_id}, {"$set": {"status": 2}})
+        except BaseException as e:
+            return 530, "{}".format(str(e))
+        return 200, "ok"
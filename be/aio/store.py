@@ -0,0 +1,73 @@
+import asyncio
+from pymongo import AsyncMongoClient
+from be import conf
+from be.model import metrics
+from be.model import store
+from be.model.pool import PoolMetrics
+
+
+class AsyncStore:
+    # the collections of be.model.store.Store on the asyncio driver; the
+    # schema is reset and migrated by the synchronous Store at startup
+
+    def __init__(self, db_url, db_name: str = conf.DB_Name):
+        self.db_url = db_url
+        self.db_name = db_name
+        self.pool_metrics = PoolMetrics()
+        self.myclient = AsyncMongoClient(db_url, event_listeners=[self.pool_metrics] + metrics.listeners() + store.shape_listeners(),
+                                         **store.client_options())
+        self.database = self.myclient[db_name]
+        self.col_user = self.database["user"]
+        self.col_store = self.database["store"]
+        self.col_inventory = self.database["inventory"]
+        self.col_book = self.database["books"]
+        self.col_tag = self.database["tag"]
+        self.col_order_detail = self.database["order_detail"]
+        self.col_order = self.database["order"]
+        self.profiles = {name: store.Profile(self.database, name) for name in store.PROFILES}
+
+    def for_profile(self, name: str) -> store.Profile:
+        return self.profiles[name]
+
+    def get_db_conn(self):
+        return self
+
+
+database_instance: AsyncStore = None
+
+
+async def init_database():
+    # the synchronous Store does the reset and migrations once; the routes
+    # not ported to asyncio keep using it from worker threads
+    global database_instance
+    sync = await asyncio.to_thread(store.get_db_conn)
+    database_instance = AsyncStore(sync.db_url, sync.db_name)
+
+
+async def release_database():
+    global database_instance
+    if database_instance is not None:
+        await database_instance.myclient.close()
+        database_instance = None
+
+
+def get_db_conn() -> AsyncStore:
+    if database_instance is None:
+        raise RuntimeError("be.aio.store.init_database was not awaited")
+    return database_instance.get_db_conn()
+
+
+def pool_stats() -> dict:
+    if database_instance is None:
+        return {}
+    return database_instance.pool_metrics.stats()
+
+
+metrics.track_pool("async", pool_stats)
+
+
+async def to_list(cursor) -> [dict]:
+    # find() returns the cursor, aggregate() a coroutine resolving to one
+    if asyncio.iscoroutine(cursor):
+        cursor = await cursor
+    return await cursor.to_list(None)
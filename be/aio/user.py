@@ -0,0 +1,95 @@
+from be.aio import db_conn
+from be.model import error
+from be.model import user
+from be.model.bloom import user_filter
+from be.model.cache import token_cache, user_version
+from be.model.user import (user_row, token_fields, check_user_password, check_user_token,
+                           invalidate_tokens)
+
+
+class User(db_conn.DBConn):
+    token_lifetime: int = user.User.token_lifetime
+
+    def __init__(self):
+        db_conn.DBConn.__init__(self)
+
+    async def register(self, user_id: str, password: str):
+        try:
+            user_filter.add(user_id)
+            await self.conn.col_user.insert_one(user_row(user_id, password))
+        except Exception:
+            return error.error_exist_user_id(user_id)
+        return 200, "ok"
+
+    async def check_token(self, user_id: str, token: str) -> (int, str):
+        cached, versions = token_cache.lookup((user_id, token), [user_version(user_id)])
+        if cached is not None:
+            return 200, "ok"
+        result = await self.conn.col_user.find_one({"user_id": user_id}, {"_id": 0, "token": 1})
+        return check_user_token(user_id, token, result, self.token_lifetime, versions)
+
+    async def check_password(self, user_id: str, password: str) -> (int, str):
+        result = await self.conn.col_user.find_one({"user_id": user_id}, {"_id": 0, "password": 1})
+        failure = check_user_password(result, password)
+        if failure is not None:
+            return failure
+        return 200, "ok"
+
+    async def login(self, user_id: str, password: str, terminal: str) -> (int, str, str):
+        token = ""
+        try:
+            code, message = await self.check_password(user_id, password)
+            if code != 200:
+                return code, message, ""
+
+            fields = token_fields(user_id, terminal)
+            token = fields["token"]
+            result = await self.conn.col_user.update_one({"user_id": user_id}, {"$set": fields})
+            if not result.acknowledged:
+                return error.error_authorization_fail() + ("",)
+            invalidate_tokens(user_id)
+        except BaseException as e:
+            return 528, "{}".format(str(e)), ""
+        return 200, "ok", token
+
+    async def logout(self, user_id: str, token: str) -> (int, str):
+        try:
+            code, message = await self.check_token(user_id, token)
+            if code != 200:
+                return code, message
+            result = await self.conn.col_user.update_one({"user_id": user_id}, {"$set": token_fields(user_id)})
+            if not result.acknowledged:
+                return error.error_authorization_fail()
+            invalidate_tokens(user_id)
+        except BaseException as e:
+            return 528, "{}".format(str(e))
+        return 200, "ok"
+
+    async def unregister(self, user_id: str, password: str) -> (int, str):
+        try:
+            code, message = await self.check_password(user_id, password)
+            if code != 200:
+                return code, message
+            result = await self.conn.col_user.delete_one({"user_id": user_id, "password": password})
+            if result.deleted_count == 1:
+                invalidate_tokens(user_id)
+                return 200, "ok"
+            else:
+                return error.error_authorization_fail()
+        except BaseException as e:
+            return 530, "{}".format(str(e))
+
+    async def change_password(self, user_id: str, old_password: str, new_password: str) -> (int, str):
+        try:
+            code, message = await self.check_password(user_id, old_password)
+            if code != 200:
+                return code, message
+            result = await self.conn.col_user.update_one(
+                {"user_id": user_id, "password": old_password},
+                {"$set": dict(token_fields(user_id), password=new_password)})
+            if result.matched_count == 0:
+                return error.error_authorization_fail()
+            invalidate_tokens(user_id)
+        except BaseException as e:
+            return 528, "{}".format(str(e))
+        return 200, "ok"
@@ -1,4 +1,7 @@
+import sys
+from be import conf
 from be import serve
 
+# usage: python -m be.app [workers]
 if __name__ == "__main__":
-    serve.be_run()
+    serve.be_run(int(sys.argv[1]) if len(sys.argv) > 1 else conf.Workers)
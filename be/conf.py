@@ -0,0 +1,58 @@
+import os
+
+DB_URL = os.environ.get("BOOKSTORE_DB_URL", "mongodb://localhost:27017/")
+DB_Name = os.environ.get("BOOKSTORE_DB_NAME", "bookstore_db")
+# 启动时清空所有集合；默认保留数据，只补建缺失的索引
+Reset_On_Start = os.environ.get("BOOKSTORE_RESET", "0") == "1"
+# 未付款订单超时自动取消
+Order_Timeout_Seconds = 20
+Expiry_Sweep_Seconds = 1
+# 全文搜索引擎：mongo 使用 $text 索引，inverted 使用进程内的中文倒排索引
+Search_Engine = os.environ.get("BOOKSTORE_SEARCH_ENGINE", "mongo")
+# 搜索结果缓存：条目数上限与存活秒数，目录或店铺变更时立即失效
+Search_Cache_Size = int(os.environ.get("BOOKSTORE_SEARCH_CACHE_SIZE", "10000"))
+Search_Cache_TTL = 60
+# 搜索与历史订单每页条数的上限，更大的 page_size 按上限返回
+Max_Page_Size = 100
+# 已验证令牌缓存的条目数上限；条目在令牌过期或用户登录、登出、改密码时失效
+Token_Cache_Size = 100000
+# 店铺与用户版本戳各自的共享内存槽数(每槽 8 字节)；不同店铺或用户落在同一槽只会多失效一次缓存
+Version_Slots = 65536
+# 每个请求的身份映射：同一请求内用户与店铺文档只读取一次
+Identity_Map = os.environ.get("BOOKSTORE_IDENTITY_MAP", "1") == "1"
+# 用户、店铺与店内书籍 id 的布隆过滤器：确定不存在的 id 不再查询数据库；每个过滤器的容量与目标误判率。
+# 过滤器只看得到本进程树(python -m be.app 及其工作进程)写入的 id，只有它是这些集合唯一的写入方时才能开启：
+# 另一个 be.app 实例、be.aio 或脚本注册的用户、创建的店铺和上架的书会被判为不存在
+Bloom_Filter = os.environ.get("BOOKSTORE_BLOOM_FILTER", "0") == "1"
+Bloom_Capacity = int(os.environ.get("BOOKSTORE_BLOOM_CAPACITY", "1000000"))
+Bloom_Error_Rate = 0.01
+# MongoDB 连接池：每个进程一个客户端，按工作线程数设置连接池大小
+Mongo_Max_Pool_Size = int(os.environ.get("BOOKSTORE_MONGO_MAX_POOL_SIZE", "100"))
+Mongo_Min_Pool_Size = int(os.environ.get("BOOKSTORE_MONGO_MIN_POOL_SIZE", "0"))
+# 等待空闲连接、选择服务器、建立连接、读写的超时(毫秒)，0 表示不限
+Mongo_Wait_Queue_Timeout_MS = int(os.environ.get("BOOKSTORE_MONGO_WAIT_QUEUE_TIMEOUT_MS", "0"))
+Mongo_Server_Selection_Timeout_MS = int(os.environ.get("BOOKSTORE_MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+Mongo_Connect_Timeout_MS = int(os.environ.get("BOOKSTORE_MONGO_CONNECT_TIMEOUT_MS", "20000"))
+Mongo_Socket_Timeout_MS = int(os.environ.get("BOOKSTORE_MONGO_SOCKET_TIMEOUT_MS", "0"))
+# 传输压缩，逗号分隔，如 "zstd,snappy,zlib"；为空则不压缩
+Mongo_Compressors = os.environ.get("BOOKSTORE_MONGO_COMPRESSORS", "")
+# 按操作类别的读写关注(be/model/store.py 的 PROFILES)：下单与库存预留、结算(付款、加款、取消退款)写入多数节点后才返回；
+# 目录搜索与历史订单的读偏好，取值为 primary、primaryPreferred、secondary、secondaryPreferred 或 nearest，其他取值启动时报错；
+# 默认读主节点：从节点可能落后，读到的结果看不到刚完成的写入，目录读不走主节点时搜索结果不进入缓存；
+# 从节点允许落后的最长秒数，-1 表示不限(否则不小于 90)；Concern_Profiles 关闭后全部使用客户端默认值
+Concern_Profiles = os.environ.get("BOOKSTORE_CONCERN_PROFILES", "1") == "1"
+Catalog_Read_Preference = os.environ.get("BOOKSTORE_CATALOG_READ_PREFERENCE", "primary")
+History_Read_Preference = os.environ.get("BOOKSTORE_HISTORY_READ_PREFERENCE", "primary")
+Max_Staleness_Seconds = int(os.environ.get("BOOKSTORE_MAX_STALENESS_SECONDS", "-1"))
+# /metrics 指标：请求、MongoDB 命令与超时订单扫描的耗时直方图；多进程模式下每个工作进程按该间隔(秒)
+# 把自己的数据写入父进程创建的临时目录，任一工作进程的 /metrics 返回所有工作进程之和
+Metrics = os.environ.get("BOOKSTORE_METRICS", "1") == "1"
+Metrics_Flush_Seconds = 1
+# 记录每条查询的形状(集合、过滤条件、排序与投影)，供 fe/test/test_index.py 用 explain 检查索引；测试时由 fe/conftest.py 开启
+Record_Query_Shapes = os.environ.get("BOOKSTORE_RECORD_QUERY_SHAPES", "0") == "1"
+# 后端监听地址与工作进程数；工作进程数大于 1 时预先 fork，每个进程有自己的线程与 MongoDB 连接池
+Host = os.environ.get("BOOKSTORE_HOST", "127.0.0.1")
+Port = int(os.environ.get("BOOKSTORE_PORT", "5000"))
+Workers = int(os.environ.get("BOOKSTORE_WORKERS", "1"))
+# 关闭时等待处理中请求完成的最长秒数
+Drain_Seconds = 30
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# Run the pending schema migrations (see MIGRATIONS in be/model/store.py)
+# without starting the server. Startup runs them too when the stored schema
+# version is older.
+#
+# usage: python -m be.migrate [mongodb_url]
+import sys
+import logging
+from be import conf
+from be.model.store import Store, SCHEMA_VERSION
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    db_url = sys.argv[1] if len(sys.argv) > 1 else conf.DB_URL
+    store = Store(db_url, conf.DB_Name, reset=False)
+    print("schema version {} in {:.2f}s".format(SCHEMA_VERSION, store.init_seconds))
@@ -0,0 +1,55 @@
+import hashlib
+import gridfs
+from gridfs.errors import FileExists, NoFile
+
+
+def sniff_content_type(data: bytes) -> str:
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"GIF87a") or data.startswith(b"GIF89a"):
+        return "image/gif"
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class BlobStore:
+    # Content-addressed blobs in GridFS: the file _id is the sha256 of the
+    # bytes, so the same picture is stored once however many books use it.
+
+    def __init__(self, database, bucket: str):
+        self.bucket = bucket
+        self.database = database
+        self.fs = gridfs.GridFS(database, collection=bucket)
+
+    @staticmethod
+    def key(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, data: bytes) -> str:
+        key = self.key(data)
+        if not self.fs.exists(key):
+            try:
+                self.fs.put(data, _id=key, metadata={"content_type": sniff_content_type(data)})
+            except FileExists:
+                # written concurrently by another request
+                pass
+        return key
+
+    def get(self, key: str):
+        # a GridOut with read(), length and metadata["content_type"], or None
+        try:
+            return self.fs.get(key)
+        except NoFile:
+            return None
+
+    def drop(self):
+        self.database[self.bucket + ".files"].drop()
+        self.database[self.bucket + ".chunks"].drop()
+
+    def stats(self) -> dict:
+        files = self.database[self.bucket + ".files"]
+        total = list(files.aggregate([{"$group": {"_id": None, "n": {"$sum": 1}, "bytes": {"$sum": "$length"}}}]))
+        return {"blobs": total[0]["n"] if total else 0, "bytes": total[0]["bytes"] if total else 0}
@@ -0,0 +1,134 @@
+import ctypes
+import hashlib
+import logging
+import math
+import multiprocessing
+import pymongo.errors as mongo_error
+from be import conf
+
+
+class BloomFilter:
+    # Id membership with false positives but no false negatives: "absent"
+    # is definite, "maybe" means ask Mongo. The bits live in shared memory,
+    # like cache.VersionStamps, so an id added by one worker process is seen
+    # by the others forked from the same parent. Ids are added before they
+    # are inserted, so a concurrent check never misses a committed id; an
+    # insert that then fails only leaves a false positive behind.
+    # Ids written by any other process (a second be.app, be.aio, a script)
+    # are never seen, so the filter is only correct while this process
+    # tree is the single writer of the collections (see conf.Bloom_Filter).
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        self._array = multiprocessing.Array("B", (self.bits + 7) // 8)
+        self._bytes = self._array.get_obj()
+        # [generation, ids added]; the generation is 0 until the first build
+        # and odd while a rebuild is running, when nothing can be ruled out
+        self._state = multiprocessing.Array("q", 2, lock=False)
+        self.checks = 0
+        self.negatives = 0
+
+    def _positions(self, key: str) -> [int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key: str):
+        if not isinstance(key, str):
+            return
+        positions = self._positions(key)
+        with self._array.get_lock():
+            for p in positions:
+                self._bytes[p >> 3] |= 1 << (p & 7)
+            self._state[1] += 1
+
+    def might_contain(self, key: str) -> bool:
+        generation = self._state[0]
+        if not conf.Bloom_Filter or generation == 0 or generation & 1 or not isinstance(key, str):
+            return True
+        self.checks += 1
+        for p in self._positions(key):
+            if not self._bytes[p >> 3] & (1 << (p & 7)):
+                # a rebuild that started meanwhile may have cleared the bit
+                if self._state[0] != generation:
+                    return True
+                self.negatives += 1
+                return False
+        return True
+
+    def rebuild(self, keys, clear: bool = False):
+        # The keys are hashed into a private array that is then OR-ed into
+        # the shared one, so ids other workers add meanwhile are kept. clear
+        # drops every bit first, which is only safe when nothing can be in
+        # flight: for a database that was just dropped, before workers fork.
+        if clear:
+            with self._array.get_lock():
+                self._state[0] = self._state[0] // 2 * 2 + 1
+                ctypes.memset(self._bytes, 0, len(self._bytes))
+                self._state[1] = 0
+        bits = bytearray(len(self._bytes))
+        count = 0
+        for key in keys:
+            if isinstance(key, str):
+                for p in self._positions(key):
+                    bits[p >> 3] |= 1 << (p & 7)
+                count += 1
+        # a failed rebuild leaves the filter unusable rather than incomplete
+        with self._array.get_lock():
+            merged = int.from_bytes(bytes(self._bytes), "little") | int.from_bytes(bits, "little")
+            ctypes.memmove(self._bytes, merged.to_bytes(len(bits), "little"), len(bits))
+            self._state[1] += count
+            self._state[0] = self._state[0] // 2 * 2 + 2
+
+    def stats(self) -> dict:
+        ones = int.from_bytes(bytes(self._bytes), "little").bit_count()
+        fill = ones / self.bits
+        return {
+            "ready": self._state[0] > 0 and not self._state[0] & 1,
+            "capacity": self.capacity,
+            "added": self._state[1],
+            "memory_bytes": len(self._bytes),
+            "hashes": self.hashes,
+            "fill_ratio": fill,
+            # chance that an absent id is reported as maybe present
+            "false_positive_rate": fill ** self.hashes,
+            "checks": self.checks,
+            "negatives": self.negatives,
+        }
+
+
+user_filter = BloomFilter(conf.Bloom_Capacity, conf.Bloom_Error_Rate)
+store_filter = BloomFilter(conf.Bloom_Capacity, conf.Bloom_Error_Rate)
+# (store_id, book_id) pairs of the inventory
+book_filter = BloomFilter(conf.Bloom_Capacity, conf.Bloom_Error_Rate)
+
+
+def book_key(store_id: str, book_id: str) -> str:
+    if not isinstance(store_id, str) or not isinstance(book_id, str):
+        return None
+    return store_id + "\x00" + book_id
+
+
+def rebuild_filters(conn, clear: bool = False):
+    # from the id indexes, at startup (before workers fork) and whenever
+    # the collections were written behind the models' back; clear only
+    # right after the database was reset
+    if not conf.Bloom_Filter:
+        return
+    try:
+        user_filter.rebuild((d["user_id"] for d in conn.col_user.find(
+            {}, {"_id": 0, "user_id": 1}).hint([("user_id", 1)])), clear)
+        store_filter.rebuild((d["store_id"] for d in conn.col_store.find(
+            {}, {"_id": 0, "store_id": 1}).hint([("store_id", 1)])), clear)
+        book_filter.rebuild((book_key(d["store_id"], d["book_id"]) for d in conn.col_inventory.find(
+            {}, {"_id": 0, "store_id": 1, "book_id": 1}).hint([("store_id", 1), ("book_id", 1)])), clear)
+    except mongo_error.PyMongoError as e:
+        logging.error("id filters not built: {}".format(e))
+
+
+def filter_stats() -> dict:
+    return {"user": user_filter.stats(), "store": store_filter.stats(), "book": book_filter.stats()}
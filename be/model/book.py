@@ -1,4 +1,139 @@
+import re
+from be import conf
 from be.model import db_conn
+from be.model import error
+from be.model import search_engine
+from be.model import store
+from be.model.cache import search_cache, CATALOG_VERSION, store_version
+from be.model.cursor import encode_cursor, decode_cursor, page_args
+
+
+# fields a search may return; the default is a lightweight summary
+BOOK_FIELDS = {
+    "id", "title", "author", "publisher", "original_title", "translator", "pub_year", "pages",
+    "price", "currency_unit", "binding", "isbn", "author_intro", "book_intro", "content", "tags",
+    "pictures",
+}
+DEFAULT_FIELDS = ["id", "title", "author", "price", "tags"]
+
+
+def book_projection(fields) -> (dict, str):
+    # fields is a comma separated string or a list; returns the Mongo
+    # projection, or None and the first unknown field name
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip() != ""]
+    if not fields:
+        fields = DEFAULT_FIELDS
+    projection = {"_id": 0, "id": 1}
+    for field in fields:
+        if field not in BOOK_FIELDS:
+            return None, field
+        projection[field] = 1
+    return projection, ""
+
+
+def plan_page(query: tuple, store_id: str, page_num, page_size, fields, cursor: str, keyset: bool):
+    # One page of a search, served from the search cache while the
+    # catalog, or the store it is filtered by, is unchanged. query names
+    # the endpoint and its arguments. A cursor from the previous page
+    # replaces page_num: for keyset searches it holds the last book id,
+    # for ranked ones the offset. Returns an error tuple, or 200 with what
+    # the query needs, the cached (rows, next_cursor) if there is one and
+    # the page size, clamped to conf.Max_Page_Size.
+    projection, unknown = book_projection(fields)
+    if projection is None:
+        return 501, f"{unknown} book field not exist", [], None
+    try:
+        page_num, page_size = page_args(page_num, page_size, conf.Max_Page_Size)
+    except ValueError:
+        return error.error_invalid_page(page_num, page_size) + ([], None)
+    try:
+        position = decode_cursor(cursor) if cursor else {}
+    except ValueError:
+        return error.error_invalid_cursor(cursor) + ([], None)
+    after = position.get("id") if keyset else None
+    skip = position.get("offset", (page_num - 1) * page_size) if after is None else 0
+    if (after is not None and not isinstance(after, str)) or not isinstance(skip, int) or skip < 0:
+        return error.error_invalid_cursor(cursor) + ([], None)
+
+    key = query + (store_id, skip, after, page_size, tuple(projection))
+    # catalog entries never change once inserted, so a store's results only
+    # move with its own listings and a whole-catalog search with new entries
+    version_keys = [store_version(store_id)] if store_id != "" else [CATALOG_VERSION]
+    cached, versions = search_cache.lookup(key, version_keys)
+    return 200, projection, skip, after, key, versions, cached, page_size
+
+
+def store_page(key, versions, rows: [dict], skip: int, page_size: int, keyset: bool):
+    # rows holds one more than a page when there is a next one
+    result_list = rows[:page_size]
+    next_cursor = None
+    if len(rows) > page_size:
+        if keyset:
+            next_cursor = encode_cursor({"id": result_list[-1]["id"]})
+        else:
+            next_cursor = encode_cursor({"offset": skip + page_size})
+    cached = (result_list, next_cursor)
+    # rows from a secondary may predate the version they would be cached under
+    if store.reads_primary(store.CATALOG_READ):
+        search_cache.store(key, versions, cached)
+    return cached
+
+
+def finish_page(query: tuple, cached) -> (int, str, [dict], str):
+    result_list, next_cursor = cached
+    if len(result_list) == 0:
+        return 501, f"{query[1]} book not exist", [], None
+    return 200, "ok", result_list, next_cursor
+
+
+def tag_condition(tag: str, mode: str) -> dict:
+    # None for an unknown mode. An exact tag is one range of the (tags, id)
+    # index, already in id order, so a keyset page is a bounded seek. A
+    # prefix spans many tags: the index bounds which entries are read, but
+    # every match of the prefix after the cursor is sorted by id before the
+    # page is cut, so prefix pages cost grows with the number of matches
+    if mode == "exact":
+        return {"tags": tag}
+    if mode == "prefix":
+        return {"tags": {"$regex": "^" + re.escape(tag)}}
+    return None
+
+
+TAG_PROJECTION = {"_id": 0, "tag": 1, "count": 1}
+
+
+def tag_query(prefix: str, limit):
+    # the tag dictionary filter and limit; limit is a page size, clamped to
+    # conf.Max_Page_Size. An error tuple when the limit is invalid
+    try:
+        _, limit = page_args(1, limit, conf.Max_Page_Size)
+    except ValueError:
+        return error.error_invalid_page(1, limit), None, None
+    condition = {}
+    if prefix != "":
+        condition["tag"] = {"$regex": "^" + re.escape(prefix)}
+    return None, condition, limit
+
+
+def search_pipeline(conn, condition: dict, store_id: str, skip: int, limit: int, projection: dict) -> [dict]:
+    # store membership is joined in the same query through the
+    # (store_id, book_id) inventory index, so every page comes back full
+    return [
+        {"$match": condition},
+        {"$sort": {"id": 1}},
+        {"$lookup": {
+            "from": conn.col_inventory.name,
+            "localField": "id",
+            "foreignField": "book_id",
+            "pipeline": [{"$match": {"store_id": store_id}}, {"$project": {"_id": 1}}],
+            "as": "in_store",
+        }},
+        {"$match": {"in_store": {"$ne": []}}},
+        {"$skip": skip},
+        {"$limit": limit},
+        {"$project": projection},
+    ]
 
 
 class Book(db_conn.DBConn):
@@ -6,94 +141,99 @@ class Book(db_conn.DBConn):
     def __init__(self):
         db_conn.DBConn.__init__(self)
 
-    def search_title_in_store(self, title: str, store_id: str, page_num: int, page_size: int):
-        book = self.conn.col_book
-        condition = {
-            "title": title
-        }
-        result = book.find(condition,{"_id": 0}).skip((page_num - 1) * page_size).limit(page_size)
-        result_list = list(result)
-        if store_id != "":
-            store = self.conn.col_store
-            books_in_store = []
-            for b in result_list:
-                condition1 = {"store_id": store_id, "books.book_id": b.get('id')}
-                book_id = list(store.find(condition1, {"books.book_id": 1}))
-                if len(book_id) != 0:
-                    books_in_store.append(b)
-            result_list = books_in_store
-        if len(result_list) == 0:
-            return 501, f"{title} book not exist", []
-        return 200, "ok", result_list
-
-    def search_title(self, title: str, page_num: int, page_size: int):
-        return self.search_title_in_store(title, "", page_num, page_size)
-
-    def search_tag_in_store(self, tag: str, store_id: str, page_num: int, page_size: int):
-        book = self.conn.col_book
-        condition = {
-            "tags": {"$regex": tag}
-        }
-        result = book.find(condition, {"_id": 0}).skip((page_num - 1) * page_size).limit(page_size)
-        result_list = list(result)
-        if store_id != "":
-            store = self.conn.col_store
-            books_in_store = []
-            for b in result_list:
-                condition1 = {"store_id": store_id, "books.book_id": b.get('id')}
-                book_id = list(store.find(condition1, {"books.book_id": 1}))
-                if len(book_id) != 0:
-                    books_in_store.append(b)
-            result_list = books_in_store
-        if len(result_list) == 0:
-            return 501, f"{tag} book not exist", []
-        return 200, "ok", result_list
-
-    def search_tag(self, tag: str, page_num: int, page_size: int):
-        return self.search_tag_in_store(tag, "", page_num, page_size)
-
-    def search_content_in_store(self, content: str, store_id: str, page_num: int, page_size: int):
-        book = self.conn.col_book
-        condition = {
-            "$text": {"$search": content}
-        }
-        result = book.find(condition, {"_id": 0}).skip((page_num - 1) * page_size).limit(page_size)
-        result_list = list(result)
-        if store_id != "":
-            store = self.conn.col_store
-            books_in_store = []
-            for b in result_list:
-                condition1 = {"store_id": store_id, "books.book_id": b.get('id')}
-                book_id = list(store.find(condition1, {"books.book_id": 1}))
-                if len(book_id) != 0:
-                    books_in_store.append(b)
-            result_list = books_in_store
-        if len(result_list) == 0:
-            return 501, f"{content} book not exist", []
-        return 200, "ok", result_list
-
-    def search_content(self, content: str, page_num: int, page_size: int):
-        return self.search_content_in_store(content, "", page_num, page_size)
-
-    def search_author_in_store(self, author: str, store_id: str, page_num: int, page_size: int):
-        book = self.conn.col_book
-        condition = {
-            "author": author
-        }
-        result = book.find(condition, {"_id": 0}).skip((page_num - 1) * page_size).limit(page_size)
-        result_list = list(result)
-        if store_id != "":
-            store = self.conn.col_store
-            books_in_store = []
-            for b in result_list:
-                condition1 = {"store_id": store_id, "books.book_id": b.get('id')}
-                book_id = list(store.find(condition1, {"books.book_id": 1}))
-                if len(book_id) != 0:
-                    books_in_store.append(b)
-            result_list = books_in_store
-        if len(result_list) == 0:
-            return 501, f"{author} book not exist", []
-        return 200, "ok", result_list
-
-    def search_author(self, author: str, page_num: int, page_size: int):
-        return self.search_author_in_store(author, "", page_num, page_size)
+    def _search(self, condition: dict, store_id: str, skip: int, limit: int,
+                projection: dict = None, after: str = None) -> [dict]:
+        # pages are ordered by the unique book id; after is the last id of the
+        # previous page and turns the skip into a seek on the (field, id) index
+        if projection is None:
+            projection = {"_id": 0}
+        if after is not None:
+            condition = dict(condition, id={"$gt": after})
+        catalog = self.conn.for_profile(store.CATALOG_READ)
+        if store_id == "":
+            result = catalog.col_book.find(condition, projection).sort("id", 1).skip(skip).limit(limit)
+            return list(result)
+        result = catalog.col_book.aggregate(search_pipeline(catalog, condition, store_id, skip, limit, projection))
+        return list(result)
+
+    def _page(self, query: tuple, store_id: str, page_num, page_size, fields, cursor: str,
+              compute, keyset: bool = True) -> (int, str, [dict], str):
+        plan = plan_page(query, store_id, page_num, page_size, fields, cursor, keyset)
+        if plan[0] != 200:
+            return plan
+        _, projection, skip, after, key, versions, cached, page_size = plan
+        if cached is None:
+            rows = compute(projection, skip, page_size + 1, after)
+            cached = store_page(key, versions, rows, skip, page_size, keyset)
+        return finish_page(query, cached)
+
+    def search_title_in_store(self, title: str, store_id: str, page_num: int, page_size: int,
+                              fields=None, cursor: str = None):
+        return self._page(("title", title), store_id, page_num, page_size, fields, cursor,
+                          lambda projection, skip, limit, after: self._search(
+                              {"title": title}, store_id, skip, limit, projection, after))
+
+    def search_title(self, title: str, page_num: int, page_size: int, fields=None, cursor: str = None):
+        return self.search_title_in_store(title, "", page_num, page_size, fields, cursor)
+
+    def search_tag_in_store(self, tag: str, store_id: str, page_num: int, page_size: int,
+                            mode: str = "prefix", fields=None, cursor: str = None):
+        condition = tag_condition(tag, mode)
+        if condition is None:
+            return 501, f"{mode} tag search mode not exist", [], None
+        return self._page(("tag", tag, mode), store_id, page_num, page_size, fields, cursor,
+                          lambda projection, skip, limit, after: self._search(
+                              condition, store_id, skip, limit, projection, after))
+
+    def search_tag(self, tag: str, page_num: int, page_size: int, mode: str = "prefix", fields=None,
+                   cursor: str = None):
+        return self.search_tag_in_store(tag, "", page_num, page_size, mode, fields, cursor)
+
+    def tag_dictionary(self, prefix: str, limit):
+        # tag popularity, kept up to date by Seller.add_book
+        failure, condition, limit = tag_query(prefix, limit)
+        if failure is not None:
+            return failure + ([],)
+        try:
+            result = list(self.conn.for_profile(store.CATALOG_READ).col_tag
+                          .find(condition, TAG_PROJECTION).sort("count", -1).limit(limit))
+        except BaseException as e:
+            return 528, "{}".format(str(e)), []
+        return 200, "ok", result
+
+    def search_content_in_store(self, content: str, store_id: str, page_num: int, page_size: int,
+                                engine: str = None, fields=None, cursor: str = None):
+        # results are ordered by relevance, so the cursor carries an offset
+        search = search_engine.get_engine(engine)
+        if search is None:
+            return 501, f"{engine} search engine not exist", [], None
+        return self._page(("content", content, search.name), store_id, page_num, page_size, fields, cursor,
+                          lambda projection, skip, limit, after: search.search(
+                              self.conn.for_profile(store.CATALOG_READ), content, store_id, skip, limit, projection),
+                          keyset=False)
+
+    def search_content(self, content: str, page_num: int, page_size: int, engine: str = None, fields=None,
+                       cursor: str = None):
+        return self.search_content_in_store(content, "", page_num, page_size, engine, fields, cursor)
+
+    def search_author_in_store(self, author: str, store_id: str, page_num: int, page_size: int,
+                               fields=None, cursor: str = None):
+        return self._page(("author", author), store_id, page_num, page_size, fields, cursor,
+                          lambda projection, skip, limit, after: self._search(
+                              {"author": author}, store_id, skip, limit, projection, after))
+
+    def search_author(self, author: str, page_num: int, page_size: int, fields=None, cursor: str = None):
+        return self.search_author_in_store(author, "", page_num, page_size, fields, cursor)
+
+    def get_picture(self, book_id: str, n: int):
+        # returns the picture as a GridFS file, its sha256 doubles as the ETag
+        book = self.conn.col_book.find_one({"id": book_id}, {"_id": 0, "pictures": 1})
+        if book is None:
+            return error.error_non_exist_book_id(book_id) + (None,)
+        pictures = book.get("pictures") or []
+        if n < 0 or n >= len(pictures):
+            return error.error_non_exist_picture(f"{book_id}/{n}") + (None,)
+        blob = self.conn.pictures.get(pictures[n])
+        if blob is None:
+            return error.error_non_exist_picture(pictures[n]) + (None,)
+        return 200, "ok", blob
@@ -1,12 +1,272 @@
 import sqlite3 as sqlite
 import uuid
-import json
 import logging
+from be import conf
 from be.model import db_conn
 from be.model import error
-from datetime import datetime, timedelta, UTC
+from be.model import store
+from be.model.user import check_user_password
+from be.model.expiry import ExpiryQueue
+from be.model import search_engine
+from be.model.cursor import encode_cursor, decode_cursor, datetime_to_ms, ms_to_datetime, page_args
+from datetime import datetime
+from pymongo import UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError
 from apscheduler.schedulers.background import BackgroundScheduler
 
+# order status code -> name reported in the order history
+ORDER_STATUS = ["unpaid", "unsent", "sent but not received", "received", "cancelled"]
+History_Page_Size = 20
+# what cancel_order reads from an order
+ORDER_PROJECTION = {"_id": 0, "user_id": 1, "store_id": 1, "price": 1, "create_time": 1}
+
+
+def order_pipeline(conn, store_id: str, book_ids: [str]) -> [dict]:
+    # the store with the stock and price of the ordered books in one round trip
+    return [
+        {"$match": {"store_id": store_id}},
+        {"$project": {"_id": 0, "store_id": 1}},
+        {"$lookup": {
+            "from": conn.col_inventory.name,
+            "localField": "store_id",
+            "foreignField": "store_id",
+            "pipeline": [
+                {"$match": {"book_id": {"$in": book_ids}}},
+                {"$project": {"_id": 0, "book_id": 1, "stock_level": 1, "price": 1}},
+            ],
+            "as": "books",
+        }},
+    ]
+
+
+def paid_order(order_id: str) -> dict:
+    # the order once paid: unsent, sent or received
+    return {"$or": [{"order_id": order_id, "status": status} for status in (1, 2, 3)]}
+
+
+def check_receive(order: dict, order_id: str, user_id: str):
+    # the error for user_id receiving order, read with paid_order; None when
+    # it may be marked received
+    if order is None:
+        return error.error_invalid_order_id(order_id)
+    if order.get("user_id") != user_id:
+        return error.error_authorization_fail()
+    if order.get("status") == 1:
+        return error.error_books_not_deliver()
+    if order.get("status") == 3:
+        return error.error_books_repeat_receive()
+    return None
+
+
+def history_condition(user_id: str, status: str, cursor: str):
+    # the filter of one history page after cursor; an error tuple and None
+    # for an unknown status or a bad cursor
+    condition = {"user_id": user_id}
+    if status is not None:
+        if status not in ORDER_STATUS:
+            return error.error_invalid_order_status(status), None
+        condition["status"] = ORDER_STATUS.index(status)
+    if cursor:
+        try:
+            key = decode_cursor(cursor)
+            create_time = ms_to_datetime(key["t"])
+            last_order_id = key["o"]
+        except (ValueError, KeyError, TypeError):
+            return error.error_invalid_cursor(cursor), None
+        if create_time is None:
+            condition["create_time"] = None
+            condition["order_id"] = {"$lt": last_order_id}
+        else:
+            condition["$or"] = [
+                {"create_time": {"$lt": create_time}},
+                {"create_time": create_time, "order_id": {"$lt": last_order_id}},
+                {"create_time": None},
+            ]
+    return None, condition
+
+
+def history_pipeline(conn, condition: dict, page_size: int) -> [dict]:
+    # newest first, one more than a page, with the order lines joined
+    return [
+        {"$match": condition},
+        {"$sort": {"create_time": -1, "order_id": -1}},
+        {"$limit": page_size + 1},
+        {"$lookup": {
+            "from": conn.col_order_detail.name,
+            "localField": "order_id",
+            "foreignField": "order_id",
+            "pipeline": [{"$project": {"_id": 0, "book_id": 1, "count": 1, "price": 1}}],
+            "as": "details",
+        }},
+    ]
+
+
+def history_page(result: [dict], page_size: int) -> (list, str):
+    # the orders of a page read with history_pipeline and the cursor of the
+    # next one
+    next_cursor = None
+    if len(result) > page_size:
+        result = result[:page_size]
+        last = result[-1]
+        next_cursor = encode_cursor({
+            "t": datetime_to_ms(last.get("create_time")),
+            "o": last["order_id"],
+        })
+    return [{
+        "status": ORDER_STATUS[order.get("status")],
+        "order_id": order.get("order_id"),
+        "buyer_id": order.get("user_id"),
+        "store_id": order.get("store_id"),
+        "total_price": order.get("price"),
+        "details": order.get("details"),
+    } for order in result], next_cursor
+
+
+def new_order_id(user_id: str, store_id: str) -> str:
+    return "{}_{}_{}".format(user_id, store_id, str(uuid.uuid1()))
+
+
+def order_row(uid: str, store_id: str, user_id: str, price, create_time: datetime) -> dict:
+    return {
+        "order_id": uid,
+        "store_id": store_id,
+        "user_id": user_id,
+        "create_time": create_time,
+        "price": price,
+        "status": 0
+    }
+
+
+def order_lines(uid: str, id_and_count: [(str, int)], store: dict):
+    # validate the lines against the stock read by order_pipeline; returns
+    # an error tuple, or None with the order details and total price
+    stock_level = {b["book_id"]: b["stock_level"] for b in store["books"]}
+    price = {b["book_id"]: b.get("price") for b in store["books"]}
+    total_price = 0
+    details = []
+    for book_id, count in id_and_count:
+        if book_id not in stock_level:
+            return error.error_non_exist_book_id(book_id), None, None
+        if stock_level[book_id] < count:
+            return error.error_stock_level_low(book_id), None, None
+        stock_level[book_id] -= count
+        details.append({
+            "order_id": uid,
+            "book_id": book_id,
+            "count": count,
+            "price": price[book_id]
+        })
+        total_price += price[book_id] * count
+    return None, details, total_price
+
+
+def reserve_requests(store_id: str, id_and_count: [(str, int)]) -> [UpdateOne]:
+    # conditional decrements for one ordered bulk_write. Each upserts: a
+    # line with too little stock collides with its own row on the unique
+    # (store_id, book_id) index, and the duplicate key error stops the batch
+    # there, so exactly the lines before it are reserved
+    return [
+        UpdateOne({"store_id": store_id, "book_id": book_id, "stock_level": {"$gte": count}},
+                  {"$inc": {"stock_level": -count}}, upsert=True)
+        for book_id, count in id_and_count
+    ]
+
+
+def release_requests(store_id: str, id_and_count: [(str, int)]) -> [UpdateOne]:
+    return [
+        UpdateOne({"store_id": store_id, "book_id": book_id},
+                  {"$inc": {"stock_level": count}})
+        for book_id, count in id_and_count
+    ]
+
+
+def payment_pipeline(conn, order_id: str) -> [dict]:
+    # the unpaid order and its buyer in one round trip
+    return [
+        {"$match": {"order_id": order_id, "status": 0}},
+        {"$lookup": {
+            "from": conn.col_user.name,
+            "localField": "user_id",
+            "foreignField": "user_id",
+            "pipeline": [{"$project": {"_id": 1, "password": 1, "balance": 1}}],
+            "as": "buyer",
+        }},
+    ]
+
+
+def check_payment(order: dict, user_id: str, password: str):
+    # the checks on an unpaid order and its buyer (payment_pipeline) before
+    # any money moves; None when the payment may go ahead
+    if order["user_id"] != user_id:
+        return error.error_authorization_fail()
+    if not order["buyer"]:
+        return error.error_non_exist_user_id(order["user_id"])
+    if password != order["buyer"][0].get("password", ""):
+        return error.error_authorization_fail()
+    if order["buyer"][0].get("balance", 0) < order["price"]:
+        return error.error_not_sufficient_funds(order["order_id"])
+    return None
+
+
+def claim_order(order_id: str) -> (dict, dict):
+    # marks the order paid before the money moves: a second payment or a
+    # cancellation racing on it finds it taken
+    return {"order_id": order_id, "status": 0}, {"$set": {"status": 1, "pay_time": datetime.utcnow()}}
+
+
+def unclaim_order(order_id: str) -> (dict, dict):
+    return {"order_id": order_id, "status": 1}, {"$set": {"status": 0}, "$unset": {"pay_time": ""}}
+
+
+def settle_requests(buyer_oid, seller_id: str, amount) -> [UpdateOne]:
+    # debit and credit for one ordered bulk_write. The debit upserts on the
+    # buyer's _id: with too low a balance its insert collides with the
+    # buyer's own row, and the duplicate key error stops the batch before
+    # the credit
+    return [
+        UpdateOne({"_id": buyer_oid, "balance": {"$gte": amount}}, {"$inc": {"balance": -amount}}, upsert=True),
+        UpdateOne({"user_id": seller_id}, {"$inc": {"balance": amount}}),
+    ]
+
+
+def guard_index(e: BulkWriteError):
+    # the position of the upsert guard that stopped an ordered batch; None
+    # when the batch failed for another reason
+    errors = e.details.get("writeErrors", [])
+    if len(errors) == 1 and errors[0].get("code") == 11000:
+        return errors[0]["index"]
+    return None
+
+
+def reserved_count(e: BulkWriteError, total: int) -> int:
+    # how many leading writes of a failed ordered batch were applied
+    errors = e.details.get("writeErrors", [])
+    return errors[0]["index"] if errors else total
+
+
+def refund(buyer_oid, amount) -> (dict, dict):
+    # undoes the debit
+    return {"_id": buyer_oid}, {"$inc": {"balance": amount}}
+
+
+def settle_undo(result, buyer_oid, seller_id: str, amount) -> list:
+    # compensating writes when the buyer or the seller was removed during
+    # the payment; empty when both balances moved
+    if result.matched_count == 2:
+        return []
+    if result.upserted_count:
+        # the debit inserted a row for a buyer that is gone
+        undo = [DeleteOne({"_id": buyer_oid})]
+    else:
+        undo = [UpdateOne(*refund(buyer_oid, amount))]
+    if result.matched_count + result.upserted_count == 2:
+        undo.append(UpdateOne({"user_id": seller_id}, {"$inc": {"balance": -amount}}))
+    return undo
+
+
+def funds_update(user_id: str, add_value) -> (dict, dict):
+    return {"user_id": user_id}, {"$inc": {"balance": add_value}}
+
 
 class Buyer(db_conn.DBConn):
     def __init__(self):
@@ -19,48 +279,32 @@ class Buyer(db_conn.DBConn):
         try:
             if not self.user_id_exist(user_id):
                 return error.error_non_exist_user_id(user_id) + (order_id,)
-            if not self.store_id_exist(store_id):
-                return error.error_non_exist_store_id(store_id) + (order_id,)
-
-            uid = "{}_{}_{}".format(user_id, store_id, str(uuid.uuid1()))
-            total_price = 0
-
-            for book_id, count in id_and_count:
-                result = self.conn.col_store.find_one({"store_id": store_id, "books.book_id": book_id}, {"books.$": 1})
-                if result is None:
-                    return error.error_non_exist_book_id(book_id) + (order_id,)
-
-                result1 = self.conn.col_book.find_one({"id": book_id})
-                stock_level = result["books"][0]["stock_level"]
 
-                price = result1["price"]
-
-                if stock_level < count:
-                    return error.error_stock_level_low(book_id) + (order_id,)
-
-                result = self.conn.col_store.update_one(
-                    {"store_id": store_id, "books.book_id": book_id, "books.stock_level": {"$gte": count}},
-                    {"$inc": {"books.$.stock_level": -count}})
-                if result.modified_count == 0:
-                    return error.error_stock_level_low(book_id) + (order_id,)
+            orders = self.conn.for_profile(store.ORDER_WRITE)
+            book_ids = list({book_id for book_id, _ in id_and_count})
+            result = list(orders.col_store.aggregate(order_pipeline(self.conn, store_id, book_ids)))
+            if not result:
+                return error.error_non_exist_store_id(store_id) + (order_id,)
 
-                self.conn.col_order_detail.insert_one({
-                    "order_id": uid,
-                    "book_id": book_id,
-                    "count": count,
-                    "price": price
-                })
-                total_price += price * count
-
-            now_time = datetime.utcnow()
-            self.conn.col_order.insert_one({
-                "order_id": uid,
-                "store_id": store_id,
-                "user_id": user_id,
-                "create_time": now_time,
-                "price": total_price,
-                "status": 0
-            })
+            uid = new_order_id(user_id, store_id)
+            failure, details, total_price = order_lines(uid, id_and_count, result[0])
+            if failure is not None:
+                return failure + (order_id,)
+
+            ok, book_id = self._reserve_stock(store_id, id_and_count)
+            if not ok:
+                return error.error_stock_level_low(book_id) + (order_id,)
+
+            try:
+                if details:
+                    orders.col_order_detail.insert_many(details)
+                now_time = datetime.utcnow()
+                orders.col_order.insert_one(order_row(uid, store_id, user_id, total_price, now_time))
+                expiry_queue.push(uid, now_time)
+            except BaseException:
+                self._release_stock(store_id, id_and_count)
+                orders.col_order_detail.delete_many({"order_id": uid})
+                raise
             order_id = uid
         except sqlite.Error as e:
             logging.info("528, {}".format(str(e)))
@@ -71,57 +315,52 @@ class Buyer(db_conn.DBConn):
 
         return 200, "ok", order_id
 
-    def payment(self, user_id: str, password: str, order_id: str) -> (int, str):
-        conn = self.conn
+    def _reserve_stock(self, store_id: str, id_and_count: [(str, int)]) -> (bool, str):
+        # all lines in one round trip; on a shortfall the lines reserved
+        # before it are released again
+        col_inventory = self.conn.for_profile(store.ORDER_WRITE).col_inventory
         try:
-            result = self.conn.col_order.find_one({"order_id": order_id, "status": 0})
-            if result is None:
-                return error.error_invalid_order_id(order_id)
-
-            buyer_id = result["user_id"]
-            store_id = result["store_id"]
-            total_price = result["price"]
-
-            if buyer_id != user_id:
-                return error.error_authorization_fail()
-
-            result = self.conn.col_user.find_one({"user_id": buyer_id})
-            if result is None:
-                return error.error_non_exist_user_id(buyer_id)
-            balance = result.get("balance", 0)
-            if password != result.get("password", ""):
-                return error.error_authorization_fail()
-
-            result = self.conn.col_store.find_one({"store_id": store_id})
-            if result is None:
-                return error.error_non_exist_store_id(store_id)
-
-            seller_id = result.get("user_id")
+            result = col_inventory.bulk_write(reserve_requests(store_id, id_and_count), ordered=True)
+        except BulkWriteError as e:
+            i = reserved_count(e, len(id_and_count))
+            self._release_stock(store_id, id_and_count[:i])
+            if guard_index(e) is None:
+                raise
+            return False, id_and_count[i][0]
+        if result.upserted_count:
+            # rows gone since the stock was read: drop what the upserts created
+            col_inventory.bulk_write([DeleteOne({"_id": _id}) for _id in result.upserted_ids.values()])
+            self._release_stock(store_id, [line for i, line in enumerate(id_and_count)
+                                           if i not in result.upserted_ids])
+            return False, id_and_count[min(result.upserted_ids)][0]
+        return True, ""
+
+    def _release_stock(self, store_id: str, id_and_count: [(str, int)]):
+        if not id_and_count:
+            return
+        self.conn.for_profile(store.ORDER_WRITE).col_inventory.bulk_write(
+            release_requests(store_id, id_and_count), ordered=False)
 
-            if not self.user_id_exist(seller_id):
-                return error.error_non_exist_user_id(seller_id)
-
-            if balance < total_price:
-                return error.error_not_sufficient_funds(order_id)
-            result = self.conn.col_user.update_one({"user_id": buyer_id, "balance": {"$gte": total_price}},
-                                                   {"$inc": {"balance": -total_price}})
-            if result.matched_count == 0:
-                return error.error_not_sufficient_funds(order_id)
-
-            result = self.conn.col_user.update_one({"user_id": seller_id}, {"$inc": {"balance": total_price}})
-            if result.matched_count == 0:
-                return error.error_non_exist_user_id(buyer_id)
-
-            self.conn.col_order.insert_one({
-                "order_id": order_id,
-                "store_id": store_id,
-                "user_id": buyer_id,
-                "status": 1,
-                "price": total_price
-            })
-            result = self.conn.col_order.delete_one({"order_id": order_id, "status": 0})
-            if result.deleted_count == 0:
+    def payment(self, user_id: str, password: str, order_id: str) -> (int, str):
+        try:
+            settlement = self.conn.for_profile(store.SETTLEMENT)
+            result = list(settlement.col_order.aggregate(payment_pipeline(self.conn, order_id)))
+            if not result:
                 return error.error_invalid_order_id(order_id)
+            order = result[0]
+            failure = check_payment(order, user_id, password)
+            if failure is not None:
+                return failure
+
+            seller_id = self.store_owner(order["store_id"])
+            if seller_id is None:
+                return error.error_non_exist_store_id(order["store_id"])
+
+            code, message = self._settle(order_id, order["buyer"][0]["_id"], seller_id, order["price"])
+            self.forget_user(user_id)
+            self.forget_user(seller_id)
+            if code != 200:
+                return code, message
         except sqlite.Error as e:
             return 528, "{}".format(str(e))
 
@@ -130,15 +369,40 @@ class Buyer(db_conn.DBConn):
 
         return 200, "ok"
 
+    def _settle(self, order_id: str, buyer_oid, seller_id: str, amount) -> (int, str):
+        # with the read in payment() three round trips: claim the order,
+        # then debit the buyer and credit the seller in one ordered bulk_write
+        settlement = self.conn.for_profile(store.SETTLEMENT)
+        if settlement.col_order.find_one_and_update(*claim_order(order_id), projection={"_id": 1}) is None:
+            # paid or cancelled concurrently
+            return error.error_invalid_order_id(order_id)
+        try:
+            result = settlement.col_user.bulk_write(settle_requests(buyer_oid, seller_id, amount), ordered=True)
+        except BulkWriteError as e:
+            if e.details.get("nMatched"):
+                # the credit failed after the debit
+                settlement.col_user.update_one(*refund(buyer_oid, amount))
+            settlement.col_order.update_one(*unclaim_order(order_id))
+            if guard_index(e) == 0:
+                return error.error_not_sufficient_funds(order_id)
+            raise
+        undo = settle_undo(result, buyer_oid, seller_id, amount)
+        if undo:
+            settlement.col_user.bulk_write(undo, ordered=False)
+            settlement.col_order.update_one(*unclaim_order(order_id))
+            if result.upserted_count:
+                return error.error_not_sufficient_funds(order_id)
+            return error.error_non_exist_user_id(seller_id)
+        return 200, "ok"
+
     def add_funds(self, user_id, password, add_value) -> (int, str):
         try:
-            result = self.conn.col_user.find_one({"user_id": user_id})
-            if result is None:
-                return error.error_authorization_fail()
-            if result.get("password") != password:
-                return error.error_authorization_fail()
+            failure = check_user_password(self.get_user(user_id), password)
+            if failure is not None:
+                return failure
 
-            result = self.conn.col_user.update_one({"user_id": user_id}, {"$inc": {"balance": add_value}})
+            result = self.conn.for_profile(store.SETTLEMENT).col_user.update_one(*funds_update(user_id, add_value))
+            self.forget_user(user_id)
             if result.matched_count == 0:
                 return error.error_non_exist_user_id(user_id)
         except BaseException as e:
@@ -147,240 +411,124 @@ class Buyer(db_conn.DBConn):
         return 200, ""
 
     def cancel_order(self, user_id: str, order_id: str) -> (int, str):
+        settlement = self.conn.for_profile(store.SETTLEMENT)
         try:
-            result = self.conn.col_order.find_one({"order_id": order_id, "status": 0})
+            result = settlement.col_order.find_one({"order_id": order_id, "status": 0}, ORDER_PROJECTION)
             if result:
                 buyer_id = result.get("user_id")
                 if buyer_id != user_id:
                     return error.error_authorization_fail()
                 store_id = result.get("store_id")
                 price = result.get("price")
-                self.conn.col_order.delete_one({"order_id": order_id, "status": 0})
+                create_time = result.get("create_time")
+                settlement.col_order.delete_one({"order_id": order_id, "status": 0})
             else:
-                result = self.conn.col_order.find_one({
-                    "$or": [
-                        {"order_id": order_id, "status": 1},
-                        {"order_id": order_id, "status": 2},
-                        {"order_id": order_id, "status": 3},
-                    ]
-                })
+                result = settlement.col_order.find_one(paid_order(order_id), ORDER_PROJECTION)
                 if result:
                     buyer_id = result.get("user_id")
                     if buyer_id != user_id:
                         return error.error_authorization_fail()
                     store_id = result.get("store_id")
                     price = result.get("price")
+                    create_time = result.get("create_time")
 
-                    result1 = self.conn.col_store.find_one({"store_id": store_id})
-
-                    if result1 is None:
+                    seller_id = self.store_owner(store_id)
+                    if seller_id is None:
                         return error.error_non_exist_store_id(store_id)
-                    seller_id = result1.get("user_id")
 
-                    result2 = self.conn.col_user.update_one({"user_id": seller_id}, {"$inc": {"balance": -price}})
+                    result2 = settlement.col_user.update_one({"user_id": seller_id}, {"$inc": {"balance": -price}})
                     if result2 is None:
                         return error.error_non_exist_user_id(seller_id)
 
-                    result3 = self.conn.col_user.update_one({"user_id": buyer_id}, {"$inc": {"balance": price}})
+                    result3 = settlement.col_user.update_one({"user_id": buyer_id}, {"$inc": {"balance": price}})
+                    self.forget_user(seller_id)
+                    self.forget_user(buyer_id)
                     if result3 is None:
                         return error.error_non_exist_user_id(user_id)
 
-                    result4 = self.conn.col_order.delete_one({
-                        "$or": [
-                            {"order_id": order_id, "status": 1},
-                            {"order_id": order_id, "status": 2},
-                            {"order_id": order_id, "status": 3},
-                        ]
-                    })
+                    result4 = settlement.col_order.delete_one(paid_order(order_id))
                     if result4 is None:
                         return error.error_invalid_order_id(order_id)
 
                 else:
                     return error.error_invalid_order_id(order_id)
-            result = self.conn.col_order_detail.find({"order_id": order_id})
+            result = settlement.col_order_detail.find({"order_id": order_id})
             for book in result:
                 book_id = book["book_id"]
                 count = book["count"]
-                result1 = self.conn.col_store.update_one({"store_id": store_id, "books.book_id": book_id},
-                                                         {"$inc": {"books.$.stock_level": count}})
+                result1 = settlement.col_inventory.update_one({"store_id": store_id, "book_id": book_id},
+                                                             {"$inc": {"stock_level": count}})
                 if result1.modified_count == 0:
                     return error.error_stock_level_low(book_id) + (order_id,)
 
-            self.conn.col_order.insert_one(
-                {"order_id": order_id, "user_id": user_id, "store_id": store_id, "price": price, "status": 4})
+            settlement.col_order.insert_one(
+                {"order_id": order_id, "user_id": user_id, "store_id": store_id, "price": price, "status": 4,
+                 "create_time": create_time})
         except BaseException as e:
             return 528, "{}".format(str(e))
         return 200, "ok"
 
-    def check_hist_order(self, user_id: str):
+    def check_hist_order(self, user_id: str, status: str = None, cursor: str = None,
+                         page_size: int = History_Page_Size):
+        # newest first, one aggregation per page; pass next_cursor back to continue
         try:
+            try:
+                _, page_size = page_args(1, page_size, conf.Max_Page_Size)
+            except ValueError:
+                return error.error_invalid_page(1, page_size) + (None, None)
             if not self.user_id_exist(user_id):
-                return error.error_non_exist_user_id(user_id)
-            ans = []
-            result = self.conn.col_order.find({"user_id": user_id, "status": 0})
-            if result:
-                for order in result:
-                    tmp_details = []
-                    order_id = order.get("order_id")
-                    order_detail_result = self.conn.col_order_detail.find({"order_id": order_id})
-
-                    if order_detail_result:
-                        for order_detail in order_detail_result:
-                            tmp_details.append({
-                                "book_id": order_detail.get("book_id"),
-                                "count": order_detail.get("count"),
-                                "price": order_detail.get("price")
-                            })
-                    else:
-                        return error.error_invalid_order_id(order_id)
-
-                    ans.append({
-                        "status": "unpaid",
-                        "order_id": order_id,
-                        "buyer_id": order.get("user_id"),
-                        "store_id": order.get("store_id"),
-                        "total_price": order.get("price"),
-                        "details": tmp_details
-                    })
-            books_status_list = ["unsent", "sent but not received", "received"]
-            result = self.conn.col_order.find({
-                "$or": [
-                    {"user_id": user_id, "status": 1},
-                    {"user_id": user_id, "status": 2},
-                    {"user_id": user_id, "status": 3},
-                ]
-            })
-            if result:
-                for i in result:
-                    tmp_details = []
-                    order_id = i.get("order_id")
-                    order_detail_result = self.conn.col_order_detail.find({"order_id": order_id})
-                    if order_detail_result:
-                        for order_detail in order_detail_result:
-                            tmp_details.append({
-                                "book_id": order_detail.get("book_id"),
-                                "count": order_detail.get("count"),
-                                "price": order_detail.get("price")
-                            })
-                    else:
-                        return error.error_invalid_order_id(order_id)
-                    ans.append({
-                        "order_id": order_id,
-                        "buyer_id": i.get("user_id"),
-                        "store_id": i.get("store_id"),
-                        "total_price": i.get("price"),
-                        "status": books_status_list[i.get("status") - 1],
-                        "details": tmp_details
-                    })
-            result = self.conn.col_order.find({"user_id": user_id, "status": 4})
-            if result:
-                for order_cancel in result:
-                    tmp_details = []
-                    order_id = order_cancel.get("order_id")
-                    order_detail_result = self.conn.col_order_detail.find({"order_id": order_id})
-                    if order_detail_result:
-                        for order_detail in order_detail_result:
-                            tmp_details.append({
-                                "book_id": order_detail.get("book_id"),
-                                "count": order_detail.get("count"),
-                                "price": order_detail.get("price")
-                            })
-                    else:
-                        return error.error_invalid_order_id(order_id)
-
-                    ans.append({
-                        "status": "cancelled",
-                        "order_id": order_id,
-                        "buyer_id": order_cancel.get("user_id"),
-                        "store_id": order_cancel.get("store_id"),
-                        "total_price": order_cancel.get("price"),
-                        "details": tmp_details
-                    })
-
+                return error.error_non_exist_user_id(user_id) + (None, None)
+            failure, condition = history_condition(user_id, status, cursor)
+            if failure is not None:
+                return failure + (None, None)
+            result = list(self.conn.for_profile(store.HISTORY_READ).col_order.aggregate(
+                history_pipeline(self.conn, condition, page_size)))
+            ans, next_cursor = history_page(result, page_size)
         except BaseException as e:
-            return 528, "{}".format(str(e)), None  # 添加第三个返回值
+            return 528, "{}".format(str(e)), None, None  # 添加第三个返回值
         if not ans:
-            return 200, "ok", "No orders found "
+            return 200, "ok", "No orders found ", None
         else:
-            return 200, "ok", ans
+            return 200, "ok", ans, next_cursor
 
-    def auto_cancel_order(self) -> (int, str):
+    def auto_cancel_order(self, order_id: str = None) -> (int, str):
         try:
-            wait = 20
-            current_time = datetime.now(UTC)  # 使用新的UTC时间方法
-            interval = current_time - timedelta(seconds=wait)  # UTC时间
-            orders_to_cancel = self.conn.col_order.find({"create_time": {"$lte": interval}, "status": 0})
-            if orders_to_cancel:
-                for order in orders_to_cancel:
-                    order_id = order["order_id"]
-                    user_id = order["user_id"]
-                    store_id = order["store_id"]
-                    price = order["price"]
-                    self.conn.col_order.delete_one({"order_id": order_id, "status": 0})
-                    result = self.conn.col_order_detail.find({"order_id": order_id})
-
-                    for book in result:
-                        book_id = book["book_id"]
-                        count = book["count"]
-                        result1 = self.conn.col_store.update_one({"store_id": store_id, "books.book_id": book_id},
-                                                                 {"$inc": {"books.$.stock_level": count}})
-                        if result1.modified_count == 0:
-                            return error.error_stock_level_low(book_id) + (order_id,)
-
-                    self.conn.col_order.insert_one(
-                        {"order_id": order_id, "user_id": user_id, "store_id": store_id, "price": price, "status": 4})
+            if order_id:
+                expiry_queue.cancel_expired(self.conn.for_profile(store.ORDER_WRITE), [order_id])
+            else:
+                expiry_queue.sweep(self.conn.for_profile(store.ORDER_WRITE))
         except BaseException as e:
             return 528, "{}".format(str(e))
         return 200, "ok"
 
     def is_order_cancelled(self, order_id: str) -> (int, str):
-        result = self.conn.col_order.find_one({"order_id": order_id, "status": 4})
-        if result is None:
+        if not self.exists(self.conn.col_order, {"order_id": order_id, "status": 4}):
             return error.error_auto_cancel_fail(order_id)
         else:
             return 200, "ok"
 
-    def search(self, keyword, store_id=None, page=1, per_page=10):
+    def search(self, keyword, store_id=None, page=1, per_page=10, engine=None):
         try:
-            query = {"$text": {"$search": keyword}}
-            if store_id:
-                result1 = self.conn.col_store.find({"store_id": store_id}, {"books.book_id": 1, "_id": 0})
-                for result in result1:
-                    print(result)
-                books_id = [i["book_id"] for i in result1["books"]]
-                query["id"] = {"$in": books_id}
-
-            result = self.conn.col_book.find(query,
-                                             {"score": {"$meta": "textScore"}, "_id": 0, "picture": 0}).sort(
-                [("score", {"$meta": "textScore"})])
-
-            result.skip((int(page) - 1) * per_page).limit(per_page)
+            try:
+                page, per_page = page_args(page, per_page, conf.Max_Page_Size)
+            except ValueError:
+                return error.error_invalid_page(page, per_page)
+            search = search_engine.get_engine(engine)
+            if search is None:
+                return 501, f"{engine} search engine not exist"
+            result = search.search(self.conn.for_profile(store.CATALOG_READ), keyword, store_id or "",
+                                   (page - 1) * per_page, per_page, {"_id": 0, "picture": 0})
         except BaseException as e:
             return 530, f"{str(e)}"
-        return 200, list(result)
+        return 200, result
 
     def receive(self, user_id: str, order_id: str) -> (int, str):
         try:
             col_order = self.conn.database["order"]
-            query = {
-                "$or": [
-                    {"order_id": order_id, "status": 1},
-                    {"order_id": order_id, "status": 2},
-                    {"order_id": order_id, "status": 3},
-                ]
-            }
-            result = col_order.find_one(query)
-            if result == None:
-                return error.error_invalid_order_id(order_id)
-            buyer_id = result.get("user_id")
-            paid_status = result.get("status")
-
-            if buyer_id != user_id:
-                return error.error_authorization_fail()
-            if paid_status == 1:
-                return error.error_books_not_deliver()
-            if paid_status == 3:
-                return error.error_books_repeat_receive()
+            result = col_order.find_one(paid_order(order_id), {"_id": 0, "user_id": 1, "status": 1})
+            failure = check_receive(result, order_id, user_id)
+            if failure is not None:
+                return failure
 
             col_order.update_one({"order_id": order_id}, {"$set": {"status": 3}})
         except sqlite.Error as e:
@@ -390,6 +538,23 @@ class Buyer(db_conn.DBConn):
         return 200, "ok"
 
 
-scheduler = BackgroundScheduler()
-scheduler.add_job(Buyer().auto_cancel_order, 'interval', id='5_second_job', seconds=5)
-scheduler.start()
+expiry_queue = ExpiryQueue(conf.Order_Timeout_Seconds)
+scheduler: BackgroundScheduler = None
+
+
+def start_expiry_sweep():
+    # started by each serving process, after any fork, so the sweep thread
+    # and its Mongo client belong to the process that runs them
+    global scheduler
+    if scheduler is None:
+        scheduler = BackgroundScheduler()
+        scheduler.add_job(Buyer().auto_cancel_order, 'interval', id='expiry_sweep',
+                          seconds=conf.Expiry_Sweep_Seconds)
+        scheduler.start()
+
+
+def stop_expiry_sweep():
+    global scheduler
+    if scheduler is not None:
+        scheduler.shutdown(wait=True)
+        scheduler = None
@@ -0,0 +1,153 @@
+import multiprocessing
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from be import conf
+
+_missing = object()
+
+
+class LRUCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _missing)
+            if value is _missing:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+class VersionStamps:
+    # Change counters in shared memory, so a bump in one worker process is
+    # seen by the others forked from the same parent. Each domain (the key
+    # up to the first ":") has its own range of slots, so a store key never
+    # shares a slot with a user key or the catalog; within a domain keys are
+    # hashed, and a collision only costs a spurious invalidation.
+
+    def __init__(self, domains: dict):
+        self._ranges = {}
+        size = 0
+        for domain, slots in domains.items():
+            self._ranges[domain] = (size, slots)
+            size += slots
+        self._array = multiprocessing.Array("q", size)
+        self._slots = self._array.get_obj()
+
+    def _slot(self, key: str) -> int:
+        start, slots = self._ranges[key.partition(":")[0]]
+        return start + zlib.crc32(key.encode("utf-8")) % slots
+
+    def get(self, key: str) -> int:
+        return self._slots[self._slot(key)]
+
+    def bump(self, key: str) -> int:
+        slot = self._slot(key)
+        with self._array.get_lock():
+            self._slots[slot] += 1
+            return self._slots[slot]
+
+
+class ResultCache(LRUCache):
+    # Cached query results. Each entry remembers the version stamps it was
+    # computed under and is dropped once it expires or any of them moves on.
+
+    def __init__(self, max_size: int, ttl: float, stamps: VersionStamps):
+        LRUCache.__init__(self, max_size)
+        self.ttl = ttl
+        self.stamps = stamps
+        self.expired = 0
+        self.stale = 0
+
+    def versions(self, keys: [str]) -> tuple:
+        return tuple(self.stamps.get(key) for key in keys)
+
+    def lookup(self, key, version_keys: [str]):
+        # returns the cached value (None on a miss) and the versions a fresh
+        # result should be stored under
+        versions = self.versions(version_keys)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires, entry_versions, value = entry
+                if expires >= now and entry_versions == versions:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value, versions
+                del self._data[key]
+                if expires < now:
+                    self.expired += 1
+                else:
+                    self.stale += 1
+            self.misses += 1
+        return None, versions
+
+    def store(self, key, versions: tuple, value, ttl: float = None):
+        self.put(key, (time.monotonic() + (self.ttl if ttl is None else ttl), versions, value))
+
+    def stats(self) -> dict:
+        stats = LRUCache.stats(self)
+        stats["expired"] = self.expired
+        stats["stale"] = self.stale
+        return stats
+
+
+# store id -> seller id; a store never changes owner
+store_owner_cache = LRUCache(max_size=100000)
+version_stamps = VersionStamps({"catalog": 1, "store": conf.Version_Slots, "user": conf.Version_Slots})
+search_cache = ResultCache(conf.Search_Cache_Size, conf.Search_Cache_TTL, version_stamps)
+# (user_id, token) -> verified, until the token expires or the user logs
+# in or out or changes password
+token_cache = ResultCache(conf.Token_Cache_Size, 0, version_stamps)
+
+# version keys: the whole catalog, and the books listed by one store
+CATALOG_VERSION = "catalog"
+
+
+def store_version(store_id: str) -> str:
+    return "store:" + store_id
+
+
+def user_version(user_id: str) -> str:
+    return "user:" + user_id
@@ -0,0 +1,46 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+_epoch = datetime(1970, 1, 1)
+
+
+# opaque page cursor: urlsafe base64 of the last sort key
+def encode_cursor(key: dict) -> str:
+    raw = json.dumps(key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("invalid cursor {}".format(cursor)) from e
+    if not isinstance(key, dict):
+        raise ValueError("invalid cursor {}".format(cursor))
+    return key
+
+
+def page_args(page_num, page_size, max_size: int) -> (int, int):
+    # page numbers start at 1; a page size below 1 is an error, one above
+    # max_size is clamped to it
+    try:
+        page_num = int(page_num)
+        page_size = int(page_size)
+    except (TypeError, ValueError) as e:
+        raise ValueError("invalid page {} of size {}".format(page_num, page_size)) from e
+    if page_num < 1 or page_size < 1:
+        raise ValueError("invalid page {} of size {}".format(page_num, page_size))
+    return page_num, min(page_size, max_size)
+
+
+def datetime_to_ms(dt: datetime):
+    if dt is None:
+        return None
+    return (dt - _epoch) // timedelta(milliseconds=1)
+
+
+def ms_to_datetime(ms):
+    if ms is None:
+        return None
+    return _epoch + timedelta(milliseconds=ms)
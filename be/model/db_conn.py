@@ -1,27 +1,88 @@
 from be.model import store
+from be.model import identity
+from be.model.bloom import user_filter, store_filter, book_filter, book_key
+from be.model.cache import store_owner_cache
 
 
 class DBConn:
     def __init__(self):
         self.conn = store.get_db_conn()
 
+    def get_user(self, user_id):
+        # the user document (identity.USER_PROJECTION), read at most once
+        # per request; None when it does not exist
+        identity_map = identity.current()
+        if identity_map is not None and user_id in identity_map.users:
+            return identity_map.users[user_id]
+        if not user_filter.might_contain(user_id):
+            return None
+        result = self.conn.col_user.find_one({"user_id": user_id}, identity.USER_PROJECTION)
+        if identity_map is not None:
+            identity_map.users[user_id] = result
+        return result
+
+    def get_store(self, store_id):
+        # store id and owner
+        identity_map = identity.current()
+        if identity_map is not None and store_id in identity_map.stores:
+            return identity_map.stores[store_id]
+        if not store_filter.might_contain(store_id):
+            return None
+        result = self.conn.col_store.find_one({"store_id": store_id}, identity.STORE_PROJECTION)
+        if identity_map is not None:
+            identity_map.stores[store_id] = result
+        return result
+
+    def forget_user(self, user_id):
+        # after a write to the user, the next get_user reads it again
+        identity_map = identity.current()
+        if identity_map is not None:
+            identity_map.users.pop(user_id, None)
+            for key in [key for key in identity_map.tokens if key[0] == user_id]:
+                del identity_map.tokens[key]
+
+    def forget_store(self, store_id):
+        identity_map = identity.current()
+        if identity_map is not None:
+            identity_map.stores.pop(store_id, None)
+
+    def exists(self, col, condition: dict) -> bool:
+        # answered from the index alone, see store.key_projection
+        return col.find_one(condition, store.key_projection(condition)) is not None
+
     def user_id_exist(self, user_id):
-        result = self.conn.col_user.find_one({"user_id": user_id})
-        if result is None:
+        identity_map = identity.current()
+        if identity_map is not None and user_id in identity_map.users:
+            return identity_map.users[user_id] is not None
+        if not user_filter.might_contain(user_id):
             return False
-        else:
-            return True
+        found = self.exists(self.conn.col_user, {"user_id": user_id})
+        if identity_map is not None and not found:
+            identity_map.users[user_id] = None
+        return found
 
     def book_id_exist(self, store_id, book_id):
-        result = self.conn.col_store.find_one({"store_id": store_id, "books.book_id": book_id})
-        if result is None:
+        if not book_filter.might_contain(book_key(store_id, book_id)):
             return False
-        else:
-            return True
+        return self.exists(self.conn.col_inventory, {"store_id": store_id, "book_id": book_id})
 
     def store_id_exist(self, store_id):
-        result = self.conn.col_store.find_one({"store_id": store_id})
-        if result is None:
+        identity_map = identity.current()
+        if identity_map is not None and store_id in identity_map.stores:
+            return identity_map.stores[store_id] is not None
+        if not store_filter.might_contain(store_id):
             return False
-        else:
-            return True
\ No newline at end of file
+        found = self.exists(self.conn.col_store, {"store_id": store_id})
+        if identity_map is not None and not found:
+            identity_map.stores[store_id] = None
+        return found
+
+    def store_owner(self, store_id):
+        seller_id = store_owner_cache.get(store_id)
+        if seller_id is None:
+            result = self.get_store(store_id)
+            if result is None:
+                return None
+            seller_id = result.get("user_id")
+            store_owner_cache.put(store_id, seller_id)
+        return seller_id
@@ -1,4 +1,5 @@
 error_code = {
+    400: "invalid page {} of size {}",
     401: "authorization fail.",
     511: "non exist user id {}",
     512: "exist user id {}",
@@ -14,10 +15,11 @@ error_code = {
     522: "books receive repeatedly.",
     523: "seller has not sufficient funds order id {}",
     524: "auto cancel failed, order id {}",
-    525: "",
-    526: "",
+    525: "invalid order status {}",
+    526: "invalid page cursor {}",
     527: "",
     528: "",
+    529: "non exist picture {}",
 }
 
 
@@ -83,3 +85,19 @@ def error_auto_cancel_fail(order_id):
 
 def error_seller_not_sufficient_funds(order_id):
     return 523, error_code[523].format(order_id)
+
+
+def error_invalid_order_status(status):
+    return 525, error_code[525].format(status)
+
+
+def error_invalid_cursor(cursor):
+    return 526, error_code[526].format(cursor)
+
+
+def error_invalid_page(page_num, page_size):
+    return 400, error_code[400].format(page_num, page_size)
+
+
+def error_non_exist_picture(picture):
+    return 529, error_code[529].format(picture)
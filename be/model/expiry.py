@@ -0,0 +1,129 @@
+import heapq
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from be import conf
+from be.model.metrics import expiry_sweep_seconds
+
+
+class ExpiryQueue:
+    # Deadlines of unpaid orders. Orders placed by this process sit in a
+    # min-heap so a sweep only touches what is due; orders placed by other
+    # processes, or before a restart, are picked up by the backstop query on
+    # the (status, create_time) index. Either way a sweep costs O(expired).
+
+    def __init__(self, timeout: int, batch_size: int = 100, max_batches: int = 10,
+                 backstop_interval: int = 5):
+        self.timeout = timedelta(seconds=timeout)
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.backstop_interval = backstop_interval
+        self._heap = []
+        self._lock = threading.Lock()
+        self._last_backstop = 0.0
+        self.sweeps = 0
+        self.cancelled = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_sweep_seconds = 0.0
+
+    def push(self, order_id: str, create_time: datetime):
+        with self._lock:
+            heapq.heappush(self._heap, (create_time + self.timeout, order_id))
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _pop_due(self, now: datetime) -> ([str], datetime):
+        order_ids = []
+        oldest = None
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(order_ids) < self.batch_size:
+                deadline, order_id = heapq.heappop(self._heap)
+                if oldest is None:
+                    oldest = deadline
+                order_ids.append(order_id)
+        return order_ids, oldest
+
+    def _backstop(self, conn, cutoff: datetime) -> ([str], datetime):
+        orders = list(conn.col_order.find(
+            {"status": 0, "create_time": {"$lte": cutoff}},
+            {"_id": 0, "order_id": 1, "create_time": 1},
+        ).sort("create_time", 1).limit(self.batch_size))
+        if not orders:
+            return [], None
+        return [o["order_id"] for o in orders], orders[0]["create_time"] + self.timeout
+
+    def sweep(self, conn) -> int:
+        start = time.perf_counter()
+        now = datetime.utcnow()
+        cutoff = now - self.timeout
+        backstop = time.monotonic() - self._last_backstop >= self.backstop_interval
+        lag = 0.0
+        n = 0
+        for _ in range(self.max_batches):
+            order_ids, oldest = self._pop_due(now)
+            if not order_ids and backstop:
+                order_ids, oldest = self._backstop(conn, cutoff)
+                if len(order_ids) < self.batch_size:
+                    self._last_backstop = time.monotonic()
+                    backstop = False
+            if not order_ids:
+                break
+            lag = max(lag, (now - oldest).total_seconds())
+            n += self.cancel_expired(conn, order_ids, cutoff)
+
+        self.sweeps += 1
+        self.cancelled += n
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.last_sweep_seconds = time.perf_counter() - start
+        if conf.Metrics:
+            expiry_sweep_seconds.observe((), self.last_sweep_seconds)
+        if n:
+            logging.info("expiry sweep cancelled {} orders, lag {:.3f}s".format(n, lag))
+        return n
+
+    def cancel_expired(self, conn, order_ids: [str], cutoff: datetime = None) -> int:
+        # Cancel the still-unpaid orders among order_ids in one update, then
+        # restock all of their lines with one bulk write. The sweep id tells
+        # which orders this call actually cancelled, so a payment or another
+        # process racing on the same order is never restocked twice.
+        if cutoff is None:
+            cutoff = datetime.utcnow() - self.timeout
+        sweep_id = str(uuid.uuid1())
+        result = conn.col_order.update_many(
+            {"order_id": {"$in": order_ids}, "status": 0, "create_time": {"$lte": cutoff}},
+            {"$set": {"status": 4, "sweep_id": sweep_id}},
+        )
+        if result.modified_count == 0:
+            return 0
+        orders = list(conn.col_order.find(
+            {"order_id": {"$in": order_ids}, "sweep_id": sweep_id},
+            {"_id": 0, "order_id": 1, "store_id": 1},
+        ))
+        store_of = {o["order_id"]: o["store_id"] for o in orders}
+        restock = defaultdict(int)
+        for detail in conn.col_order_detail.find({"order_id": {"$in": list(store_of)}},
+                                                 {"_id": 0, "order_id": 1, "book_id": 1, "count": 1}):
+            restock[(store_of[detail["order_id"]], detail["book_id"])] += detail["count"]
+        if restock:
+            conn.col_inventory.bulk_write([
+                UpdateOne({"store_id": store_id, "book_id": book_id}, {"$inc": {"stock_level": count}})
+                for (store_id, book_id), count in restock.items()
+            ], ordered=False)
+        return len(orders)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._heap),
+            "sweeps": self.sweeps,
+            "cancelled": self.cancelled,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "last_sweep_seconds": self.last_sweep_seconds,
+        }
@@ -0,0 +1,54 @@
+import contextvars
+
+# Request-scoped identity map: the user and store documents read while
+# serving one request, so the models never read the same one twice. The
+# Flask app opens one per request (be/serve.py); outside a request there
+# is none and every lookup goes to Mongo.
+_current = contextvars.ContextVar("identity_map", default=None)
+
+# the fields any model reads from a user or store document
+USER_PROJECTION = {"_id": 1, "user_id": 1, "password": 1, "balance": 1, "token": 1}
+STORE_PROJECTION = {"_id": 0, "store_id": 1, "user_id": 1}
+
+
+class IdentityMap:
+    # id -> document; None records an id known not to exist. tokens holds
+    # the (code, message) of each (user_id, token) checked in the request
+    def __init__(self):
+        self.users = {}
+        self.stores = {}
+        self.tokens = {}
+
+
+def begin() -> contextvars.Token:
+    return _current.set(IdentityMap())
+
+
+def end(token: contextvars.Token):
+    _current.reset(token)
+
+
+def current() -> IdentityMap:
+    return _current.get()
+
+
+def preload(conn, user_id: str, store_id: str):
+    # the request's user and store in one round trip
+    identity_map = current()
+    docs = conn.col_user.aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$limit": 1},
+        {"$project": USER_PROJECTION},
+        {"$unionWith": {"coll": conn.col_store.name, "pipeline": [
+            {"$match": {"store_id": store_id}},
+            {"$limit": 1},
+            {"$project": STORE_PROJECTION},
+        ]}},
+    ])
+    identity_map.users[user_id] = None
+    identity_map.stores[store_id] = None
+    for doc in docs:
+        if "store_id" in doc:
+            identity_map.stores[store_id] = doc
+        else:
+            identity_map.users[user_id] = doc
@@ -0,0 +1,285 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from pymongo import monitoring
+from be import conf
+
+# upper bounds, in seconds, of every latency histogram
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    return ",".join('{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values))
+
+
+def _braces(labels: str) -> str:
+    return "{" + labels + "}" if labels else ""
+
+
+class Histogram:
+    # Prometheus histogram with fixed buckets, one series per tuple of label
+    # values; observe() is a bisect and two increments under a lock
+
+    def __init__(self, name: str, help: str, labelnames: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count of each bucket, count above the last bucket, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    @staticmethod
+    def add(a: list, b: list) -> list:
+        return [x + y for x, y in zip(a, b)]
+
+    def render(self, snapshot: dict = None) -> [str]:
+        if snapshot is None:
+            snapshot = self.snapshot()
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} histogram".format(self.name)]
+        for labels, series in sorted(snapshot.items()):
+            base = _labels(self.labelnames, labels)
+            prefix = base + "," if base else ""
+            count = 0
+            for bound, n in zip(self.buckets + ("+Inf",), series):
+                count += n
+                lines.append('{}_bucket{{{}le="{}"}} {}'.format(self.name, prefix, bound, count))
+            lines.append("{}_sum{} {}".format(self.name, _braces(base), series[-1]))
+            lines.append("{}_count{} {}".format(self.name, _braces(base), count))
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name: str, help: str, labelnames: tuple):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, n: int = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def add(a: int, b: int) -> int:
+        return a + b
+
+    def render(self, snapshot: dict = None) -> [str]:
+        if snapshot is None:
+            snapshot = self.snapshot()
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} counter".format(self.name)]
+        for labels, value in sorted(snapshot.items()):
+            lines.append("{}{} {}".format(self.name, _braces(_labels(self.labelnames, labels)), value))
+        return lines
+
+
+class Gauge:
+    # values read from callbacks when collected, for state the driver's
+    # listeners already keep; kind is the Prometheus type rendered
+
+    def __init__(self, name: str, help: str, labelnames: tuple, read, kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        # read() -> {labels: value}
+        self._read = read
+
+    def snapshot(self) -> dict:
+        return self._read()
+
+    @staticmethod
+    def add(a, b):
+        return a + b
+
+    def render(self, snapshot: dict = None) -> [str]:
+        if snapshot is None:
+            snapshot = self.snapshot()
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} {}".format(self.name, self.kind)]
+        for labels, value in sorted(snapshot.items()):
+            lines.append("{}{} {}".format(self.name, _braces(_labels(self.labelnames, labels)), value))
+        return lines
+
+
+# client ("sync", "async") -> function returning the PoolMetrics.stats() of
+# the current MongoClient of that kind, {} while there is none
+pool_sources = {}
+
+
+def track_pool(client: str, stats):
+    pool_sources[client] = stats
+
+
+def _pool_values(key: str):
+    def read() -> dict:
+        values = {}
+        for client, stats in list(pool_sources.items()):
+            current = stats()
+            if current:
+                values[(client,)] = current[key]
+        return values
+    return read
+
+
+http_request_seconds = Histogram(
+    "bookstore_http_request_duration_seconds",
+    "Time to serve a request, by route, method and status code.", ("route", "method", "status"))
+mongo_command_seconds = Histogram(
+    "bookstore_mongo_command_duration_seconds",
+    "MongoDB command round trip time, by command and collection.", ("command", "collection"))
+mongo_command_failures = Counter(
+    "bookstore_mongo_command_failures_total",
+    "MongoDB commands that failed, by command and collection.", ("command", "collection"))
+expiry_sweep_seconds = Histogram(
+    "bookstore_expiry_sweep_duration_seconds",
+    "Time of one sweep cancelling expired unpaid orders.", ())
+
+pool_checkouts = Gauge(
+    "bookstore_mongo_pool_checkouts_total",
+    "Connections checked out of the MongoDB pool, by client.", ("client",), _pool_values("checkouts"), "counter")
+pool_checkout_failures = Gauge(
+    "bookstore_mongo_pool_checkout_failures_total",
+    "Check-outs that failed, e.g. timed out waiting for a connection, by client.", ("client",),
+    _pool_values("checkout_failures"), "counter")
+pool_wait_seconds = Gauge(
+    "bookstore_mongo_pool_checkout_wait_seconds_total",
+    "Time check-outs waited for a connection, by client.", ("client",), _pool_values("wait_seconds"), "counter")
+pool_cleared = Gauge(
+    "bookstore_mongo_pool_cleared_total",
+    "Times the pool was cleared after a network error, by client.", ("client",), _pool_values("cleared"), "counter")
+pool_open = Gauge(
+    "bookstore_mongo_pool_connections",
+    "Connections open in this process's MongoDB pool, by client.", ("client",), _pool_values("open"))
+pool_checked_out = Gauge(
+    "bookstore_mongo_pool_checked_out",
+    "Connections checked out of this process's MongoDB pool now, by client.", ("client",),
+    _pool_values("checked_out"))
+
+REGISTRY = [http_request_seconds, mongo_command_seconds, mongo_command_failures, expiry_sweep_seconds,
+            pool_checkouts, pool_checkout_failures, pool_wait_seconds, pool_cleared]
+# the state of this process only: an exited worker's connections are gone,
+# so these are not summed over the workers' files
+LOCAL = [pool_open, pool_checked_out]
+
+
+class CommandMetrics(monitoring.CommandListener):
+    # command latency from the driver's command monitoring events; the
+    # collection is only in the started event, so it is kept until the
+    # command completes
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            # getMore names the collection separately, admin commands none
+            target = event.command.get("collection", "")
+        self._collections[(event.connection_id, event.request_id)] = target
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        mongo_command_seconds.observe((event.command_name, collection), event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        mongo_command_seconds.observe((event.command_name, collection), event.duration_micros / 1e6)
+        mongo_command_failures.inc((event.command_name, collection))
+
+
+command_listener = CommandMetrics()
+
+
+def listeners() -> list:
+    # event listeners for a new MongoClient
+    return [command_listener] if conf.Metrics else []
+
+
+# set by the pre-fork parent: each worker writes its snapshot to
+# <dir>/<pid>.json and /metrics in any worker sums them all
+_shared_dir = None
+
+
+def share(directory: str):
+    global _shared_dir
+    _shared_dir = directory
+
+
+def flush():
+    # this process's series, replaced atomically so readers never see
+    # half a file; kept after the worker exits, counters never go back
+    if _shared_dir is None:
+        return
+    path = os.path.join(_shared_dir, "{}.json".format(os.getpid()))
+    data = {metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+            for metric in REGISTRY}
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def start_flush(interval: float):
+    # other workers' series in /metrics lag by up to interval seconds
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                flush()
+            except OSError as e:
+                logging.error("metrics not written: {}".format(e))
+
+    threading.Thread(target=run, name="metrics-flush", daemon=True).start()
+
+
+def collect() -> [dict]:
+    # a snapshot per metric in REGISTRY, summed over all workers
+    snapshots = [metric.snapshot() for metric in REGISTRY]
+    if _shared_dir is None:
+        return snapshots
+    own = "{}.json".format(os.getpid())
+    for name in os.listdir(_shared_dir):
+        if name == own or not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(_shared_dir, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric, snapshot in zip(REGISTRY, snapshots):
+            for labels, value in data.get(metric.name, []):
+                labels = tuple(labels)
+                snapshot[labels] = metric.add(snapshot[labels], value) if labels in snapshot else value
+    return snapshots
+
+
+def render() -> str:
+    # every metric in the Prometheus text format
+    lines = [line for metric, snapshot in zip(REGISTRY, collect()) for line in metric.render(snapshot)]
+    lines += [line for metric in LOCAL for line in metric.render()]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,288 @@
+import heapq
+import math
+import re
+import threading
+from array import array
+from collections import Counter, defaultdict
+from itertools import accumulate, islice
+from be import conf
+from be.model.cache import version_stamps, CATALOG_VERSION
+
+# fields searched, with their weight in the term frequency
+FIELDS = {"title": 3, "tags": 2, "book_intro": 1, "content": 1}
+
+_token = re.compile(
+    r"[0-9a-z]+"
+    r"|[㐀-䶿一-鿿豈-﫿]+"
+)
+_cjk = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+
+def tokenize(text: str) -> [str]:
+    # latin words as they are, CJK runs as overlapping bigrams
+    tokens = []
+    for run in _token.findall(text.lower()):
+        if len(run) == 1 or _cjk.match(run) is None:
+            tokens.append(run)
+        else:
+            tokens.extend(map(str.__add__, run, run[1:]))
+    return tokens
+
+
+def _field_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return " ".join(str(v) for v in value)
+    return str(value)
+
+
+class Postings:
+    # doc ids are appended in increasing order and kept as gaps
+    __slots__ = ("gaps", "tfs", "last")
+
+    def __init__(self):
+        self.gaps = array("I")
+        self.tfs = array("H")
+        self.last = 0
+
+    def append(self, doc: int, tf: int):
+        self.gaps.append(doc - self.last)
+        self.tfs.append(tf if tf <= 0xFFFF else 0xFFFF)
+        self.last = doc
+
+    def docs(self):
+        return accumulate(self.gaps)
+
+    def nbytes(self) -> int:
+        return self.gaps.itemsize * len(self.gaps) + self.tfs.itemsize * len(self.tfs)
+
+
+class InvertedIndexEngine:
+    # BM25 over an in-memory index of this process. The index remembers the
+    # catalog version stamp it reflects; a book added by another worker moves
+    # the stamp on, and the next search rebuilds the index from the catalog.
+    name = "inverted"
+    k1 = 1.2
+    b = 0.75
+    store_check_batch = 500
+    # compact once a quarter of the doc ids belong to replaced entries
+    compact_min = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._reset()
+
+    def _reset(self):
+        self._built = False
+        self._postings = defaultdict(Postings)
+        self._book_ids = []
+        self._doc_of = {}
+        self._doc_len = array("I")
+        self._deleted = set()
+        self._total_len = 0
+
+    def _add(self, book: dict):
+        book_id = book.get("id")
+        if book_id is None:
+            return
+        old = self._doc_of.get(book_id)
+        if old is not None:
+            self._deleted.add(old)
+            self._total_len -= self._doc_len[old]
+        doc = len(self._book_ids)
+        tokens = []
+        for field, weight in FIELDS.items():
+            tokens.extend(tokenize(_field_text(book.get(field))) * weight)
+        tf = Counter(tokens)
+        for token, n in tf.items():
+            self._postings[token].append(doc, n)
+        length = len(tokens)
+        self._book_ids.append(book_id)
+        self._doc_of[book_id] = doc
+        self._doc_len.append(length)
+        self._total_len += length
+        if len(self._deleted) >= self.compact_min and len(self._deleted) * 4 >= len(self._book_ids):
+            self._compact()
+
+    def _compact(self):
+        # renumber the live docs in order, so postings stay increasing
+        remap = {}
+        book_ids = []
+        doc_len = array("I")
+        for doc, book_id in enumerate(self._book_ids):
+            if doc not in self._deleted:
+                remap[doc] = len(book_ids)
+                book_ids.append(book_id)
+                doc_len.append(self._doc_len[doc])
+        postings = defaultdict(Postings)
+        for term, old in self._postings.items():
+            for doc, tf in zip(old.docs(), old.tfs):
+                new = remap.get(doc)
+                if new is not None:
+                    postings[term].append(new, tf)
+        self._postings = postings
+        self._book_ids = book_ids
+        self._doc_of = {book_id: doc for doc, book_id in enumerate(book_ids)}
+        self._doc_len = doc_len
+        self._deleted = set()
+
+    def build(self, books):
+        with self._lock:
+            for book in books:
+                self._add(book)
+            self._built = True
+
+    def ensure_built(self, conn):
+        version = version_stamps.get(CATALOG_VERSION)
+        if self._built and self._version == version:
+            return
+        projection = {"_id": 0, "id": 1}
+        for field in FIELDS:
+            projection[field] = 1
+        with self._lock:
+            # read before the scan: a book added meanwhile forces another build
+            version = version_stamps.get(CATALOG_VERSION)
+            if self._built and self._version == version:
+                return
+            self._reset()
+            for book in conn.col_book.find({}, projection):
+                self._add(book)
+            self._version = version
+            self._built = True
+
+    def add(self, book: dict, version: int):
+        # called on add_book with the catalog version it bumped to; before
+        # the first build, or if another worker's book came in between, the
+        # next search rebuilds instead
+        with self._lock:
+            if self._built and self._version == version - 1:
+                self._add(book)
+                self._version = version
+
+    def _scores(self, query: str) -> ([(float, int)], [str]):
+        # (-score, doc) of every matching doc, and the doc id -> book id list
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._book_ids) - len(self._deleted)
+            if not terms or n <= 0:
+                return [], self._book_ids
+            avg_len = self._total_len / n
+            k1 = self.k1
+            b = self.b
+            doc_len = self._doc_len
+            deleted = self._deleted
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                df = len(postings.gaps)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for doc, tf in zip(postings.docs(), postings.tfs):
+                    norm = k1 * (1 - b + b * doc_len[doc] / avg_len)
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+            # book ids are only appended, or replaced by a new list
+            return [(-score, doc) for doc, score in scores.items() if doc not in deleted], self._book_ids
+
+    def rank(self, query: str, limit: int = None) -> [str]:
+        # the best limit book ids, all of them when limit is None
+        scores, book_ids = self._scores(query)
+        if limit is None:
+            scores.sort()
+        else:
+            scores = heapq.nsmallest(limit, scores)
+        return [book_ids[doc] for _, doc in scores]
+
+    def ranked(self, query: str):
+        # book ids, best first, popped from a heap as they are consumed
+        scores, book_ids = self._scores(query)
+        heapq.heapify(scores)
+        while scores:
+            yield book_ids[heapq.heappop(scores)[1]]
+
+    def search(self, conn, query: str, store_id: str, skip: int, limit: int,
+               projection: dict = None) -> [dict]:
+        self.ensure_built(conn)
+        if store_id == "":
+            ranked = self.rank(query, skip + limit)
+        else:
+            # walk the ranking in batches until the page is covered
+            ranked = []
+            it = self.ranked(query)
+            while len(ranked) < skip + limit:
+                batch = list(islice(it, self.store_check_batch))
+                if not batch:
+                    break
+                found = {r["book_id"] for r in conn.col_inventory.find(
+                    {"store_id": store_id, "book_id": {"$in": batch}}, {"_id": 0, "book_id": 1})}
+                ranked.extend(book_id for book_id in batch if book_id in found)
+        page = ranked[skip:skip + limit]
+        if not page:
+            return []
+        # projection has to keep the id field
+        books = {}
+        for book in conn.col_book.find({"id": {"$in": page}}, projection or {"_id": 0}):
+            books.setdefault(book["id"], book)
+        return [books[book_id] for book_id in page if book_id in books]
+
+    def stats(self) -> dict:
+        return {
+            "docs": len(self._book_ids) - len(self._deleted),
+            "terms": len(self._postings),
+            "postings": sum(len(p.gaps) for p in self._postings.values()),
+            "postings_bytes": sum(p.nbytes() for p in self._postings.values()),
+        }
+
+
+class MongoTextEngine:
+    # MongoDB $text index; does not segment Chinese
+    name = "mongo"
+
+    def add(self, book: dict, version: int):
+        pass
+
+    def search(self, conn, query: str, store_id: str, skip: int, limit: int,
+               projection: dict = None) -> [dict]:
+        pipeline = [
+            {"$match": {"$text": {"$search": query}}},
+            {"$sort": {"score": {"$meta": "textScore"}}},
+        ]
+        if store_id != "":
+            pipeline += [
+                {"$lookup": {
+                    "from": conn.col_inventory.name,
+                    "localField": "id",
+                    "foreignField": "book_id",
+                    "pipeline": [{"$match": {"store_id": store_id}}, {"$project": {"_id": 1}}],
+                    "as": "in_store",
+                }},
+                {"$match": {"in_store": {"$ne": []}}},
+            ]
+        pipeline += [
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "in_store": 0}},
+        ]
+        if projection:
+            pipeline.append({"$project": projection})
+        return list(conn.col_book.aggregate(pipeline))
+
+
+engines = {
+    MongoTextEngine.name: MongoTextEngine(),
+    InvertedIndexEngine.name: InvertedIndexEngine(),
+}
+
+
+def get_engine(name: str = None):
+    return engines.get(name or conf.Search_Engine)
+
+
+def index_book(book: dict):
+    # after a new catalog entry is inserted: moves the catalog version on,
+    # which also drops cached searches in every worker
+    version = version_stamps.bump(CATALOG_VERSION)
+    for engine in engines.values():
+        engine.add(book, version)
@@ -1,7 +1,71 @@
 import sqlite3 as sqlite
 import json
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from be.model import error
 from be.model import db_conn
+from be.model import store
+from be.model.cache import version_stamps, store_version
+from be.model import search_engine
+from be.model.bloom import store_filter, book_filter, book_key
+from be.model.buyer import paid_order
+
+
+def inventory_row(store_id: str, book_id: str, stock_level: int, book: dict) -> dict:
+    # the price is the listing store's own, orders are charged from it
+    return {"store_id": store_id, "book_id": book_id, "stock_level": stock_level, "price": book.get("price")}
+
+
+def check_listing(user_id: str, store_id: str, book_id: str, user_exist: bool, store_exist: bool,
+                  book_exist: bool, listed: bool):
+    # the error for listing book_id in store_id (listed False) or changing
+    # its stock (listed True); None when allowed
+    if not user_exist:
+        return error.error_non_exist_user_id(user_id)
+    if not store_exist:
+        return error.error_non_exist_store_id(store_id)
+    if book_exist and not listed:
+        return error.error_exist_book_id(book_id)
+    if not book_exist and listed:
+        return error.error_non_exist_book_id(book_id)
+    return None
+
+
+def check_new_store(user_id: str, store_id: str, user_exist: bool, store_exist: bool):
+    if not user_exist:
+        return error.error_non_exist_user_id(user_id)
+    if store_exist:
+        return error.error_exist_store_id(store_id)
+    return None
+
+
+def stock_update(store_id: str, book_id: str, add_stock_level: int) -> (dict, dict):
+    return {"store_id": store_id, "book_id": book_id}, {"$inc": {"stock_level": add_stock_level}}
+
+
+def check_deliver(order: dict, order_id: str):
+    # the error for delivering order, read with buyer.paid_order; None when
+    # it may be marked sent
+    if order is None:
+        return error.error_invalid_order_id(order_id)
+    if order.get("status") in (2, 3):
+        return error.error_books_repeat_deliver()
+    return None
+
+
+def catalog_upsert(book_id: str, book: dict) -> (dict, dict):
+    # The first description of a book id becomes the shared catalog entry;
+    # listings by other stores never modify it, so no store can rewrite
+    # what another one shows and cached catalog entries never go stale.
+    book["id"] = book_id
+    return {"id": book_id}, {"$setOnInsert": book}
+
+
+def catalog_added(book: dict) -> [UpdateOne]:
+    # after a new catalog entry: index it, drop cached searches, and return
+    # the tag dictionary updates to write
+    search_engine.index_book(book)
+    return [UpdateOne({"tag": tag}, {"$inc": {"count": 1}}, upsert=True) for tag in set(book.get("tags") or [])]
 
 
 class Seller(db_conn.DBConn):
@@ -17,12 +81,10 @@ class Seller(db_conn.DBConn):
             stock_level: int,
     ):
         try:
-            if not self.user_id_exist(user_id):
-                return error.error_non_exist_user_id(user_id)
-            if not self.store_id_exist(store_id):
-                return error.error_non_exist_store_id(store_id)
-            if self.book_id_exist(store_id, book_id):
-                return error.error_exist_book_id(book_id)
+            failure = check_listing(user_id, store_id, book_id, self.user_id_exist(user_id),
+                                    self.store_id_exist(store_id), self.book_id_exist(store_id, book_id), False)
+            if failure is not None:
+                return failure
             '''
             self.conn.execute(
                 "INSERT into store(store_id, book_id, book_info, stock_level)"
@@ -31,27 +93,41 @@ class Seller(db_conn.DBConn):
             )
             self.conn.commit()
             '''
-            col_store = self.conn.database["store"]
-            col_store.update_one({"store_id": store_id},
-                                 {"$push": {"books": {"book_id": book_id, "stock_level": stock_level}}})
+            # pictures go to the content-addressed store, the book keeps references
+            book = json.loads(book_json_str)
+            book["pictures"] = store.store_pictures(self.conn.pictures, book.get("pictures"))
 
-            self.conn.col_book.insert_one(json.loads(book_json_str))
+            book_filter.add(book_key(store_id, book_id))
+            self.conn.col_inventory.insert_one(inventory_row(store_id, book_id, stock_level, book))
+            if self._insert_book(book_id, book):
+                changes = catalog_added(book)
+                if changes:
+                    self.conn.col_tag.bulk_write(changes, ordered=False)
+            version_stamps.bump(store_version(store_id))
         except sqlite.Error as e:
             return 528, "{}".format(str(e))
         except BaseException as e:
             return 530, "{}".format(str(e))
         return 200, "ok"
 
+    def _insert_book(self, book_id: str, book: dict) -> bool:
+        # True when this listing created the catalog entry
+        try:
+            return self.conn.col_book.find_one_and_update(
+                *catalog_upsert(book_id, book), projection={"_id": 1},
+                upsert=True, return_document=ReturnDocument.BEFORE) is None
+        except DuplicateKeyError:
+            # lost an insert race on the unique id to another listing
+            return False
+
     def add_stock_level(
             self, user_id: str, store_id: str, book_id: str, add_stock_level: int
     ):
         try:
-            if not self.user_id_exist(user_id):
-                return error.error_non_exist_user_id(user_id)
-            if not self.store_id_exist(store_id):
-                return error.error_non_exist_store_id(store_id)
-            if not self.book_id_exist(store_id, book_id):
-                return error.error_non_exist_book_id(book_id)
+            failure = check_listing(user_id, store_id, book_id, self.user_id_exist(user_id),
+                                    self.store_id_exist(store_id), self.book_id_exist(store_id, book_id), True)
+            if failure is not None:
+                return failure
             '''
             self.conn.execute(
                 "UPDATE store SET stock_level = stock_level + ? "
@@ -61,9 +137,8 @@ class Seller(db_conn.DBConn):
             self.conn.commit()
             '''
 
-            col_store = self.conn.database["store"]
-            col_store.update_one({'store_id': store_id, 'books.book_id': book_id},
-                                 {'$inc': {'books.$.stock_level': add_stock_level}})
+            self.conn.col_inventory.update_one(*stock_update(store_id, book_id, add_stock_level))
+            version_stamps.bump(store_version(store_id))
 
 
         except sqlite.Error as e:
@@ -74,10 +149,9 @@ class Seller(db_conn.DBConn):
 
     def create_store(self, user_id: str, store_id: str) -> (int, str):
         try:
-            if not self.user_id_exist(user_id):
-                return error.error_non_exist_user_id(user_id)
-            if self.store_id_exist(store_id):
-                return error.error_exist_store_id(store_id)
+            failure = check_new_store(user_id, store_id, self.user_id_exist(user_id), self.store_id_exist(store_id))
+            if failure is not None:
+                return failure
             '''
             self.conn.execute(
                 "INSERT into user_store(store_id, user_id)" "VALUES (?, ?)",
@@ -88,10 +162,11 @@ class Seller(db_conn.DBConn):
             col_store = self.conn.database["store"]
             new_store = {
                 'store_id': store_id,
-                'user_id': user_id,
-                "books": []
+                'user_id': user_id
             }
+            store_filter.add(store_id)
             col_store.insert_one(new_store)
+            self.forget_store(store_id)
 
         except sqlite.Error as e:
             return 528, "{}".format(str(e))
@@ -99,32 +174,19 @@ class Seller(db_conn.DBConn):
             return 530, "{}".format(str(e))
         return 200, "ok"
     
-    def deliver(self,user_id:str,order_id:str) -> (int, str):
+    def deliver(self, user_id: str, order_id: str) -> (int, str):
         try:
             col_order = self.conn.database["order"]
-            query = {  
-                "$or": [
-                    {"order_id": order_id, "status": 1},
-                    {"order_id": order_id, "status": 2},
-                    {"order_id": order_id, "status": 3},
-                ]   
-            }
-            result = col_order.find_one(query)
-
-            if result == None:
-                return error.error_invalid_order_id(order_id)
-            status = result.get("status")
-
-            if status == 2 or status == 3:
-                return error.error_books_repeat_deliver()
+            query = paid_order(order_id)
+            # the status is in the (order_id, status) index
+            result = col_order.find_one(query, store.key_projection(query))
+            failure = check_deliver(result, order_id)
+            if failure is not None:
+                return failure
 
             col_order.update_one({"order_id": order_id}, {"$set": {"status": 2}})
-            
-            
-            
         except sqlite.Error as e:
-            return 528,"{}".format(str(e))
+            return 528, "{}".format(str(e))
         except BaseException as e:
-            return 530,"{}".format(str(e))
-        
-        return 200,"ok"
\ No newline at end of file
+            return 530, "{}".format(str(e))
+        return 200, "ok"
@@ -1,61 +1,606 @@
+import base64
 import logging
 import os
-import sqlite3 as sqlite
+import re
 import threading
+import time
+from datetime import datetime
 import pymongo
 import pymongo.errors as mongo_error
+from pymongo import UpdateOne, WriteConcern, monitoring, read_preferences
+from pymongo.read_concern import ReadConcern
+from be import conf
+from be.model.blob import BlobStore
+from be.model import metrics
+from be.model.bloom import rebuild_filters
+from be.model.pool import PoolMetrics
 
 
-class Store:
+# collection -> every index the model layer relies on, as (keys, options)
+INDEXES = {
+    "user": [
+        ([("user_id", 1)], {"unique": True}),
+    ],
+    "store": [
+        ([("store_id", 1)], {"unique": True}),
+    ],
+    "inventory": [
+        ([("store_id", 1), ("book_id", 1)], {"unique": True}),
+    ],
+    "books": [
+        ([("id", 1)], {"unique": True}),
+        # searches page by id, so the id follows the searched field
+        ([("title", 1), ("id", 1)], {}),
+        ([("author", 1), ("id", 1)], {}),
+        ([("tags", 1), ("id", 1)], {}),
+        ([("title", "text"), ("tags", "text"), ("book_intro", "text"), ("content", "text")], {}),
+    ],
+    "tag": [
+        ([("tag", 1)], {"unique": True}),
+        ([("count", -1)], {}),
+    ],
+    "order": [
+        ([("order_id", 1), ("status", 1)], {}),
+        ([("user_id", 1), ("create_time", -1), ("order_id", -1)], {}),
+        ([("status", 1), ("create_time", 1)], {}),
+    ],
+    "order_detail": [
+        ([("order_id", 1)], {}),
+    ],
+}
 
-    def __init__(self, db_url):
-        self.myclient = pymongo.MongoClient(db_url)
-        self.database = self.myclient["bookstore_db"]
-        self.init_tables()
+def key_projection(condition: dict) -> dict:
+    # only the fields the condition tests, without _id: a find_one with it
+    # is covered by an index over those fields and never reads the document
+    projection = {"_id": 0}
+    for field, value in condition.items():
+        if field in ("$or", "$and"):
+            for branch in value:
+                projection.update(key_projection(branch))
+        elif not field.startswith("$"):
+            projection[field] = 1
+    return projection
+
+
+def index_name(keys) -> str:
+    return "_".join("{}_{}".format(field, direction) for field, direction in keys)
+
+
+def ensure_indexes(database) -> [str]:
+    # create what is missing, never drop: an index that exists under the same
+    # name with other options is reported and left alone
+    created = []
+    for collection, indexes in INDEXES.items():
+        col = database[collection]
+        existing = col.index_information()
+        for keys, options in indexes:
+            name = index_name(keys)
+            if name in existing:
+                continue
+            try:
+                created.append(col.create_index(keys, name=name, **options))
+            except mongo_error.OperationFailure as e:
+                logging.error("index {}.{}: {}".format(collection, name, e))
+    return created
+
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+
+class QueryShapes(monitoring.CommandListener):
+    # The shape of every query sent once recording has started: collection,
+    # filter with the values replaced by placeholders, sort, projection and
+    # hint. fe/conftest.py records the whole test run and
+    # fe/test/test_index.py explains each shape at the end, so the checked
+    # queries are exactly the ones the models issue.
+
+    def __init__(self):
+        self.recording = False
+        self._shapes = {}
+        self._lock = threading.Lock()
+
+    def shapes(self) -> [tuple]:
+        with self._lock:
+            return list(self._shapes.values())
+
+    def _add(self, collection, condition, sort=None, projection=None, hint=None, limit=0):
+        if not isinstance(collection, str) or not isinstance(condition, dict):
+            return
+        shape = (collection, placeholders(condition), list((sort or {}).items()) or None,
+                 dict(projection) if projection else None, hint, limit == 1)
+        with self._lock:
+            self._shapes.setdefault(repr(shape), shape)
+
+    def _add_pipeline(self, collection, pipeline):
+        # the leading $match (and $sort) picks the index, as do the joins
+        if not pipeline:
+            return
+        first = pipeline[0].get("$match")
+        if first is not None:
+            sort = pipeline[1].get("$sort") if len(pipeline) > 1 else None
+            self._add(collection, first, sort)
+        for stage in pipeline:
+            join = stage.get("$lookup")
+            if join is not None:
+                sub = join.get("pipeline") or []
+                condition = dict(sub[0].get("$match", {})) if sub else {}
+                if "foreignField" in join:
+                    condition[join["foreignField"]] = ""
+                self._add(join["from"], condition)
+            union = stage.get("$unionWith")
+            if union is not None:
+                self._add_pipeline(union["coll"], union.get("pipeline"))
+
+    def started(self, event):
+        if not self.recording:
+            return
+        command = event.command
+        name = event.command_name
+        collection = command.get(name)
+        if name == "find":
+            self._add(collection, command.get("filter", {}), command.get("sort"), command.get("projection"),
+                      command.get("hint"), command.get("limit", 0))
+        elif name == "aggregate":
+            self._add_pipeline(collection, command.get("pipeline"))
+        elif name == "findAndModify":
+            self._add(collection, command.get("query", {}), command.get("sort"))
+        elif name in ("count", "distinct"):
+            self._add(collection, command.get("query", {}))
+        elif name in ("update", "delete"):
+            for statement in command.get("updates", command.get("deletes", [])):
+                self._add(collection, statement.get("q", {}))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+query_shapes = QueryShapes()
+
+# operators whose array holds whole filters rather than values
+LOGICAL_OPERATORS = ("$or", "$and", "$nor")
+
+
+def placeholders(value):
+    # the same shape with other ids: strings, numbers and dates become fixed
+    # values, value arrays ($in, $nin, ...) keep one element, and every
+    # branch of $or/$and/$nor is kept; anchored regexes stay anchored
+    if isinstance(value, dict):
+        return {k: ("^x" if str(v).startswith("^") else "x") if k == "$regex"
+                else [placeholders(branch) for branch in v] if k in LOGICAL_OPERATORS
+                else placeholders(v)
+                for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [placeholders(value[0])] if value else []
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return 0
+    if isinstance(value, datetime):
+        return datetime(1970, 1, 1)
+    if isinstance(value, str):
+        return ""
+    return value
+
+
+def shape_listeners() -> list:
+    return [query_shapes] if conf.Record_Query_Shapes else []
+
+
+def coverable(collection: str, condition: dict, projection: dict) -> bool:
+    # a lookup returning only fields of an index over the filtered fields;
+    # the index alone can answer it
+    if not projection or projection.get("_id", 1) != 0:
+        return False
+    wanted = {field for field, on in projection.items() if on and field != "_id"}
+    tested = set(key_projection(condition)) - {"_id"}
+    for keys, _ in INDEXES.get(collection, []):
+        fields = {field for field, direction in keys if direction in (1, -1)}
+        if len(fields) == len(keys) and wanted <= fields and tested <= fields:
+            return True
+    return False
+
+
+def _winning_plan(database, collection, condition, sort=None, projection=None, hint=None, limit=0):
+    cursor = database[collection].find(condition, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    if hint:
+        cursor = cursor.hint(hint)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor.explain()["queryPlanner"]["winningPlan"]
+
+
+def explain_collscans(database, shapes: [tuple]) -> [(str, dict)]:
+    # shapes as recorded by QueryShapes; an unfiltered, unsorted query is a
+    # full scan by intent (index and filter rebuilds)
+    collscans = []
+    for collection, condition, sort, projection, hint, one in shapes:
+        if not condition and not sort:
+            continue
+        plan = _winning_plan(database, collection, condition, sort, None, hint)
+        if "COLLSCAN" in _plan_stages(plan):
+            collscans.append((collection, condition))
+    return collscans
+
+
+def explain_fetches(database, shapes: [tuple]) -> [(str, dict)]:
+    # the single-document lookups an index can answer must not read documents
+    fetches = []
+    for collection, condition, sort, projection, hint, one in shapes:
+        if not one or not coverable(collection, condition, projection):
+            continue
+        stages = set(_plan_stages(_winning_plan(database, collection, condition, sort, projection, hint, 1)))
+        if "FETCH" in stages or "COLLSCAN" in stages:
+            fetches.append((collection, condition))
+    return fetches
+
+
+# 1: stock embedded in store.books, 2: inventory collection, 3: tag dictionary,
+# 4: pictures in the content-addressed picture store, 5: one catalog entry per book id,
+# 6: price per listing in inventory, 7: no (store_id, user_id) store index
+SCHEMA_VERSION = 7
+PICTURE_BUCKET = "picture"
+_picture_ref = re.compile(r"^[0-9a-f]{64}$")
+
+
+def store_pictures(pictures: BlobStore, encoded: [str]) -> [str]:
+    # base64 pictures as sent by add_book -> blob references
+    return [pictures.put(base64.b64decode(p)) for p in encoded or []]
+
+
+def migrate_store_inventory(database, batch_size: int = 1000) -> (int, int):
+    # Move embedded store.books arrays into the inventory collection. Safe to
+    # re-run: existing inventory rows are never overwritten and a store's
+    # array is only removed once all of its rows are written.
+    col_store = database["store"]
+    col_inventory = database["inventory"]
+    col_inventory.create_index([("store_id", 1), ("book_id", 1)], unique=True,
+                               name=index_name([("store_id", 1), ("book_id", 1)]))
+
+    n_store = 0
+    n_book = 0
+    for store in col_store.find({"books": {"$exists": True}}, {"store_id": 1, "books": 1}):
+        store_id = store["store_id"]
+        books = store.get("books") or []
+        for i in range(0, len(books), batch_size):
+            col_inventory.bulk_write([
+                UpdateOne({"store_id": store_id, "book_id": b["book_id"]},
+                          {"$setOnInsert": {"stock_level": b.get("stock_level", 0)}},
+                          upsert=True)
+                for b in books[i:i + batch_size]
+            ], ordered=False)
+        col_store.update_one({"_id": store["_id"]}, {"$unset": {"books": ""}})
+        n_store += 1
+        n_book += len(books)
+        logging.info("migrated store {}: {} books".format(store_id, len(books)))
+    return n_store, n_book
+
+
+def migrate_tag_dictionary(database) -> int:
+    # build the tag popularity counts for books added before they existed
+    col_tag = database["tag"]
+    col_tag.create_index([("tag", 1)], unique=True, name=index_name([("tag", 1)]))
+    database["books"].aggregate([
+        {"$project": {"_id": 0, "tags": {"$setUnion": [{"$ifNull": ["$tags", []]}, []]}}},
+        {"$unwind": "$tags"},
+        {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
+        {"$project": {"_id": 0, "tag": "$_id", "count": 1}},
+        {"$merge": {"into": "tag", "on": "tag", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ])
+    return col_tag.estimated_document_count()
 
-    def init_tables(self):
-        try:
 
-            self.database["user"].drop()
-            self.col_user = self.database["user"]
-            self.col_user.create_index([("user_id", 1)], unique=True)
+def migrate_book_pictures(database) -> int:
+    # replace inline base64 pictures by references into the picture store;
+    # books already holding references are left alone, so it can be re-run
+    pictures = BlobStore(database, PICTURE_BUCKET)
+    col_book = database["books"]
+    n = 0
+    for book in col_book.find({"pictures.0": {"$exists": True}}, {"_id": 1, "pictures": 1}):
+        if all(_picture_ref.match(p) for p in book["pictures"]):
+            continue
+        refs = [p if _picture_ref.match(p) else pictures.put(base64.b64decode(p)) for p in book["pictures"]]
+        col_book.update_one({"_id": book["_id"]}, {"$set": {"pictures": refs}})
+        n += 1
+    return n
 
-            self.database["store"].drop()
-            self.col_store = self.database["store"]
-            self.col_store.create_index([("store_id", 1)], unique=True)
 
-            self.database["book"].drop()
-            self.col_book = self.database['books']
-            self.col_book.create_index(
-                [("title", "text"), ("tags", "text"), ("book_intro", "text"), ("content", "text")])
+def migrate_catalog_unique(database, batch_size: int = 1000) -> int:
+    # add_book used to insert one copy of a book per store. Keep the most
+    # recent copy of every id, make the id index unique and recount the tag
+    # dictionary, which counted every copy.
+    col_book = database["books"]
+    removed = 0
+    duplicates = col_book.aggregate([
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": "$id", "keep": {"$last": "$_id"}, "all": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    stale = []
+    for group in duplicates:
+        stale.extend(_id for _id in group["all"] if _id != group["keep"])
+        if len(stale) >= batch_size:
+            removed += col_book.delete_many({"_id": {"$in": stale}}).deleted_count
+            stale = []
+    if stale:
+        removed += col_book.delete_many({"_id": {"$in": stale}}).deleted_count
 
-            self.database["order_detail"].drop()
-            self.col_order_detail = self.database['order_detail']
+    name = index_name([("id", 1)])
+    existing = col_book.index_information().get(name)
+    if existing is not None and not existing.get("unique"):
+        col_book.drop_index(name)
+    col_book.create_index([("id", 1)], unique=True, name=name)
+    database["tag"].drop()
+    migrate_tag_dictionary(database)
+    logging.info("catalog: removed {} duplicate books".format(removed))
+    return removed
 
-            self.database["order"].drop()
-            self.col_order = self.database['order']
+
+def migrate_inventory_price(database, batch_size: int = 1000) -> int:
+    # orders are charged the listing's own price; copy the catalog price
+    # into the inventory rows written before listings had one
+    col_inventory = database["inventory"]
+    n = 0
+    rows = []
+
+    def flush():
+        prices = {b["id"]: b.get("price") for b in database["books"].find(
+            {"id": {"$in": list({r["book_id"] for r in rows})}}, {"_id": 0, "id": 1, "price": 1})}
+        return col_inventory.bulk_write([
+            UpdateOne({"_id": r["_id"]}, {"$set": {"price": prices.get(r["book_id"])}}) for r in rows
+        ], ordered=False).modified_count
+
+    for row in col_inventory.find({"price": {"$exists": False}}, {"_id": 1, "book_id": 1}):
+        rows.append(row)
+        if len(rows) >= batch_size:
+            n += flush()
+            rows = []
+    if rows:
+        n += flush()
+    logging.info("inventory: priced {} listings".format(n))
+    return n
+
+
+def migrate_drop_store_owner_index(database) -> int:
+    # the owner lookup reads the two-field store document instead; owners
+    # are cached per process, so the index only cost every create_store
+    name = index_name([("store_id", 1), ("user_id", 1)])
+    if name not in database["store"].index_information():
+        return 0
+    database["store"].drop_index(name)
+    return 1
+
+
+MIGRATIONS = {
+    2: migrate_store_inventory,
+    3: migrate_tag_dictionary,
+    4: migrate_book_pictures,
+    5: migrate_catalog_unique,
+    6: migrate_inventory_price,
+    7: migrate_drop_store_owner_index,
+}
+
+
+def client_options() -> dict:
+    # MongoClient pool, timeout and compression settings from be/conf.py
+    options = {
+        "maxPoolSize": conf.Mongo_Max_Pool_Size,
+        "minPoolSize": conf.Mongo_Min_Pool_Size,
+        "serverSelectionTimeoutMS": conf.Mongo_Server_Selection_Timeout_MS,
+        "connectTimeoutMS": conf.Mongo_Connect_Timeout_MS,
+    }
+    if conf.Mongo_Wait_Queue_Timeout_MS > 0:
+        options["waitQueueTimeoutMS"] = conf.Mongo_Wait_Queue_Timeout_MS
+    if conf.Mongo_Socket_Timeout_MS > 0:
+        options["socketTimeoutMS"] = conf.Mongo_Socket_Timeout_MS
+    if conf.Mongo_Compressors != "":
+        options["compressors"] = conf.Mongo_Compressors
+    return options
+
+
+# operation classes, each with its own write concern, read concern and read
+# preference (see PROFILES)
+ORDER_WRITE = "order-write"          # new orders with their stock reservation, expiry
+SETTLEMENT = "settlement"            # payment, add_funds, cancellation refunds
+CATALOG_READ = "catalog-read"        # book, tag and content searches
+HISTORY_READ = "history-read"        # order history
+
+# Orders and settlements are acknowledged once a majority of the replica set
+# has them, so a failover cannot roll back a reservation or a payment;
+# settlement also reads at majority and never acts on a balance that could
+# be rolled back. Catalog and history reads take their read preference from
+# be/conf.py; it defaults to the primary, since a lagging secondary does not
+# show a book just added or an order just paid.
+PROFILES = {
+    ORDER_WRITE: (WriteConcern(w="majority"), ReadConcern("local"), "primary"),
+    SETTLEMENT: (WriteConcern(w="majority", j=True), ReadConcern("majority"), "primary"),
+    CATALOG_READ: (WriteConcern(), ReadConcern("local"), conf.Catalog_Read_Preference),
+    HISTORY_READ: (WriteConcern(), ReadConcern("majority"), conf.History_Read_Preference),
+}
+
+READ_PREFERENCES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+
+def read_preference(mode: str):
+    if mode not in READ_PREFERENCES:
+        raise ValueError("unknown read preference {!r}, expected one of {}".format(mode, ", ".join(READ_PREFERENCES)))
+    if mode == "primary":
+        return read_preferences.Primary()
+    return READ_PREFERENCES[mode](max_staleness=conf.Max_Staleness_Seconds)
+
+
+def reads_primary(name: str) -> bool:
+    # whether every read of an operation class sees the latest writes
+    return not conf.Concern_Profiles or PROFILES[name][2] == "primary"
+
+
+def profile_options(name: str) -> dict:
+    # with_options() arguments of an operation class; the client defaults
+    # when the profiles are turned off
+    if not conf.Concern_Profiles:
+        return {}
+    write_concern, read_concern, mode = PROFILES[name]
+    return {"write_concern": write_concern, "read_concern": read_concern,
+            "read_preference": read_preference(mode)}
+
+
+class Profile:
+    # the collections of a Store (or AsyncStore) under one operation class;
+    # views over the same client and connection pool
+
+    def __init__(self, database, name: str):
+        self.name = name
+        self.database = database.with_options(**profile_options(name))
+        self.col_user = self.database["user"]
+        self.col_store = self.database["store"]
+        self.col_inventory = self.database["inventory"]
+        self.col_book = self.database["books"]
+        self.col_tag = self.database["tag"]
+        self.col_order_detail = self.database["order_detail"]
+        self.col_order = self.database["order"]
+
+
+class Store:
+
+    def __init__(self, db_url, db_name: str = conf.DB_Name, reset: bool = conf.Reset_On_Start,
+                 init: bool = True):
+        self.db_url = db_url
+        self.db_name = db_name
+        self.pool_metrics = PoolMetrics()
+        self.myclient = pymongo.MongoClient(db_url, event_listeners=[self.pool_metrics] + metrics.listeners() + shape_listeners(),
+                                            **client_options())
+        self.database = self.myclient[db_name]
+        self.col_meta = self.database["meta"]
+        self.col_user = self.database["user"]
+        self.col_store = self.database["store"]
+        self.col_inventory = self.database["inventory"]
+        self.col_book = self.database["books"]
+        self.col_tag = self.database["tag"]
+        self.col_order_detail = self.database["order_detail"]
+        self.col_order = self.database["order"]
+        self.pictures = BlobStore(self.database, PICTURE_BUCKET)
+        self.profiles = {name: Profile(self.database, name) for name in PROFILES}
+        start = time.perf_counter()
+        if reset:
+            self.reset_tables()
+        if init:
+            self.init_tables()
+        self.init_seconds = time.perf_counter() - start
+
+    def reset_tables(self):
+        # destructive: only on explicit request
+        for collection in list(INDEXES) + [self.col_meta.name]:
+            self.database[collection].drop()
+        self.pictures.drop()
+
+    def init_tables(self):
+        try:
+            meta = self.col_meta.find_one({"_id": "schema"})
+            if meta is None and self.col_user.estimated_document_count() == 0:
+                # empty database, nothing to migrate
+                version = SCHEMA_VERSION
+            else:
+                version = meta["version"] if meta else 1
+            for target in sorted(MIGRATIONS):
+                if version < target:
+                    MIGRATIONS[target](self.database)
+            ensure_indexes(self.database)
+            if version != SCHEMA_VERSION or meta is None:
+                self.col_meta.update_one({"_id": "schema"},
+                                         {"$set": {"version": SCHEMA_VERSION}}, upsert=True)
 
         except mongo_error.PyMongoError as e:
             logging.error(e)
 
+    def for_profile(self, name: str) -> Profile:
+        return self.profiles[name]
+
     def get_db_conn(self):
         return self
 
 
 database_instance: Store = None
+_database_lock = threading.Lock()
+# set in a forked child: (db_url, db_name) of the parent's Store
+_reopen = None
 # global variable for database sync
 init_completed_event = threading.Event()
 
 
-def init_database(db_url):
+def init_database(db_url, reset: bool = conf.Reset_On_Start):
     global database_instance
-    database_instance = Store(db_url)
+    with _database_lock:
+        database_instance = Store(db_url, reset=reset)
+        rebuild_filters(database_instance, clear=reset)
 
 
 def get_db_conn():
+    # Flask request threads and the scheduler thread may get here at the
+    # same time; only one of them builds the Store
     global database_instance
+    instance = database_instance
+    if instance is None:
+        with _database_lock:
+            if database_instance is None:
+                if _reopen is not None:
+                    # the parent already reset and migrated the database
+                    database_instance = Store(_reopen[0], _reopen[1], reset=False, init=False)
+                else:
+                    # 初始化数据库连接
+                    database_instance = Store(conf.DB_URL)
+                    rebuild_filters(database_instance, clear=conf.Reset_On_Start)
+            instance = database_instance
+    return instance.get_db_conn()
+
+
+def _after_fork_in_child():
+    # a MongoClient must not be shared with a forked child: drop the
+    # parent's and let the child open its own pool on first use
+    global database_instance, _database_lock, _reopen
+    _database_lock = threading.Lock()
+    if database_instance is not None:
+        _reopen = (database_instance.db_url, database_instance.db_name)
+        database_instance = None
+
+
+def release_database():
+    # close this process's client before forking workers; they reopen the
+    # same database lazily without resetting or migrating it again
+    global database_instance, _reopen
+    with _database_lock:
+        if database_instance is not None:
+            _reopen = (database_instance.db_url, database_instance.db_name)
+            database_instance.myclient.close()
+            database_instance = None
+
+
+def pool_stats() -> dict:
+    # exported by /metrics, see metrics.track_pool
     if database_instance is None:
-        # 初始化数据库连接
-        db_url = "mongodb://localhost:27017/"  # 替换为你的 MongoDB 连接URL
-        init_database(db_url)
-    return database_instance.get_db_conn()
+        return {}
+    return database_instance.pool_metrics.stats()
+
+
+metrics.track_pool("sync", pool_stats)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -4,6 +4,9 @@ import logging
 import sqlite3 as sqlite
 from be.model import error
 from be.model import db_conn
+from be.model import identity
+from be.model.bloom import user_filter
+from be.model.cache import token_cache, version_stamps, user_version
 
 # encode a json string like:
 #   {
@@ -33,57 +36,98 @@ def jwt_decode(encoded_token, user_id: str) -> str:
     return decoded
 
 
+def token_remaining(user_id: str, db_token: str, token: str, lifetime: int) -> float:
+    # seconds until token, the one last issued to user_id, expires; 0 when
+    # it is not valid
+    try:
+        if db_token != token:
+            return 0
+        jwt_text = jwt_decode(encoded_token=token, user_id=user_id)
+        ts = jwt_text["timestamp"]
+        if ts is not None:
+            age = time.time() - ts
+            if lifetime > age >= 0:
+                return lifetime - age
+    except jwt.exceptions.InvalidSignatureError as e:
+        logging.error(str(e))
+    return 0
+
+
+def token_fields(user_id: str, terminal: str = None) -> dict:
+    # a new token for user_id; a fresh terminal replaces the token of the
+    # current one (logout, password change)
+    if terminal is None:
+        terminal = "terminal_{}".format(str(time.time()))
+    return {"token": jwt_encode(user_id, terminal), "terminal": terminal}
+
+
+def user_row(user_id: str, password: str) -> dict:
+    return dict({"user_id": user_id, "password": password, "balance": 0}, **token_fields(user_id))
+
+
+def check_user_password(result: dict, password: str):
+    # the error when result, the stored user, does not exist or has another
+    # password; None when the password is right
+    if result is None or result.get("password") != password:
+        return error.error_authorization_fail()
+    return None
+
+
+def check_user_token(user_id: str, token: str, result: dict, lifetime: int, versions: list) -> (int, str):
+    # verifies token against result, the stored user, and caches it under
+    # versions, the ones token_cache.lookup returned before the read
+    if result is None:
+        return error.error_authorization_fail()
+    remaining = token_remaining(user_id, result["token"], token, lifetime)
+    if not remaining:
+        return error.error_authorization_fail()
+    token_cache.store((user_id, token), versions, True, remaining)
+    return 200, "ok"
+
+
+def invalidate_tokens(user_id: str):
+    # drops the verified tokens of user_id from the token cache of every
+    # worker process; call after the stored token changes
+    version_stamps.bump(user_version(user_id))
+
+
 class User(db_conn.DBConn):
     token_lifetime: int = 3600  # 3600 second
 
     def __init__(self):
         db_conn.DBConn.__init__(self)
 
-    def __check_token(self, user_id, db_token, token) -> bool:
-        try:
-            if db_token != token:
-                return False
-            jwt_text = jwt_decode(encoded_token=token, user_id=user_id)
-            ts = jwt_text["timestamp"]
-            if ts is not None:
-                now = time.time()
-                if self.token_lifetime > now - ts >= 0:
-                    return True
-        except jwt.exceptions.InvalidSignatureError as e:
-            logging.error(str(e))
-            return False
-
     def register(self, user_id: str, password: str):
         try:
-            terminal = "terminal_{}".format(str(time.time()))
-            token = jwt_encode(user_id, terminal)
-            self.conn.col_user.insert_one({
-                "user_id": user_id,
-                "password": password,
-                "balance": 0,
-                "token": token,
-                "terminal": terminal,
-            })
+            user_filter.add(user_id)
+            self.conn.col_user.insert_one(user_row(user_id, password))
+            self.forget_user(user_id)
         except Exception:
             return error.error_exist_user_id(user_id)
         return 200, "ok"
 
     def check_token(self, user_id: str, token: str) -> (int, str):
-        users = list(self.conn.col_user.find({"user_id": user_id}))
-        if not users:
-            return error.error_authorization_fail()
-        assert len(users) == 1
-        token1 = users[0]['token']
-        if not self.__check_token(user_id, token1, token):
-            return error.error_authorization_fail()
-        return 200, "ok"
+        # resolved once per request through the identity map; a verified
+        # token is also cached until it expires, so repeated checks skip
+        # both the read and the signature check
+        identity_map = identity.current()
+        if identity_map is not None and (user_id, token) in identity_map.tokens:
+            return identity_map.tokens[(user_id, token)]
+        result = self._check_token(user_id, token)
+        if identity_map is not None:
+            identity_map.tokens[(user_id, token)] = result
+        return result
+
+    def _check_token(self, user_id: str, token: str) -> (int, str):
+        cached, versions = token_cache.lookup((user_id, token), [user_version(user_id)])
+        if cached is not None:
+            return 200, "ok"
+        return check_user_token(user_id, token, self.get_user(user_id), self.token_lifetime, versions)
 
     def check_password(self, user_id: str, password: str) -> (int, str):
-        result = self.conn.col_user.find_one({"user_id": user_id})
-        if result is None:
-            return error.error_authorization_fail()
-        if result["password"] != password:
-            return error.error_authorization_fail()
+        failure = check_user_password(self.get_user(user_id), password)
+        if failure is not None:
+            return failure
         return 200, "ok"
 
     def login(self, user_id: str, password: str, terminal: str) -> (int, str, str):
@@ -93,15 +137,13 @@ class User(db_conn.DBConn):
             if code != 200:
                 return code, message, ""
 
-            token = jwt_encode(user_id, terminal)
-            result = self.conn.col_user.update_one({"user_id": user_id},
-                {"$set": {
-                    "token": token,
-                    "terminal": terminal
-                }
-            })
+            fields = token_fields(user_id, terminal)
+            token = fields["token"]
+            result = self.conn.col_user.update_one({"user_id": user_id}, {"$set": fields})
             if not result.acknowledged:
                 return error.error_authorization_fail() + ("",)
+            invalidate_tokens(user_id)
+            self.forget_user(user_id)
         except BaseException as e:
             return 528, "{}".format(str(e)), ""
         return 200, "ok", token
@@ -111,16 +153,11 @@ class User(db_conn.DBConn):
             code, message = self.check_token(user_id, token)
             if code != 200:
                 return code, message
-            terminal = "terminal_{}".format(str(time.time()))
-            dummy_token = jwt_encode(user_id, terminal)
-            result = self.conn.col_user.update_one({"user_id": user_id},
-                {'$set': {
-                    "token": dummy_token,
-                    "terminal": terminal
-                }
-            })
+            result = self.conn.col_user.update_one({"user_id": user_id}, {"$set": token_fields(user_id)})
             if not result.acknowledged:
                 return error.error_authorization_fail()
+            invalidate_tokens(user_id)
+            self.forget_user(user_id)
         except BaseException as e:
             return 528, "{}".format(str(e))
         return 200, "ok"
@@ -132,6 +169,8 @@ class User(db_conn.DBConn):
                 return code, message
             result = self.conn.col_user.delete_one({"user_id": user_id, "password": password})
             if result.deleted_count == 1:
+                invalidate_tokens(user_id)
+                self.forget_user(user_id)
                 return 200, "ok"
             else:
                 return error.error_authorization_fail()
@@ -145,17 +184,13 @@ class User(db_conn.DBConn):
             code, message = self.check_password(user_id, old_password)
             if code != 200:
                 return code, message
-            terminal = "terminal_{}".format(str(time.time()))
-            token = jwt_encode(user_id, terminal)
-            result = self.conn.col_user.update_one({"user_id": user_id,"password": old_password},
-                {"$set": {
-                    "password": new_password,
-                    "token": token,
-                    "terminal": terminal
-                }
-            })
+            result = self.conn.col_user.update_one(
+                {"user_id": user_id, "password": old_password},
+                {"$set": dict(token_fields(user_id), password=new_password)})
             if result.matched_count == 0:
                 return error.error_authorization_fail()
+            invalidate_tokens(user_id)
+            self.forget_user(user_id)
         except BaseException as e:
             return 528, "{}".format(str(e))
         return 200, "ok"
@@ -1,24 +1,67 @@
 import logging
 import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
 from flask import Flask
 from flask import Blueprint
+from flask import g
+from flask import jsonify
 from flask import request
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+from be import conf
 from be.view import auth, search
 from be.view import seller
 from be.view import buyer
-from be.model.store import init_database, init_completed_event
-from be.model.store import init_database
-
+from be.view import book
+from be.view import metrics as metrics_view
+from be.model import identity
+from be.model import metrics
+from be.model import user
+from be.model.buyer import start_expiry_sweep, stop_expiry_sweep
+from be.model.store import get_db_conn, release_database, init_completed_event
 
 
 bp_shutdown = Blueprint("shutdown", __name__)
+# set by be_run: stops the server (every worker in multi-process mode)
+_shutdown = None
+
+
+class InFlight:
+    # WSGI middleware counting the requests being served, so shutdown can
+    # let them finish before the process exits
+
+    def __init__(self, app):
+        self.app = app
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def _done(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def __call__(self, environ, start_response):
+        with self._cond:
+            self.active += 1
+        try:
+            return ClosingIterator(self.app(environ, start_response), self._done)
+        except BaseException:
+            self._done()
+            raise
+
+    def drain(self, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.active == 0, timeout)
 
 
 def shutdown_server():
-    func = request.environ.get("werkzeug.server.shutdown")
-    if func is None:
-        raise RuntimeError("Not running with the Werkzeug Server")
-    func()
+    if _shutdown is None:
+        raise RuntimeError("Not running with be_run")
+    _shutdown()
 
 
 @bp_shutdown.route("/shutdown")
@@ -27,7 +70,165 @@ def be_shutdown():
     return "Server shutting down..."
 
 
-def be_run():
+# endpoints that authenticate with the token header
+TOKEN_ENDPOINTS = {"auth.logout"}
+
+
+def open_identity_map():
+    # One identity map per request. When the body names both a user and a
+    # store (the seller endpoints, new_order) they are read together up
+    # front; on the endpoints that authenticate, the token in the headers is
+    # checked against the body's user here, once, and the model reuses the
+    # result. Errors come back like the models' own.
+    if not conf.Identity_Map:
+        return
+    g.identity_map = identity.begin()
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("user_id"), str):
+        return
+    try:
+        if isinstance(body.get("store_id"), str):
+            identity.preload(get_db_conn(), body["user_id"], body["store_id"])
+        token = request.headers.get("token")
+        if token is not None and request.endpoint in TOKEN_ENDPOINTS:
+            user.User().check_token(body["user_id"], token)
+    except BaseException as e:
+        logging.error("530, {}".format(str(e)))
+        return jsonify({"message": "{}".format(str(e))}), 530
+
+
+def close_identity_map(exc):
+    token = g.pop("identity_map", None)
+    if token is not None:
+        identity.end(token)
+
+
+def start_request_timer():
+    # registered first, so the time includes the other request hooks
+    if conf.Metrics:
+        g.request_start = time.perf_counter()
+
+
+def record_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+def observe_request(exc):
+    # labelled by the route pattern, not the path, to bound the series;
+    # a request that raised never got a response and counts as a 500
+    start = g.pop("request_start", None)
+    if start is None:
+        return
+    rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    status = g.pop("response_status", 500)
+    metrics.http_request_seconds.observe((rule, request.method, str(status)), time.perf_counter() - start)
+
+
+def create_app() -> Flask:
+    app = Flask(__name__)
+    app.before_request(start_request_timer)
+    app.after_request(record_status)
+    app.teardown_request(observe_request)
+    app.before_request(open_identity_map)
+    app.teardown_request(close_identity_map)
+    app.register_blueprint(bp_shutdown)
+    app.register_blueprint(metrics_view.bp_metrics)
+    app.register_blueprint(auth.bp_auth)
+    app.register_blueprint(seller.bp_seller)
+    app.register_blueprint(buyer.bp_buyer)
+    app.register_blueprint(search.bp_search)
+    app.register_blueprint(book.bp_book)
+    return app
+
+
+def _stop_later(server):
+    # shutdown() blocks until serve_forever returns, so never call it from
+    # the serving thread itself
+    threading.Thread(target=server.shutdown, daemon=True).start()
+
+
+def _serve(server, in_flight: InFlight):
+    start_expiry_sweep()
+    try:
+        server.serve_forever()
+    finally:
+        if not in_flight.drain(conf.Drain_Seconds):
+            logging.error("shutdown with {} requests in flight".format(in_flight.active))
+        stop_expiry_sweep()
+
+
+def _run_worker(server, in_flight: InFlight):
+    global _shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: _stop_later(server))
+    # /shutdown in any worker stops the whole group through the parent
+    parent = os.getppid()
+    _shutdown = lambda: os.kill(parent, signal.SIGTERM)
+    if conf.Metrics:
+        metrics.start_flush(conf.Metrics_Flush_Seconds)
+    _serve(server, in_flight)
+
+
+def _run_prefork(server, in_flight: InFlight, workers: int):
+    # Pre-fork: the workers share the listening socket and each accepts on
+    # it with its own request threads, Mongo client and expiry sweep. The
+    # parent only supervises: it restarts a worker that dies and forwards
+    # SIGTERM/SIGINT so every worker drains before exiting.
+    children = set()
+    stopping = False
+    metrics_dir = None
+    if conf.Metrics:
+        metrics_dir = tempfile.mkdtemp(prefix="bookstore_metrics_")
+        metrics.share(metrics_dir)
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(server, in_flight)
+            except BaseException:
+                logging.exception("worker {} failed".format(os.getpid()))
+                code = 1
+            finally:
+                os._exit(code)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    # the database is reset and migrated once, here; workers reopen it
+    get_db_conn()
+    release_database()
+    for _ in range(workers):
+        spawn()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logging.info("serving on {}:{} with {} workers".format(conf.Host, conf.Port, workers))
+    init_completed_event.set()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            logging.error("worker {} exited with status {}, restarting".format(pid, status))
+            spawn()
+    server.server_close()
+    if metrics_dir is not None:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def be_run(workers: int = conf.Workers):
+    global _shutdown
     this_path = os.path.dirname(__file__)
     parent_path = os.path.dirname(this_path)
     log_file = os.path.join(parent_path, "app.log")
@@ -40,11 +241,20 @@ def be_run():
     handler.setFormatter(formatter)
     logging.getLogger().addHandler(handler)
 
-    app = Flask(__name__)
-    app.register_blueprint(bp_shutdown)
-    app.register_blueprint(auth.bp_auth)
-    app.register_blueprint(seller.bp_seller)
-    app.register_blueprint(buyer.bp_buyer)
-    app.register_blueprint(search.bp_search)
+    app = create_app()
+    in_flight = InFlight(app.wsgi_app)
+    app.wsgi_app = in_flight
+    server = make_server(conf.Host, conf.Port, app, threaded=True)
+    if workers > 1:
+        _run_prefork(server, in_flight, workers)
+        return
+
+    # single process, also what the tests run in a thread
+    get_db_conn()
+    _shutdown = lambda: _stop_later(server)
+    logging.info("serving on {}:{}".format(conf.Host, conf.Port))
     init_completed_event.set()
-    app.run()
+    try:
+        _serve(server, in_flight)
+    finally:
+        server.server_close()
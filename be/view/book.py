@@ -0,0 +1,19 @@
+import io
+
+from flask import Blueprint
+from flask import jsonify
+from flask import send_file
+from be.model.book import Book
+
+bp_book = Blueprint("book", __name__, url_prefix="/book")
+
+
+@bp_book.route("/<book_id>/picture/<int:n>", methods=["GET"])
+def get_picture(book_id, n):
+    b = Book()
+    code, message, blob = b.get_picture(book_id, n)
+    if code != 200:
+        return jsonify({"message": message}), code
+    # conditional: If-None-Match -> 304, Range -> 206
+    return send_file(io.BytesIO(blob.read()), mimetype=blob.metadata["content_type"], etag=blob._id,
+                     conditional=True)
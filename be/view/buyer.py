@@ -1,7 +1,7 @@
 from flask import Blueprint
 from flask import request
 from flask import jsonify
-from be.model.buyer import Buyer
+from be.model.buyer import Buyer, History_Page_Size
 
 bp_buyer = Blueprint("buyer", __name__, url_prefix="/buyer")
 
@@ -69,18 +69,22 @@ def is_order_cancelled():
 @bp_buyer.route("/check_hist_order", methods=["POST"])
 def check_hist_order():
     user_id = request.json.get("user_id")
+    status = request.json.get("status")
+    cursor = request.json.get("cursor")
+    page_size = request.json.get("page_size", History_Page_Size)
     b = Buyer()
-    code, message, res = b.check_hist_order(user_id)
-    return jsonify({"message": message, "history orders": res}), code
+    code, message, res, next_cursor = b.check_hist_order(user_id, status, cursor, page_size)
+    return jsonify({"message": message, "history orders": res, "next_cursor": next_cursor}), code
 
 @bp_buyer.route("/search", methods=["POST"])
 def search_books():
     keyword = request.json.get("keyword")
     store_id = request.json.get("store_id")
-    page = request.json.get("page")
+    page = request.json.get("page", 1)
+    engine = request.json.get("engine")
 
     b = Buyer()
-    code, message = b.search(keyword, store_id, page)
+    code, message = b.search(keyword, store_id, page, engine=engine)
     return jsonify({"message": message}), code
 
 @bp_buyer.route("/receive", methods=["POST"])
@@ -0,0 +1,10 @@
+from flask import Blueprint
+from flask import Response
+from be.model import metrics
+
+bp_metrics = Blueprint("metrics", __name__)
+
+
+@bp_metrics.route("/metrics", methods=["GET"])
+def get_metrics():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
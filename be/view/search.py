@@ -1,13 +1,30 @@
 import json
 
 from flask import Blueprint
+from flask import Response
 from flask import request
-from flask import jsonify
 from be.model.book import Book
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 bp_search = Blueprint("search", __name__, url_prefix="/search")
 
 
+def dumps(payload: dict) -> bytes:
+    # search pages are plain JSON types; orjson when available, else the
+    # stdlib encoder without the pretty printing jsonify may add
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(payload: dict) -> Response:
+    return Response(dumps(payload), mimetype="application/json")
+
+
 @bp_search.route("/title", methods=["GET"])
 def search_title():
     return search_title_in_store()
@@ -17,20 +34,17 @@ def search_title():
 def search_title_in_store():
     title = request.args.get("title")
     store_id = request.args.get("store_id")
-    page_num = request.args.get("page_num")
-    page_size = request.args.get("page_size")
+    page_num = request.args.get("page_num", 1)
+    page_size = request.args.get("page_size", 10)
+    cursor = request.args.get("cursor")
+    fields = request.args.get("fields")
     if title is None:
         title = ""
     if store_id is None:
         store_id = ""
-    if page_num is None:
-        page_num = 1
-    if page_size is None:
-        page_size = 10
     book = Book()
-    code, message, books = book.search_title_in_store(title, store_id, page_num, page_size)
-    # return jsonify({"data": books, "message": message, "code": code})
-    return jsonify({"data": str(books), "message": message, "code": code})
+    code, message, books, next_cursor = book.search_title_in_store(title, store_id, page_num, page_size, fields, cursor)
+    return json_response({"data": books, "message": message, "code": code, "next_cursor": next_cursor})
 
 @bp_search.route("/tag", methods=["GET"])
 def search_tag():
@@ -41,19 +55,27 @@ def search_tag():
 def search_tag_in_store():
     tag = request.args.get("tag")
     store_id = request.args.get("store_id")
-    page_num = request.args.get("page_num")
-    page_size = request.args.get("page_size")
+    page_num = request.args.get("page_num", 1)
+    page_size = request.args.get("page_size", 10)
+    cursor = request.args.get("cursor")
+    fields = request.args.get("fields")
+    mode = request.args.get("mode", "prefix")
     if tag is None:
         tag = ""
     if store_id is None:
         store_id = ""
-    if page_num is None:
-        page_num = 1
-    if page_size is None:
-        page_size = 10
     book = Book()
-    code, message, books = book.search_tag_in_store(tag, store_id, page_num, page_size)
-    return jsonify({"data": str(books), "message": message, "code": code})
+    code, message, books, next_cursor = book.search_tag_in_store(tag, store_id, page_num, page_size, mode, fields, cursor)
+    return json_response({"data": books, "message": message, "code": code, "next_cursor": next_cursor})
+
+
+@bp_search.route("/tags", methods=["GET"])
+def tag_dictionary():
+    prefix = request.args.get("prefix", "")
+    limit = request.args.get("limit", 20)
+    book = Book()
+    code, message, tags = book.tag_dictionary(prefix, limit)
+    return json_response({"data": tags, "message": message, "code": code})
 
 
 @bp_search.route("/content", methods=["GET"])
@@ -65,19 +87,18 @@ def search_content():
 def search_content_in_store():
     content = request.args.get("content")
     store_id = request.args.get("store_id")
-    page_num = request.args.get("page_num")
-    page_size = request.args.get("page_size")
+    page_num = request.args.get("page_num", 1)
+    page_size = request.args.get("page_size", 10)
+    cursor = request.args.get("cursor")
+    fields = request.args.get("fields")
+    engine = request.args.get("engine")
     if content is None:
         content = ""
     if store_id is None:
         store_id = ""
-    if page_num is None:
-        page_num = 1
-    if page_size is None:
-        page_size = 10
     book = Book()
-    code, message, books = book.search_content_in_store(content, store_id, page_num, page_size)
-    return jsonify({"data": str(books), "message": message, "code": code})
+    code, message, books, next_cursor = book.search_content_in_store(content, store_id, page_num, page_size, engine, fields, cursor)
+    return json_response({"data": books, "message": message, "code": code, "next_cursor": next_cursor})
 
 
 @bp_search.route("/author", methods=["GET"])
@@ -89,17 +110,15 @@ def search_author():
 def search_author_in_store():
     author = request.args.get("author")
     store_id = request.args.get("store_id")
-    page_num = request.args.get("page_num")
-    page_size = request.args.get("page_size")
+    page_num = request.args.get("page_num", 1)
+    page_size = request.args.get("page_size", 10)
+    cursor = request.args.get("cursor")
+    fields = request.args.get("fields")
     if author is None:
         author = ""
     if store_id is None:
         store_id = ""
-    if page_num is None:
-        page_num = 1
-    if page_size is None:
-        page_size = 10
     book = Book()
-    code, message, books = book.search_author_in_store(author, store_id, page_num, page_size)
-    return jsonify({"data": str(books), "message": message, "code": code})
+    code, message, books, next_cursor = book.search_author_in_store(author, store_id, page_num, page_size, fields, cursor)
+    return json_response({"data": books, "message": message, "code": code, "next_cursor": next_cursor})
 
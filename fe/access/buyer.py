@@ -1,5 +1,4 @@
 import requests
-import simplejson
 from urllib.parse import urljoin
 from fe.access.auth import Auth
 
@@ -80,13 +79,26 @@ class Buyer:
         return r.status_code
 
     def check_hist_order(self, user_id: str) -> int:
+        code, _, _ = self.check_hist_order_page(user_id)
+        return code
+
+    def check_hist_order_page(
+        self, user_id: str, status: str = None, cursor: str = None, page_size: int = None
+    ) -> (int, [], str):
         json = {"user_id": user_id}
+        if status is not None:
+            json["status"] = status
+        if cursor is not None:
+            json["cursor"] = cursor
+        if page_size is not None:
+            json["page_size"] = page_size
         url = urljoin(self.url_prefix, "check_hist_order")
         headers = {"token": self.token}
         r = requests.post(url, headers=headers, json=json)
-        return r.status_code
+        response_json = r.json()
+        return r.status_code, response_json.get("history orders"), response_json.get("next_cursor")
 
-    def search(self, keyword, store_id=None, page=1):
+    def search(self, keyword, store_id=None, page=1, engine=None):
         # store
         json = {
             "keyword": keyword,
@@ -94,6 +106,8 @@ class Buyer:
         }
         if store_id:
             json["store_id"] = store_id
+        if engine is not None:
+            json["engine"] = engine
 
         url = urljoin(self.url_prefix, "search")
         r = requests.post(url, json=json)
@@ -0,0 +1,7 @@
+import requests
+from urllib.parse import urljoin
+
+
+def get_metrics(url_prefix) -> (int, str):
+    r = requests.get(urljoin(url_prefix, "metrics"))
+    return r.status_code, r.text
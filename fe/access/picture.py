@@ -0,0 +1,11 @@
+import requests
+from urllib.parse import urljoin
+
+
+class RequestPicture:
+    def __init__(self, url_prefix):
+        self.url_prefix = urljoin(url_prefix, "book/")
+
+    def get_picture(self, book_id: str, n: int, headers: dict = None) -> requests.Response:
+        url = urljoin(self.url_prefix, "{}/picture/{}".format(book_id, n))
+        return requests.get(url, headers=headers)
@@ -5,6 +5,20 @@ class RequestSearch:
     def __init__(self):
         self.url_prefix = "http://127.0.0.1:5000/search"
 
+    def request_search_data(self, endpoint, **params):
+        # 返回 (code, data)，data 为 JSON 解析后的书籍列表
+        url = self.url_prefix + "/" + endpoint
+        r = requests.get(url, params=params)
+        res = json.loads(r.text)
+        return res['code'], res['data']
+
+    def request_search_page(self, endpoint, **params):
+        # 返回 (code, data, next_cursor)
+        url = self.url_prefix + "/" + endpoint
+        r = requests.get(url, params=params)
+        res = json.loads(r.text)
+        return res['code'], res['data'], res['next_cursor']
+
     def request_search_title(self, title):
         params = {
             "title": title
@@ -28,10 +42,12 @@ class RequestSearch:
         res = json.loads(r.text)
         return res['code']
 
-    def request_search_tag(self, tag):
+    def request_search_tag(self, tag, mode=None):
         params = {
             "tag": tag
         }
+        if mode is not None:
+            params["mode"] = mode
         # print(simplejson.dumps(json))
         url = self.url_prefix + "/tag"
         # headers = {"token": self.token}
@@ -51,6 +67,16 @@ class RequestSearch:
         res = json.loads(r.text)
         return res['code']
 
+    def request_tag_dictionary(self, prefix="", limit=20):
+        params = {
+            "prefix": prefix,
+            "limit": limit
+        }
+        url = self.url_prefix + "/tags"
+        r = requests.get(url, params=params)
+        res = json.loads(r.text)
+        return res['code'], res['data']
+
     def request_search_author(self, author):
         params = {
             "author": author
@@ -74,10 +100,12 @@ class RequestSearch:
         res = json.loads(r.text)
         return res['code']
 
-    def request_search_content(self, content):
+    def request_search_content(self, content, engine=None):
         params = {
             "content": content
         }
+        if engine is not None:
+            params["engine"] = engine
         # print(simplejson.dumps(json))
         url = self.url_prefix + "/content"
         # headers = {"token": self.token}
@@ -85,11 +113,13 @@ class RequestSearch:
         res = json.loads(r.text)
         return res['code']
 
-    def request_search_content_in_store(self, content, store_id):
+    def request_search_content_in_store(self, content, store_id, engine=None):
         params = {
             "content": content,
             "store_id": store_id
         }
+        if engine is not None:
+            params["engine"] = engine
         # print(simplejson.dumps(json))
         url = self.url_prefix + "/content_in_store"
         # headers = {"token": self.token}
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# asyncio 后端: 1000 个并发客户端下，线程模型(python -m be.app)与 asyncio 模型(python -m be.aio)的延迟与内存
+# usage: python -m fe.bench.bench_async
+# 两个后端依次作为独立进程启动在 Port 端口，因此不要同时运行其他后端
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import uuid
+import requests
+from urllib.parse import urljoin
+from fe.access.auth import Auth
+from fe.access.seller import Seller
+from fe.access import book
+from fe.bench.latency import percentile
+
+Clients = 1000
+Request_Per_Client = 20
+Port = 5002
+URL = "http://127.0.0.1:{}/".format(Port)
+Backends = [
+    ("thread", [sys.executable, "-m", "be.app", "1"]),
+    ("asyncio", [sys.executable, "-m", "be.aio", str(Port)]),
+]
+
+
+def wait_ready(timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(urljoin(URL, "search/tags"), timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError("backend did not start")
+
+
+def memory_kb(pid: int) -> (int, int):
+    # (current, peak) resident set size of the server process
+    status = {}
+    with open("/proc/{}/status".format(pid)) as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            status[name] = value.split()[0] if value.split() else "0"
+    return int(status.get("VmRSS", 0)), int(status.get("VmHWM", 0))
+
+
+class Client:
+    # one keep-alive HTTP/1.1 connection, reopened when the server closes it
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method: str, path: str, body: dict = None) -> int:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", Port)
+        data = json.dumps(body).encode() if body is not None else b""
+        head = "{} {} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n"
+        self.writer.write(head.format(method, path, len(data)).encode() + data)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        version, status = status_line.split()[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+        if "content-length" in headers:
+            await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            await self.reader.read()
+        if version != b"HTTP/1.1" or headers.get("connection") == "close" or "content-length" not in headers:
+            self.close()
+        return int(status)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def client_session(user_id: str, title: str, latencies: [float], errors: [int]):
+    # 查询与加款(鉴权 + 更新)交替
+    client = Client()
+    try:
+        for i in range(Request_Per_Client):
+            before = time.perf_counter()
+            try:
+                if i % 2 == 0:
+                    status = await client.request("GET", "/search/title?title={}".format(title))
+                else:
+                    status = await client.request("POST", "/buyer/add_funds",
+                                                  {"user_id": user_id, "password": user_id, "add_value": 1})
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                client.close()
+                status = 0
+            latencies.append(time.perf_counter() - before)
+            if status != 200:
+                errors.append(status)
+    finally:
+        client.close()
+
+
+async def load(users: [str], title: str, pid: int):
+    latencies = []
+    errors = []
+    peak = 0
+
+    async def sample():
+        nonlocal peak
+        while True:
+            peak = max(peak, memory_kb(pid)[0])
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample())
+    before = time.perf_counter()
+    await asyncio.gather(*[client_session(users[i % len(users)], title, latencies, errors) for i in range(Clients)])
+    seconds = time.perf_counter() - before
+    sampler.cancel()
+    return latencies, errors, seconds, peak
+
+
+def prepare() -> ([str], str):
+    prefix = "bench_async_{}".format(uuid.uuid1())
+    auth = Auth(URL)
+    users = ["{}_buyer_{}".format(prefix, i) for i in range(100)]
+    for user_id in users:
+        auth.register(user_id, user_id)
+    seller_id = prefix + "_seller"
+    auth.register(seller_id, seller_id)
+    seller = Seller(URL, seller_id, seller_id)
+    seller.create_store(prefix + "_store")
+    bk = book.BookDB().get_book_info(0, 1)[0]
+    seller.add_book(prefix + "_store", 10, bk)
+    return users, bk.title
+
+
+def run_once(name: str, command: [str]):
+    env = dict(os.environ, BOOKSTORE_PORT=str(Port))
+    backend = subprocess.Popen(command, env=env)
+    try:
+        wait_ready()
+        users, title = prepare()
+        idle, _ = memory_kb(backend.pid)
+        latencies, errors, seconds, peak = asyncio.run(load(users, title, backend.pid))
+        _, hwm = memory_kb(backend.pid)
+        print("{:8} {:7.0f} req/s  p50 {:7.1f} ms  p95 {:7.1f} ms  p99 {:7.1f} ms  errors {:5}  "
+              "rss idle {:6.1f} MB  peak {:6.1f} MB  hwm {:6.1f} MB".format(
+                  name, len(latencies) / seconds, percentile(latencies, 50) * 1000,
+                  percentile(latencies, 95) * 1000, percentile(latencies, 99) * 1000, len(errors),
+                  idle / 1024, peak / 1024, hwm / 1024))
+    finally:
+        try:
+            requests.get(urljoin(URL, "shutdown"), timeout=5)
+        except requests.RequestException:
+            backend.terminate()
+        backend.wait(timeout=60)
+
+
+def run_bench_async():
+    # 每个客户端一个连接，需要足够的文件描述符
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, 4 * Clients + 256)), hard))
+    for name, command in Backends:
+        run_once(name, command)
+
+
+if __name__ == "__main__":
+    run_bench_async()
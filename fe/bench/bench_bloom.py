@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# id 布隆过滤器: 以不存在的 id 为主的查询混合下，每次存在性检查的耗时(直接查询与先查过滤器)，以及实测与估计的误判率、内存占用
+# usage: python -m fe.bench.bench_bloom
+import random
+import time
+import uuid
+from be import conf
+from be.model.bloom import BloomFilter, filter_stats, rebuild_filters
+from be.model.db_conn import DBConn
+
+Check_Num = 20000
+# 查询不存在 id 的比例
+Absent_Ratio = 0.9
+Filter_Capacity = 100000
+Filter_Ids = 100000
+
+
+def measured_false_positive_rate() -> (float, dict):
+    # a separate filter filled to capacity, probed with ids never added
+    bloom = BloomFilter(Filter_Capacity, 0.01)
+    bloom.rebuild("present_{}".format(i) for i in range(Filter_Ids))
+    probes = 100000
+    positives = sum(bloom.might_contain("absent_{}".format(i)) for i in range(probes))
+    return positives / probes, bloom.stats()
+
+
+def run_bench_bloom():
+    # 过滤器默认关闭，此处对本进程开启
+    conf.Bloom_Filter = True
+    db = DBConn()
+    prefix = "bench_bloom_{}".format(uuid.uuid1())
+    present = ["{}_{}".format(prefix, i) for i in range(100)]
+    for user_id in present:
+        db.conn.col_user.insert_one({"user_id": user_id})
+    # 跳过模型直接写入了 user 集合，重建过滤器
+    rebuild_filters(db.conn)
+    ids = [random.choice(present) if random.random() >= Absent_Ratio else "{}_x{}".format(prefix, i)
+           for i in range(Check_Num)]
+    try:
+        before = time.perf_counter()
+        direct = [db.exists(db.conn.col_user, {"user_id": user_id}) for user_id in ids]
+        direct_us = (time.perf_counter() - before) / Check_Num * 1e6
+        before = time.perf_counter()
+        guarded = [db.user_id_exist(user_id) for user_id in ids]
+        guarded_us = (time.perf_counter() - before) / Check_Num * 1e6
+        assert direct == guarded
+        print("direct  {:8.1f} us/check".format(direct_us))
+        print("guarded {:8.1f} us/check  x{:.1f}".format(guarded_us, direct_us / guarded_us))
+        print(filter_stats()["user"])
+        rate, stats = measured_false_positive_rate()
+        print("{} ids in a filter for {}: measured false positive rate {:.4f}, estimated {:.4f}, {} KB".format(
+            Filter_Ids, Filter_Capacity, rate, stats["false_positive_rate"], stats["memory_bytes"] // 1024))
+    finally:
+        db.conn.col_user.delete_many({"user_id": {"$in": present}})
+
+
+if __name__ == "__main__":
+    run_bench_bloom()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# 书籍目录: 每个店铺一份书籍副本(原实现)与按 id 唯一的共享目录在压测数据规模下的写入耗时、存储与索引大小
+# usage: python -m fe.bench.bench_catalog
+import time
+import pymongo
+from be import conf as be_conf
+from be.model.store import Store, INDEXES, index_name
+from fe import conf
+from fe.access import book
+
+DB_Name = "bookstore_bench_catalog"
+
+
+def size_of(database, collection: str) -> (int, int, int):
+    stats = database.command("collStats", collection)
+    return stats["count"], stats["storageSize"], stats["totalIndexSize"]
+
+
+def run_bench_catalog():
+    book_db = book.BookDB(conf.Use_Large_DB)
+    book_num = min(conf.Book_Num_Per_Store, book_db.get_book_count())
+    store_num = conf.Seller_Num * conf.Store_Num_Per_User
+    docs = []
+    for bk in book_db.get_book_info(0, book_num):
+        doc = dict(bk.__dict__)
+        doc["pictures"] = []
+        docs.append(doc)
+
+    store = Store(be_conf.DB_URL, DB_Name, reset=True)
+    try:
+        legacy = store.database["books_legacy"]
+        for keys, options in INDEXES["books"]:
+            legacy.create_index(keys, name=index_name(keys))
+        before = time.perf_counter()
+        for _ in range(store_num):
+            for doc in docs:
+                legacy.insert_one(dict(doc))
+        legacy_seconds = time.perf_counter() - before
+
+        before = time.perf_counter()
+        for _ in range(store_num):
+            for doc in docs:
+                store.col_book.update_one({"id": doc["id"]}, {"$set": doc}, upsert=True)
+        shared_seconds = time.perf_counter() - before
+
+        print("{} stores x {} books".format(store_num, book_num))
+        for name, seconds in [(legacy.name, legacy_seconds), (store.col_book.name, shared_seconds)]:
+            count, storage, index = size_of(store.database, name)
+            print("{:<14} {:>7} docs storage {:>12} bytes index {:>12} bytes seed {:.2f}s".format(
+                name, count, storage, index, seconds))
+    finally:
+        pymongo.MongoClient(be_conf.DB_URL).drop_database(DB_Name)
+
+
+if __name__ == "__main__":
+    run_bench_catalog()
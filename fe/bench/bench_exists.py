@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# 存在性检查: 2000 本书的店铺上，整文档 find_one 与只投影索引字段(覆盖索引)的 find_one 每次检查的返回字节数与延迟
+# usage: python -m fe.bench.bench_exists
+import time
+import uuid
+import bson
+import pymongo
+from pymongo import monitoring
+from be.model.store import get_db_conn, key_projection
+
+Book_Num = 2000
+Repeat = 2000
+
+
+class ReplyBytes(monitoring.CommandListener):
+    def __init__(self):
+        self.bytes = 0
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.bytes += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        pass
+
+
+def measure(listener: ReplyBytes, lookup) -> (float, float):
+    # (reply bytes, microseconds) per check
+    listener.bytes = 0
+    before = time.perf_counter()
+    for _ in range(Repeat):
+        lookup()
+    seconds = time.perf_counter() - before
+    return listener.bytes / Repeat, seconds / Repeat * 1e6
+
+
+def run_bench_exists():
+    store = get_db_conn()
+    listener = ReplyBytes()
+    client = pymongo.MongoClient(store.db_url, event_listeners=[listener])
+    database = client[store.db_name]
+    prefix = "bench_exists_{}".format(uuid.uuid1())
+    store_id = prefix + "_store"
+    book_ids = ["{}_{}".format(prefix, i) for i in range(Book_Num)]
+    # 第 1 版 schema 的店铺文档内嵌全部书籍与库存，放在单独的集合中对比
+    legacy = database["bench_store_v1"]
+    legacy.create_index("store_id")
+    legacy.insert_one({"store_id": store_id, "user_id": prefix,
+                       "books": [{"book_id": b, "stock_level": 10} for b in book_ids]})
+    database["store"].insert_one({"store_id": store_id, "user_id": prefix})
+    database["inventory"].insert_many([{"store_id": store_id, "book_id": b, "stock_level": 10} for b in book_ids])
+    try:
+        cases = [
+            ("store v1 (embedded books)", legacy, {"store_id": store_id}),
+            ("store", database["store"], {"store_id": store_id}),
+            ("inventory", database["inventory"], {"store_id": store_id, "book_id": book_ids[-1]}),
+        ]
+        print("{:<28} {:>12} {:>10} {:>12} {:>10}".format("", "full bytes", "full us", "covered bytes",
+                                                           "covered us"))
+        for name, col, condition in cases:
+            full = measure(listener, lambda: col.find_one(condition))
+            covered = measure(listener, lambda: col.find_one(condition, key_projection(condition)))
+            print("{:<28} {:12.0f} {:10.1f} {:12.0f} {:10.1f}".format(name, *full, *covered))
+    finally:
+        legacy.drop()
+        database["store"].delete_many({"store_id": store_id})
+        database["inventory"].delete_many({"store_id": store_id})
+        client.close()
+
+
+if __name__ == "__main__":
+    run_bench_exists()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# 超时取消扫描的开销: 应随到期订单数增长，而不随订单表总量增长
+# usage: python -m fe.bench.bench_expiry
+import time
+import pymongo
+from datetime import datetime, timedelta
+from be import conf as be_conf
+from be.model.store import Store
+from be.model.expiry import ExpiryQueue
+
+DB_Name = "bookstore_bench_expiry"
+Table_Sizes = [10000, 100000]
+Expiring_Sizes = [10, 100, 1000]
+
+
+def seed(store: Store, total: int, expiring: int):
+    now = datetime.utcnow()
+    for start in range(0, total, 10000):
+        orders = []
+        details = []
+        for i in range(start, min(total, start + 10000)):
+            order_id = "order_{}".format(i)
+            expired = i < expiring
+            orders.append({"order_id": order_id, "store_id": "store", "user_id": "buyer",
+                           "create_time": now - timedelta(seconds=60 if expired else 0),
+                           "price": 10, "status": 0 if expired or i % 2 else 1})
+            details.append({"order_id": order_id, "book_id": "book_{}".format(i % 100), "count": 1, "price": 10})
+        store.col_order.insert_many(orders)
+        store.col_order_detail.insert_many(details)
+    store.col_inventory.insert_many(
+        [{"store_id": "store", "book_id": "book_{}".format(i), "stock_level": 0} for i in range(100)])
+
+
+def run_bench_expiry():
+    try:
+        for total in Table_Sizes:
+            for expiring in Expiring_Sizes:
+                store = Store(be_conf.DB_URL, DB_Name, reset=True)
+                seed(store, total, expiring)
+                queue = ExpiryQueue(be_conf.Order_Timeout_Seconds, backstop_interval=0,
+                                    max_batches=expiring)
+                before = time.perf_counter()
+                n = queue.sweep(store)
+                after = time.perf_counter()
+                assert n == expiring
+                print("orders {:>6} expiring {:>4}: sweep {:8.2f}ms, lag {:.1f}s".format(
+                    total, expiring, (after - before) * 1000, queue.last_lag))
+    finally:
+        pymongo.MongoClient(be_conf.DB_URL).drop_database(DB_Name)
+
+
+if __name__ == "__main__":
+    run_bench_expiry()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# 一个有 10,000 笔订单的买家: 原实现(三次查询 + 每单一次明细查询)与分页聚合的延迟对比
+# usage: python -m fe.bench.bench_history
+import uuid
+from datetime import datetime, timedelta
+from be.model.user import User
+from be.model.buyer import Buyer
+from be.model.store import get_db_conn
+from fe.bench.latency import measure, report
+
+Order_Num = 10000
+Page_Size = 20
+Repeat = 50
+Legacy_Repeat = 3
+
+
+def seed(user_id: str, n: int):
+    conn = get_db_conn()
+    now = datetime.utcnow()
+    orders = []
+    details = []
+    for i in range(n):
+        order_id = "{}_{}".format(user_id, i)
+        orders.append({"order_id": order_id, "store_id": "bench_store", "user_id": user_id,
+                       "create_time": now - timedelta(seconds=i), "price": 100, "status": i % 5})
+        details.append({"order_id": order_id, "book_id": "book_{}".format(i % 100), "count": 1, "price": 100})
+    conn.col_order.insert_many(orders)
+    conn.col_order_detail.insert_many(details)
+
+
+def legacy_history(user_id: str) -> int:
+    conn = get_db_conn()
+    n = 0
+    for condition in [{"user_id": user_id, "status": 0},
+                      {"user_id": user_id, "status": {"$in": [1, 2, 3]}},
+                      {"user_id": user_id, "status": 4}]:
+        for order in conn.col_order.find(condition):
+            list(conn.col_order_detail.find({"order_id": order["order_id"]}))
+            n += 1
+    return n
+
+
+def run_bench_history():
+    user_id = "bench_history_buyer_{}".format(uuid.uuid1())
+    User().register(user_id, user_id)
+    seed(user_id, Order_Num)
+    b = Buyer()
+
+    cursors = {1: None}
+    cursor = None
+    for page in range(2, Order_Num // Page_Size + 1):
+        code, _, _, cursor = b.check_hist_order(user_id, cursor=cursor, page_size=Page_Size)
+        assert code == 200
+        cursors[page] = cursor
+
+    for page in [p for p in [1, 10, 100, Order_Num // Page_Size] if p in cursors]:
+        print(report("page {:>4} of {} orders".format(page, Order_Num),
+                     measure(lambda: b.check_hist_order(user_id, cursor=cursors[page], page_size=Page_Size),
+                             Repeat)))
+    print(report("status filter, page 1",
+                 measure(lambda: b.check_hist_order(user_id, status="cancelled", page_size=Page_Size), Repeat)))
+    print(report("legacy full history", measure(lambda: legacy_history(user_id), Legacy_Repeat)))
+
+
+if __name__ == "__main__":
+    run_bench_history()
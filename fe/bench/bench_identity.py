@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# 请求级身份映射: 关闭与开启 Identity_Map 时各接口每个请求发出的 MongoDB 命令数
+# usage: python -m fe.bench.bench_identity
+import uuid
+from collections import Counter, defaultdict
+from pymongo import monitoring
+from be import conf
+
+Rounds = 20
+# 建立连接、心跳等不计入
+Counted = {"find", "aggregate", "insert", "update", "delete", "findAndModify", "getMore", "count"}
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name in Counted:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def run_round(client, counter: CommandCounter, counts: Counter):
+    prefix = "bench_identity_{}".format(uuid.uuid1())
+    seller_id, buyer_id, store_id = prefix + "_seller", prefix + "_buyer", prefix + "_store"
+    book_id = prefix + "_book"
+
+    def call(endpoint: str, body: dict, headers: dict = None) -> dict:
+        before = counter.count
+        r = client.post(endpoint, json=body, headers=headers or {})
+        counts[endpoint] += counter.count - before
+        assert r.status_code == 200, (endpoint, r.status_code, r.get_json())
+        return r.get_json()
+
+    call("/auth/register", {"user_id": seller_id, "password": seller_id})
+    call("/auth/register", {"user_id": buyer_id, "password": buyer_id})
+    token = call("/auth/login", {"user_id": buyer_id, "password": buyer_id, "terminal": "bench"})["token"]
+    call("/seller/create_store", {"user_id": seller_id, "store_id": store_id})
+    call("/seller/add_book", {"user_id": seller_id, "store_id": store_id, "stock_level": 10,
+                              "book_info": {"id": book_id, "title": prefix, "price": 100}})
+    call("/seller/add_stock_level", {"user_id": seller_id, "store_id": store_id, "book_id": book_id,
+                                     "add_stock_level": 10})
+    call("/buyer/add_funds", {"user_id": buyer_id, "password": buyer_id, "add_value": 1000})
+    order_id = call("/buyer/new_order", {"user_id": buyer_id, "store_id": store_id,
+                                         "books": [{"id": book_id, "count": 1}]})["order_id"]
+    call("/buyer/payment", {"user_id": buyer_id, "password": buyer_id, "order_id": order_id})
+    call("/auth/logout", {"user_id": buyer_id}, {"token": token})
+
+
+def run_bench_identity():
+    # the listener must be registered before the MongoClient is created
+    counter = CommandCounter()
+    monitoring.register(counter)
+    from be.serve import create_app
+    client = create_app().test_client()
+    results = defaultdict(dict)
+    for enabled in (False, True):
+        conf.Identity_Map = enabled
+        counts = Counter()
+        for _ in range(Rounds):
+            run_round(client, counter, counts)
+        for endpoint, n in counts.items():
+            results[endpoint][enabled] = n / Rounds
+    print("{:<26} {:>8} {:>8}".format("endpoint", "before", "after"))
+    for endpoint, n in results.items():
+        print("{:<26} {:8.1f} {:8.1f}".format(endpoint, n[False], n[True]))
+
+
+if __name__ == "__main__":
+    run_bench_identity()
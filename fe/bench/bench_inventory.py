@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# 比较内嵌 books 数组与独立 inventory 集合在店铺规模增长时的查找/更新延迟
+# usage: python -m fe.bench.bench_inventory
+import random
+import pymongo
+from pymongo import InsertOne
+from fe.bench.latency import measure, report
+
+DB_URL = "mongodb://localhost:27017/"
+Store_Sizes = [100, 1000, 10000, 100000]
+Repeat = 200
+
+
+def book_ids(n: int) -> [str]:
+    return ["book_{:06d}".format(i) for i in range(n)]
+
+
+def seed(database, store_id: str, n: int):
+    ids = book_ids(n)
+    database["store"].insert_one({
+        "store_id": store_id,
+        "books": [{"book_id": i, "stock_level": 1000000} for i in ids],
+    })
+    for k in range(0, n, 10000):
+        database["inventory"].bulk_write(
+            [InsertOne({"store_id": store_id, "book_id": i, "stock_level": 1000000}) for i in ids[k:k + 10000]],
+            ordered=False,
+        )
+
+
+def run_bench_inventory():
+    client = pymongo.MongoClient(DB_URL)
+    client.drop_database("bookstore_bench")
+    database = client["bookstore_bench"]
+    database["store"].create_index([("store_id", 1)], unique=True)
+    database["inventory"].create_index([("store_id", 1), ("book_id", 1)], unique=True)
+    try:
+        for n in Store_Sizes:
+            store_id = "store_{}".format(n)
+            seed(database, store_id, n)
+            ids = book_ids(n)
+
+            def embedded_find():
+                database["store"].find_one({"store_id": store_id, "books.book_id": random.choice(ids)},
+                                           {"books.$": 1})
+
+            def embedded_update():
+                database["store"].update_one({"store_id": store_id, "books.book_id": random.choice(ids)},
+                                             {"$inc": {"books.$.stock_level": -1}})
+
+            def inventory_find():
+                database["inventory"].find_one({"store_id": store_id, "book_id": random.choice(ids)})
+
+            def inventory_update():
+                database["inventory"].update_one({"store_id": store_id, "book_id": random.choice(ids)},
+                                                 {"$inc": {"stock_level": -1}})
+
+            print(report("embedded  find   {:>6} titles".format(n), measure(embedded_find, Repeat)))
+            print(report("inventory find   {:>6} titles".format(n), measure(inventory_find, Repeat)))
+            print(report("embedded  update {:>6} titles".format(n), measure(embedded_update, Repeat)))
+            print(report("inventory update {:>6} titles".format(n), measure(inventory_update, Repeat)))
+    finally:
+        client.drop_database("bookstore_bench")
+
+
+if __name__ == "__main__":
+    run_bench_inventory()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# /metrics 指标: 单次记录的耗时，以及关闭与开启 Metrics 时 fe/bench 压测(下单 + 付款)的吞吐量
+# usage: python -m fe.bench.bench_metrics
+# 每轮启动 python -m be.app 1 作为独立的后端进程，因此不要同时运行其他后端
+import os
+import statistics
+import subprocess
+import sys
+import time
+import requests
+from types import SimpleNamespace
+from urllib.parse import urljoin
+from fe import conf
+from fe.bench.workload import Workload
+from fe.bench.session import Session
+from be.model.metrics import Histogram, CommandMetrics
+
+Repeat = 1000000
+# 关闭、开启交替运行，各取中位数
+Rounds = 3
+
+
+def bench_observe():
+    h = Histogram("bench", "bench", ("route", "method", "status"))
+    labels = ("/buyer/payment", "POST", "200")
+    before = time.perf_counter()
+    for i in range(Repeat):
+        h.observe(labels, 0.003)
+    observe_ns = (time.perf_counter() - before) / Repeat * 1e9
+
+    # a started + succeeded pair as the driver sends it for every command
+    listener = CommandMetrics()
+    started = SimpleNamespace(command={"find": "books", "filter": {}}, command_name="find",
+                              connection_id=("127.0.0.1", 27017), request_id=1)
+    succeeded = SimpleNamespace(command_name="find", connection_id=("127.0.0.1", 27017), request_id=1,
+                                duration_micros=800)
+    before = time.perf_counter()
+    for i in range(Repeat):
+        listener.started(started)
+        listener.succeeded(succeeded)
+    command_ns = (time.perf_counter() - before) / Repeat * 1e9
+    print("histogram observe: {:6.0f} ns   command listener (started + succeeded): {:6.0f} ns".format(
+        observe_ns, command_ns))
+
+
+def wait_ready(timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(urljoin(conf.URL, "search/tags"), timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError("backend did not start")
+
+
+def run_once(enabled: bool) -> (float, int):
+    env = dict(os.environ, BOOKSTORE_METRICS="1" if enabled else "0")
+    backend = subprocess.Popen([sys.executable, "-m", "be.app", "1"], env=env)
+    try:
+        wait_ready()
+        wl = Workload()
+        wl.gen_database()
+        sessions = [Session(wl) for _ in range(wl.session)]
+        before = time.perf_counter()
+        for ss in sessions:
+            ss.start()
+        for ss in sessions:
+            ss.join()
+        seconds = time.perf_counter() - before
+        done = sum(ss.new_order_ok + ss.payment_ok for ss in sessions)
+        scrape = len(requests.get(urljoin(conf.URL, "metrics")).content)
+        return done / seconds, scrape
+    finally:
+        requests.get(urljoin(conf.URL, "shutdown"))
+        backend.wait(timeout=60)
+
+
+def run_bench_metrics():
+    bench_observe()
+    tps = {False: [], True: []}
+    scrape = 0
+    for _ in range(Rounds):
+        for enabled in (False, True):
+            result, size = run_once(enabled)
+            tps[enabled].append(result)
+            if enabled:
+                scrape = size
+    off = statistics.median(tps[False])
+    on = statistics.median(tps[True])
+    print("metrics off: {:8.0f} ok requests/s".format(off))
+    print("metrics on:  {:8.0f} ok requests/s  overhead {:5.1f}%  /metrics {} bytes".format(
+        on, (off - on) / off * 100, scrape))
+
+
+if __name__ == "__main__":
+    run_bench_metrics()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# 比较批量下单与逐项下单的 p50/p99 延迟
+# usage: python -m fe.bench.bench_new_order
+import uuid
+import json
+from datetime import datetime
+from be import conf
+from be.model.metrics import mongo_command_seconds
+from be.model.user import User
+from be.model.seller import Seller
+from be.model.buyer import Buyer
+from be.model.store import get_db_conn
+from fe.access import book
+from fe.bench.latency import measure, report
+
+Order_Sizes = [1, 10, 50]
+Repeat = 200
+Stock_Level = 1000000
+
+
+def per_item_new_order(user_id: str, store_id: str, id_and_count: [(str, int)]) -> str:
+    # the original checkout loop: four round trips per line item
+    conn = get_db_conn()
+    uid = "{}_{}_{}".format(user_id, store_id, str(uuid.uuid1()))
+    total_price = 0
+    for book_id, count in id_and_count:
+        result = conn.col_inventory.find_one({"store_id": store_id, "book_id": book_id})
+        price = conn.col_book.find_one({"id": book_id})["price"]
+        assert result["stock_level"] >= count
+        result = conn.col_inventory.update_one(
+            {"store_id": store_id, "book_id": book_id, "stock_level": {"$gte": count}},
+            {"$inc": {"stock_level": -count}})
+        assert result.modified_count == 1
+        conn.col_order_detail.insert_one({"order_id": uid, "book_id": book_id, "count": count, "price": price})
+        total_price += price * count
+    conn.col_order.insert_one({"order_id": uid, "store_id": store_id, "user_id": user_id,
+                               "create_time": datetime.utcnow(), "price": total_price, "status": 0})
+    return uid
+
+
+def catalog_reads() -> int:
+    # commands sent to the catalog (books) so far, from the command metrics
+    return sum(sum(series[:-1]) for (command, collection), series in mongo_command_seconds.snapshot().items()
+               if collection == "books")
+
+
+def prepare(book_count: int) -> (str, str, [str]):
+    tag = str(uuid.uuid1())
+    seller_id = "bench_new_order_seller_{}".format(tag)
+    buyer_id = "bench_new_order_buyer_{}".format(tag)
+    store_id = "bench_new_order_store_{}".format(tag)
+    User().register(seller_id, seller_id)
+    User().register(buyer_id, buyer_id)
+    s = Seller()
+    assert s.create_store(seller_id, store_id)[0] == 200
+    book_ids = []
+    for bk in book.BookDB().get_book_info(0, book_count):
+        if bk.price is None:
+            continue
+        bk.pictures = []
+        code, _ = s.add_book(seller_id, store_id, bk.id, json.dumps(bk.__dict__), Stock_Level)
+        assert code == 200
+        book_ids.append(bk.id)
+    return buyer_id, store_id, book_ids
+
+
+def run_bench_new_order():
+    # the command listener counts the catalog reads; set before the client is created
+    conf.Metrics = True
+    buyer_id, store_id, book_ids = prepare(max(Order_Sizes))
+    b = Buyer()
+    for size in Order_Sizes:
+        lines = [(book_id, 1) for book_id in book_ids[:size]]
+
+        def batched():
+            code, message, _ = b.new_order(buyer_id, store_id, lines)
+            assert code == 200, message
+
+        print(report("per-item   {:>2} lines".format(len(lines)),
+                     measure(lambda: per_item_new_order(buyer_id, store_id, lines), Repeat)))
+        before = catalog_reads()
+        print(report("batched    {:>2} lines".format(len(lines)), measure(batched, Repeat)))
+        reads, lookups = catalog_reads() - before, Repeat * len(lines)
+        print("catalog hit ratio {:.3f} ({} catalog reads for {} lines)".format(1 - reads / lookups, reads, lookups))
+
+
+if __name__ == "__main__":
+    run_bench_new_order()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# 比较原付款流程(约 8 次往返)与合并后的结算流程的 p50/p99 延迟
+# usage: python -m fe.bench.bench_payment
+from be.model.buyer import Buyer
+from be.model.store import get_db_conn
+from fe.bench.bench_new_order import prepare
+from fe.bench.latency import measure, report
+
+Repeat = 200
+
+
+def legacy_payment(user_id: str, password: str, order_id: str):
+    # the original payment: separate reads and writes for every step
+    conn = get_db_conn()
+    order = conn.col_order.find_one({"order_id": order_id, "status": 0})
+    buyer = conn.col_user.find_one({"user_id": order["user_id"]})
+    assert buyer["password"] == password and buyer["balance"] >= order["price"]
+    seller_id = conn.col_store.find_one({"store_id": order["store_id"]})["user_id"]
+    assert conn.col_user.find_one({"user_id": seller_id}) is not None
+    conn.col_user.update_one({"user_id": user_id, "balance": {"$gte": order["price"]}},
+                             {"$inc": {"balance": -order["price"]}})
+    conn.col_user.update_one({"user_id": seller_id}, {"$inc": {"balance": order["price"]}})
+    conn.col_order.insert_one({"order_id": order_id, "store_id": order["store_id"], "user_id": user_id,
+                               "status": 1, "price": order["price"]})
+    conn.col_order.delete_one({"order_id": order_id, "status": 0})
+
+
+def run_bench_payment():
+    buyer_id, store_id, book_ids = prepare(10)
+    b = Buyer()
+    assert b.add_funds(buyer_id, buyer_id, 10 ** 12)[0] == 200
+    lines = [(book_id, 1) for book_id in book_ids[:10]]
+
+    def new_orders() -> [str]:
+        # created before each timed loop, so only the payments are measured
+        order_ids = []
+        for _ in range(Repeat):
+            code, message, order_id = b.new_order(buyer_id, store_id, lines)
+            assert code == 200, message
+            order_ids.append(order_id)
+        return order_ids
+
+    pending = iter(new_orders())
+    print(report("legacy payment", measure(lambda: legacy_payment(buyer_id, buyer_id, next(pending)), Repeat)))
+    pending = iter(new_orders())
+
+    def settle():
+        code, message = b.payment(buyer_id, buyer_id, next(pending))
+        assert code == 200, message
+
+    print(report("settlement", measure(settle, Repeat)))
+
+
+if __name__ == "__main__":
+    run_bench_payment()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# 图片存储: 图片内联在书籍文档中与存入按内容寻址的 GridFS 后，books 集合大小与整页读取延迟
+# usage: python -m fe.bench.bench_picture
+import pymongo
+from be import conf as be_conf
+from be.model.store import Store, store_pictures
+from fe.access import book
+from fe.bench.latency import measure, report
+
+DB_Name = "bookstore_bench_picture"
+Book_Num = 100
+Copies = 10
+Page_Size = 10
+Repeat = 20
+
+
+def run_bench_picture():
+    books = book.BookDB().get_book_info(0, Book_Num)
+    store = Store(be_conf.DB_URL, DB_Name, reset=True)
+    try:
+        inline = store.database["books_inline"]
+        for copy in range(Copies):
+            docs = []
+            for bk in books:
+                doc = dict(bk.__dict__)
+                doc["id"] = "{}_{}".format(bk.id, copy)
+                docs.append(doc)
+            inline.insert_many([dict(d) for d in docs])
+            for doc in docs:
+                doc["pictures"] = store_pictures(store.pictures, doc["pictures"])
+            store.col_book.insert_many(docs)
+
+        for name in [inline.name, store.col_book.name]:
+            stats = store.database.command("collStats", name)
+            print("{:<14} {:>6} docs {:>12} bytes".format(name, stats["count"], stats["size"]))
+        print("picture store  {}".format(store.pictures.stats()))
+        print(report("page, inline pictures", measure(lambda: list(inline.find({}, {"_id": 0}).limit(Page_Size)), Repeat)))
+        print(report("page, references", measure(lambda: list(store.col_book.find({}, {"_id": 0}).limit(Page_Size)), Repeat)))
+    finally:
+        pymongo.MongoClient(be_conf.DB_URL).drop_database(DB_Name)
+
+
+if __name__ == "__main__":
+    run_bench_picture()
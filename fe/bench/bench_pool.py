@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# 连接池: 固定工作线程数下，不同连接池大小的吞吐量、同时借出的连接数与等待空闲连接的时间
+# usage: python -m fe.bench.bench_pool
+import threading
+import time
+import pymongo
+from be import conf as be_conf
+from be.model.store import Store
+
+DB_Name = "bookstore_bench_pool"
+Threads = 32
+Pool_Sizes = [1, 4, 8, 16, 32, 64]
+Request_Per_Thread = 200
+
+
+def run_bench_pool():
+    try:
+        for pool_size in Pool_Sizes:
+            be_conf.Mongo_Max_Pool_Size = pool_size
+            store = Store(be_conf.DB_URL, DB_Name, reset=False, init=False)
+            store.col_user.update_one({"user_id": "bench"}, {"$set": {"balance": 0}}, upsert=True)
+
+            def worker():
+                for _ in range(Request_Per_Thread):
+                    store.col_user.find_one({"user_id": "bench"})
+
+            threads = [threading.Thread(target=worker) for _ in range(Threads)]
+            before = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            seconds = time.perf_counter() - before
+            stats = store.pool_metrics.stats()
+            print("pool {:>3}: {:8.0f} req/s max checked out {:>3} avg wait {:7.3f}ms max wait {:7.3f}ms".format(
+                pool_size, Threads * Request_Per_Thread / seconds, stats["max_checked_out"],
+                stats["avg_wait_ms"], stats["max_wait_ms"]))
+            store.myclient.close()
+    finally:
+        pymongo.MongoClient(be_conf.DB_URL).drop_database(DB_Name)
+
+
+if __name__ == "__main__":
+    run_bench_pool()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# 读写关注配置: 本地三节点副本集上，目录搜索与下单付款混合负载下，客户端默认配置、目录读主节点与目录读从节点的吞吐量
+# usage: python -m fe.bench.bench_replica
+# 设置 BOOKSTORE_BENCH_REPLICA_URL 时使用已有的副本集，否则用 PATH 中的 mongod 在临时目录启动三节点副本集，结束后关闭；
+# 每轮启动 python -m be.app <Workers> 作为独立的后端进程(端口 Port)，因此不要同时运行其他后端
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import pymongo
+import requests
+from urllib.parse import urljoin
+from fe.access.auth import Auth
+from fe.access.buyer import Buyer
+from fe.access.seller import Seller
+from fe.access import book
+from fe.bench.latency import percentile
+
+Replica_Set = "rs_bench"
+Members = [27217, 27218, 27219]
+Port = 5003
+URL = "http://127.0.0.1:{}/".format(Port)
+Workers = 4
+Clients = 64
+Seconds = 30
+Books = 200
+# 其余请求为店内标题搜索
+Order_Share = 0.2
+Runs = [
+    ("client defaults", {"BOOKSTORE_CONCERN_PROFILES": "0"}),
+    ("catalog on primary", {"BOOKSTORE_CATALOG_READ_PREFERENCE": "primary",
+                            "BOOKSTORE_HISTORY_READ_PREFERENCE": "primary"}),
+    ("catalog on secondaries", {"BOOKSTORE_CATALOG_READ_PREFERENCE": "secondaryPreferred",
+                                "BOOKSTORE_HISTORY_READ_PREFERENCE": "secondaryPreferred"}),
+]
+
+
+def start_replica_set(root: str) -> ([subprocess.Popen], str):
+    mongod = shutil.which("mongod")
+    if mongod is None:
+        raise RuntimeError("mongod not found; set BOOKSTORE_BENCH_REPLICA_URL to use a running replica set")
+    processes = []
+    for port in Members:
+        dbpath = os.path.join(root, str(port))
+        os.makedirs(dbpath)
+        processes.append(subprocess.Popen([
+            mongod, "--replSet", Replica_Set, "--port", str(port), "--bind_ip", "127.0.0.1",
+            "--dbpath", dbpath, "--logpath", os.path.join(dbpath, "mongod.log"),
+        ]))
+    seed = pymongo.MongoClient("127.0.0.1", Members[0], directConnection=True, serverSelectionTimeoutMS=30000)
+    seed.admin.command("ping")
+    seed.admin.command("replSetInitiate", {
+        "_id": Replica_Set,
+        "members": [{"_id": i, "host": "127.0.0.1:{}".format(port)} for i, port in enumerate(Members)],
+    })
+    # 等待选出主节点且所有从节点完成初始同步
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        states = [m["stateStr"] for m in seed.admin.command("replSetGetStatus")["members"]]
+        if states.count("PRIMARY") == 1 and states.count("SECONDARY") == len(Members) - 1:
+            break
+        time.sleep(0.5)
+    else:
+        raise RuntimeError("replica set did not come up")
+    seed.close()
+    hosts = ",".join("127.0.0.1:{}".format(port) for port in Members)
+    return processes, "mongodb://{}/?replicaSet={}".format(hosts, Replica_Set)
+
+
+def member_reads(db_url: str) -> {str: int}:
+    # 每个成员累计执行的查询、getMore 与命令(聚合计为命令)数，键为 "host (PRIMARY/SECONDARY)"
+    client = pymongo.MongoClient(db_url)
+    hello = client.admin.command("hello")
+    client.close()
+    reads = {}
+    for host in hello["hosts"]:
+        member = pymongo.MongoClient(host, directConnection=True)
+        counters = member.admin.command("serverStatus")["opcounters"]
+        role = "PRIMARY" if host == hello["primary"] else "SECONDARY"
+        reads["{} ({})".format(host, role)] = counters["query"] + counters["getmore"] + counters["command"]
+        member.close()
+    return reads
+
+
+def wait_ready(timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(urljoin(URL, "search/tags"), timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError("backend did not start")
+
+
+def prepare() -> ([Buyer], str, [book.Book]):
+    prefix = "bench_replica_{}".format(uuid.uuid1())
+    seller_id = prefix + "_seller"
+    Auth(URL).register(seller_id, seller_id)
+    seller = Seller(URL, seller_id, seller_id)
+    store_id = prefix + "_store"
+    seller.create_store(store_id)
+    books = book.BookDB().get_book_info(0, Books)
+    for bk in books:
+        seller.add_book(store_id, 10 ** 8, bk)
+    buyers = []
+    for i in range(Clients):
+        buyer_id = "{}_buyer_{}".format(prefix, i)
+        Auth(URL).register(buyer_id, buyer_id)
+        buyer = Buyer(URL, buyer_id, buyer_id)
+        buyer.add_funds(10 ** 12)
+        buyers.append(buyer)
+    return buyers, store_id, books
+
+
+def client(buyer: Buyer, store_id: str, books: [book.Book], deadline: float, searches: [float],
+           orders: [float], errors: [int]):
+    rng = random.Random()
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        before = time.perf_counter()
+        if rng.random() < Order_Share:
+            code, order_id = buyer.new_order(store_id, [(rng.choice(books).id, 1)])
+            if code == 200:
+                code = buyer.payment(order_id)
+            samples = orders
+        else:
+            r = session.get(urljoin(URL, "search/title_in_store"),
+                            params={"title": rng.choice(books).title, "store_id": store_id})
+            code = r.status_code
+            samples = searches
+        samples.append(time.perf_counter() - before)
+        if code != 200:
+            errors.append(code)
+
+
+def run_once(name: str, db_url: str, overrides: dict):
+    env = dict(os.environ, BOOKSTORE_DB_URL=db_url, BOOKSTORE_DB_NAME="bench_replica", BOOKSTORE_RESET="1",
+               BOOKSTORE_PORT=str(Port), BOOKSTORE_SEARCH_CACHE_SIZE="0", **overrides)
+    backend = subprocess.Popen([sys.executable, "-m", "be.app", str(Workers)], env=env)
+    try:
+        wait_ready()
+        buyers, store_id, books = prepare()
+        reads_before = member_reads(db_url)
+        searches, orders, errors = [], [], []
+        deadline = time.monotonic() + Seconds
+        threads = [threading.Thread(target=client, args=(buyer, store_id, books, deadline, searches, orders, errors))
+                   for buyer in buyers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        reads_after = member_reads(db_url)
+        print("{:24} search {:7.0f} req/s p95 {:6.1f} ms  order+payment {:6.0f} /s p95 {:6.1f} ms  errors {}".format(
+            name, len(searches) / Seconds, percentile(searches, 95) * 1000,
+            len(orders) / Seconds, percentile(orders, 95) * 1000, len(errors)))
+        for member in sorted(reads_after):
+            print("    {:36} {:9} ops".format(member, reads_after[member] - reads_before.get(member, 0)))
+    finally:
+        try:
+            requests.get(urljoin(URL, "shutdown"), timeout=5)
+        except requests.RequestException:
+            backend.terminate()
+        backend.wait(timeout=60)
+
+
+def run_bench_replica():
+    db_url = os.environ.get("BOOKSTORE_BENCH_REPLICA_URL")
+    processes = []
+    root = None
+    try:
+        if db_url is None:
+            root = tempfile.mkdtemp(prefix="bench_replica_")
+            processes, db_url = start_replica_set(root)
+        for name, overrides in Runs:
+            run_once(name, db_url, overrides)
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.wait(timeout=60)
+        if root is not None:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run_bench_replica()
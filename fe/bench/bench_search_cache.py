@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# 搜索结果缓存: Zipf 分布的查询混合下，直接查询与经缓存查询的吞吐量，以及穿插上新书时的命中率
+# usage: python -m fe.bench.bench_search_cache
+import random
+import time
+import uuid
+from be.model.book import Book
+from be.model.cache import search_cache, version_stamps, CATALOG_VERSION
+from be.model.store import get_db_conn
+
+Catalog_Size = 10000
+Distinct_Query = 1000
+Zipf_S = 1.1
+Query_Num = 20000
+Write_Every = 1000
+Page_Size = 10
+
+
+def zipf_queries(titles: [str], n: int) -> [str]:
+    weights = [1 / (k + 1) ** Zipf_S for k in range(len(titles))]
+    return random.choices(titles, weights=weights, k=n)
+
+
+def throughput(queries: [str], search) -> float:
+    before = time.perf_counter()
+    for i, title in enumerate(queries):
+        if Write_Every and i % Write_Every == Write_Every - 1:
+            # 等价于一次 add_book 使目录版本前进
+            version_stamps.bump(CATALOG_VERSION)
+        search(title)
+    return len(queries) / (time.perf_counter() - before)
+
+
+def run_bench_search_cache():
+    conn = get_db_conn()
+    prefix = "bench_cache_{}".format(uuid.uuid1())
+    titles = ["{}_{}".format(prefix, i) for i in range(Distinct_Query)]
+    conn.col_book.insert_many([
+        {"id": "{}_{}".format(prefix, i), "title": titles[i % Distinct_Query], "author": "a", "price": 1}
+        for i in range(Catalog_Size)
+    ])
+    try:
+        b = Book()
+        queries = zipf_queries(titles, Query_Num)
+        direct = throughput(queries, lambda title: b._search({"title": title}, "", 0, Page_Size))
+        search_cache.clear()
+        cached = throughput(queries, lambda title: b.search_title(title, 1, Page_Size))
+        print("direct {:8.0f} q/s".format(direct))
+        print("cached {:8.0f} q/s  x{:.1f}".format(cached, cached / direct))
+        print(search_cache.stats())
+    finally:
+        conn.col_book.delete_many({"id": {"$regex": "^" + prefix}})
+
+
+if __name__ == "__main__":
+    run_bench_search_cache()
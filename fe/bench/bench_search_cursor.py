@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# 搜索分页: 10 万条结果的查询上，skip/limit 翻页与游标(keyset)翻页在不同页深的延迟
+# usage: python -m fe.bench.bench_search_cursor
+import pymongo
+from be import conf as be_conf
+from be.model.book import Book
+from be.model.store import Store
+from fe.bench.latency import measure, report
+
+DB_Name = "bookstore_bench_search_cursor"
+Result_Size = 100000
+Page_Size = 10
+Pages = [1, 100, 1000, 5000, 10000]
+Repeat = 20
+
+
+def run_bench_search_cursor():
+    store = Store(be_conf.DB_URL, DB_Name, reset=True)
+    try:
+        for start in range(0, Result_Size, 10000):
+            store.col_book.insert_many([
+                {"id": "book_{:06d}".format(i), "title": "t", "author": "a", "price": 1, "tags": ["bench"]}
+                for i in range(start, min(Result_Size, start + 10000))
+            ])
+        b = Book()
+        b.conn = store
+        # 精确标签在 (tags, id) 索引上按 id 有序；前缀标签需要对全部匹配结果排序
+        conditions = [("exact ", {"tags": "bench"}), ("prefix", {"tags": {"$regex": "^ben"}})]
+        for name, condition in conditions:
+            for page in Pages:
+                skip = (page - 1) * Page_Size
+                # 游标即上一页最后一本书的 id
+                after = "book_{:06d}".format(skip - 1) if page > 1 else None
+                offset = b._search(condition, "", skip, Page_Size)
+                keyset = b._search(condition, "", 0, Page_Size, after=after)
+                assert [r["id"] for r in offset] == [r["id"] for r in keyset]
+                print(report("{} skip   page {:>5}".format(name, page),
+                             measure(lambda: b._search(condition, "", skip, Page_Size), Repeat)))
+                print(report("{} cursor page {:>5}".format(name, page),
+                             measure(lambda: b._search(condition, "", 0, Page_Size, after=after), Repeat)))
+    finally:
+        pymongo.MongoClient(be_conf.DB_URL).drop_database(DB_Name)
+
+
+if __name__ == "__main__":
+    run_bench_search_cursor()
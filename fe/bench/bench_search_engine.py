@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# 全文搜索: MongoDB $text 与进程内倒排索引(中文二元组 + BM25)的建索引耗时、内存与查询延迟
+# usage: python -m fe.bench.bench_search_engine
+import os
+import random
+import sqlite3 as sqlite
+import time
+import pymongo
+from be import conf as be_conf
+from be.model.store import Store
+from be.model.search_engine import InvertedIndexEngine, tokenize
+from fe.bench.latency import measure, report
+
+DB_Name = "bookstore_bench_search_engine"
+Catalog_Size = 100000
+Query_Num = 200
+Page_Size = 10
+
+
+def load_catalog(size: int) -> [dict]:
+    parent_path = os.path.dirname(os.path.dirname(__file__))
+    path = os.path.join(parent_path, "data/book_lx.db")
+    if not os.path.exists(path):
+        path = os.path.join(parent_path, "data/book.db")
+    conn = sqlite.connect(path)
+    rows = conn.execute("SELECT title, tags, book_intro, content FROM book").fetchall()
+    conn.close()
+    # 样本不足时复制，保证目录规模
+    return [{
+        "id": "book_{}".format(i),
+        "title": rows[i % len(rows)][0],
+        "tags": (rows[i % len(rows)][1] or "").split("\n"),
+        "book_intro": rows[i % len(rows)][2],
+        "content": rows[i % len(rows)][3],
+    } for i in range(size)]
+
+
+def sample_queries(books: [dict], n: int) -> [str]:
+    queries = []
+    while len(queries) < n:
+        words = tokenize(random.choice(books)["title"] or "")
+        if words:
+            queries.append(random.choice(words))
+    return queries
+
+
+def run_bench_search_engine():
+    books = load_catalog(Catalog_Size)
+    queries = sample_queries(books, Query_Num)
+
+    engine = InvertedIndexEngine()
+    before = time.perf_counter()
+    engine.build(books)
+    print("inverted build {} books: {:.2f}s {}".format(len(books), time.perf_counter() - before, engine.stats()))
+    it = iter(queries)
+    print(report("inverted rank", measure(lambda: engine.rank(next(it), Page_Size), len(queries))))
+    hits = sum(1 for q in queries if engine.rank(q))
+    print("inverted queries with results: {}/{}".format(hits, len(queries)))
+
+    store = Store(be_conf.DB_URL, DB_Name, reset=True)
+    try:
+        before = time.perf_counter()
+        for start in range(0, len(books), 10000):
+            store.col_book.insert_many([dict(b) for b in books[start:start + 10000]])
+        print("mongo insert + text index {} books: {:.2f}s".format(len(books), time.perf_counter() - before))
+        size = store.database.command("collStats", store.col_book.name)["indexSizes"]
+        print("mongo index sizes: {}".format(size))
+
+        def text_search(query):
+            return list(store.col_book.find({"$text": {"$search": query}}, {"_id": 0, "id": 1})
+                        .sort([("score", {"$meta": "textScore"})]).limit(Page_Size))
+
+        it = iter(queries)
+        print(report("mongo $text", measure(lambda: text_search(next(it)), len(queries))))
+        hits = sum(1 for q in queries if text_search(q))
+        print("mongo $text queries with results: {}/{}".format(hits, len(queries)))
+    finally:
+        pymongo.MongoClient(be_conf.DB_URL).drop_database(DB_Name)
+
+
+if __name__ == "__main__":
+    run_bench_search_engine()
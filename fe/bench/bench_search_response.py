@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# 搜索响应: 原实现(完整文档的 str() 表示)与 JSON + 默认字段投影的每页字节数和延迟
+# usage: python -m fe.bench.bench_search_response
+import json
+import uuid
+from be.model.book import Book, book_projection
+from be.model.store import get_db_conn
+from be.view.search import json_response
+from fe.access import book
+from fe.bench.latency import measure, report
+
+Page_Size = 10
+Repeat = 50
+
+
+def run_bench_search_response():
+    conn = get_db_conn()
+    tag = "bench_response_{}".format(uuid.uuid1())
+    books = book.BookDB().get_book_info(0, Page_Size)
+    docs = []
+    for bk in books:
+        doc = dict(bk.__dict__)
+        doc["id"] = "{}_{}".format(tag, bk.id)
+        doc["tags"] = [tag]
+        docs.append(doc)
+    conn.col_book.insert_many(docs)
+    try:
+        b = Book()
+        condition = {"tags": tag}
+
+        def legacy():
+            return str(b._search(condition, "", 0, Page_Size)).encode("utf-8")
+
+        def projected():
+            projection, _ = book_projection(None)
+            return json_response({"data": b._search(condition, "", 0, Page_Size, projection)}).get_data()
+
+        legacy_body = legacy()
+        projected_body = projected()
+        json.loads(projected_body)
+        print("legacy    {:>10} bytes/page".format(len(legacy_body)))
+        print("projected {:>10} bytes/page".format(len(projected_body)))
+        print(report("legacy str(full docs)", measure(legacy, Repeat)))
+        print(report("json default fields", measure(projected, Repeat)))
+    finally:
+        conn.col_book.delete_many({"tags": tag})
+
+
+if __name__ == "__main__":
+    run_bench_search_response()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# 店内搜索: 店铺只持有目录 1% 的书时，原实现(先分页全目录再逐条查店铺)与库内过滤的页延迟和结果数
+# usage: python -m fe.bench.bench_search_store
+import uuid
+from be.model.book import Book
+from be.model.store import get_db_conn
+from fe.bench.latency import measure, report
+
+Catalog_Size = 10000
+Store_Ratio = 0.01
+Page_Size = 10
+Repeat = 50
+
+
+def legacy_search_tag_in_store(tag: str, store_id: str, page_num: int, page_size: int) -> [dict]:
+    conn = get_db_conn()
+    result = conn.col_book.find({"tags": tag}, {"_id": 0}).skip((page_num - 1) * page_size).limit(page_size)
+    return [b for b in result
+            if conn.col_inventory.find_one({"store_id": store_id, "book_id": b["id"]}) is not None]
+
+
+def run_bench_search_store():
+    conn = get_db_conn()
+    tag = "bench_tag_{}".format(uuid.uuid1())
+    store_id = "bench_search_store_{}".format(uuid.uuid1())
+    step = int(1 / Store_Ratio)
+    conn.col_book.insert_many([
+        {"id": "{}_{}".format(tag, i), "title": "t", "author": "a", "price": 1, "tags": [tag]}
+        for i in range(Catalog_Size)
+    ])
+    conn.col_inventory.insert_many([
+        {"store_id": store_id, "book_id": "{}_{}".format(tag, i), "stock_level": 1}
+        for i in range(0, Catalog_Size, step)
+    ])
+    in_store = Catalog_Size // step
+    try:
+        b = Book()
+        for page in [1, in_store // Page_Size]:
+            legacy = legacy_search_tag_in_store(tag, store_id, page, Page_Size)
+            _, _, pushed, _ = b.search_tag_in_store(tag, store_id, page, Page_Size)
+            print("page {:>3}: legacy {} results, pushed-down {} results".format(page, len(legacy), len(pushed)))
+            print(report("legacy      page {:>3}".format(page),
+                         measure(lambda: legacy_search_tag_in_store(tag, store_id, page, Page_Size), Repeat)))
+            print(report("pushed-down page {:>3}".format(page),
+                         measure(lambda: b._search({"tags": tag}, store_id, (page - 1) * Page_Size, Page_Size), Repeat)))
+        pages = []
+        page = 1
+        while True:
+            _, _, result, _ = b.search_tag_in_store(tag, store_id, page, Page_Size)
+            if not result:
+                break
+            pages.extend(r["id"] for r in result)
+            page += 1
+        assert len(pages) == len(set(pages)) == in_store
+        print("all {} store books found in {} full pages".format(in_store, page - 1))
+    finally:
+        conn.col_book.delete_many({"tags": tag})
+        conn.col_inventory.delete_many({"store_id": store_id})
+
+
+if __name__ == "__main__":
+    run_bench_search_store()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# 冷启动(清空并重新灌入目录)与热启动(保留数据)的耗时对比
+# usage: python -m fe.bench.bench_startup
+import os
+import time
+import pymongo
+from be import conf as be_conf
+from be.model.store import Store
+from fe import conf
+from fe.access import book
+
+DB_Name = "bookstore_bench_startup"
+
+
+def seed_catalog(store: Store, book_db: book.BookDB) -> int:
+    row_no = 0
+    total = book_db.get_book_count()
+    while row_no < total:
+        books = book_db.get_book_info(row_no, conf.Data_Batch_Size)
+        if len(books) == 0:
+            break
+        store.col_book.insert_many([bk.__dict__ for bk in books])
+        row_no = row_no + len(books)
+    return row_no
+
+
+def run_bench_startup():
+    book_db = book.BookDB(True)
+    if not os.path.exists(book_db.book_db):
+        book_db = book.BookDB(conf.Use_Large_DB)
+    try:
+        before = time.perf_counter()
+        store = Store(be_conf.DB_URL, DB_Name, reset=True)
+        n = seed_catalog(store, book_db)
+        cold = time.perf_counter() - before
+        print("cold start (reset + seed {} books): {:.3f}s, of which init {:.3f}s".format(n, cold, store.init_seconds))
+
+        before = time.perf_counter()
+        store = Store(be_conf.DB_URL, DB_Name)
+        warm = time.perf_counter() - before
+        assert store.col_book.estimated_document_count() == n
+        print("warm start ({} books kept): {:.3f}s, of which init {:.3f}s".format(n, warm, store.init_seconds))
+    finally:
+        pymongo.MongoClient(be_conf.DB_URL).drop_database(DB_Name)
+
+
+if __name__ == "__main__":
+    run_bench_startup()
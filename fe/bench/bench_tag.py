@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# 标签搜索: 无锚点 $regex 与多键索引上的精确/前缀匹配在目录增长时的延迟
+# usage: python -m fe.bench.bench_tag
+import random
+import re
+import pymongo
+from be import conf as be_conf
+from be.model.store import Store
+from fe.bench.latency import measure, report
+
+DB_Name = "bookstore_bench_tag"
+Catalog_Sizes = [1000, 10000, 100000]
+Tag_Num = 2000
+Tags_Per_Book = 8
+Page_Size = 10
+Repeat = 50
+
+
+def run_bench_tag():
+    vocabulary = ["标签{:04d}".format(i) for i in range(Tag_Num)]
+    store = Store(be_conf.DB_URL, DB_Name, reset=True)
+    try:
+        size = 0
+        for target in Catalog_Sizes:
+            for start in range(size, target, 10000):
+                store.col_book.insert_many([
+                    {"id": "book_{}".format(i), "title": "t", "tags": random.sample(vocabulary, Tags_Per_Book)}
+                    for i in range(start, min(target, start + 10000))
+                ])
+            size = target
+            tag = random.choice(vocabulary)
+
+            def search(condition):
+                return lambda: list(store.col_book.find(condition, {"_id": 0}).limit(Page_Size))
+
+            print(report("unanchored regex {:>6} books".format(size), measure(search({"tags": {"$regex": tag[1:]}}), Repeat)))
+            print(report("exact            {:>6} books".format(size), measure(search({"tags": tag}), Repeat)))
+            print(report("prefix           {:>6} books".format(size),
+                         measure(search({"tags": {"$regex": "^" + re.escape(tag[:-1])}}), Repeat)))
+    finally:
+        pymongo.MongoClient(be_conf.DB_URL).drop_database(DB_Name)
+
+
+if __name__ == "__main__":
+    run_bench_tag()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# 令牌验证缓存: 鉴权密集的请求混合下，每次 check_token 的耗时(有缓存与无缓存)
+# usage: python -m fe.bench.bench_token
+import random
+import time
+import uuid
+from be.model.cache import token_cache
+from be.model.user import User
+
+User_Num = 200
+Check_Num = 20000
+# 每隔多少次验证有一个用户重新登录，使其旧令牌失效
+Login_Every = 500
+
+
+def run_checks(u: User, tokens: dict, users: [str], n: int) -> (float, int):
+    failed = 0
+    before = time.perf_counter()
+    for i in range(n):
+        user_id = random.choice(users)
+        if Login_Every and i % Login_Every == Login_Every - 1:
+            _, _, tokens[user_id] = u.login(user_id, user_id, "bench")
+        code, _ = u.check_token(user_id, tokens[user_id])
+        if code != 200:
+            failed += 1
+    return (time.perf_counter() - before) / n, failed
+
+
+def run_bench_token():
+    u = User()
+    prefix = "bench_token_{}".format(uuid.uuid1())
+    users = ["{}_{}".format(prefix, i) for i in range(User_Num)]
+    tokens = {}
+    for user_id in users:
+        u.register(user_id, user_id)
+        _, _, tokens[user_id] = u.login(user_id, user_id, "bench")
+    try:
+        token_cache.clear()
+        cached, failed = run_checks(u, tokens, users, Check_Num)
+        print("cached   {:8.1f} us/check  failed {}".format(cached * 1e6, failed))
+        print(token_cache.stats())
+        # max_size 0 evicts every entry as soon as it is stored
+        max_size = token_cache.max_size
+        token_cache.max_size = 0
+        try:
+            uncached, failed = run_checks(u, tokens, users, Check_Num)
+        finally:
+            token_cache.max_size = max_size
+        print("uncached {:8.1f} us/check  failed {}  x{:.1f}".format(uncached * 1e6, failed, uncached / cached))
+    finally:
+        u.conn.col_user.delete_many({"user_id": {"$in": users}})
+
+
+if __name__ == "__main__":
+    run_bench_token()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# 多进程服务: 1、2、4、8 个工作进程下，fe/bench 压测(下单 + 付款)的吞吐量
+# usage: python -m fe.bench.bench_workers
+# 每轮启动 python -m be.app <workers> 作为独立的后端进程，因此不要同时运行其他后端
+import os
+import subprocess
+import sys
+import time
+import requests
+from urllib.parse import urljoin
+from fe import conf
+from fe.bench.workload import Workload
+from fe.bench.session import Session
+
+Workers = [1, 2, 4, 8]
+
+
+def wait_ready(timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(urljoin(conf.URL, "search/tags"), timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError("backend did not start")
+
+
+def run_once(workers: int) -> float:
+    backend = subprocess.Popen([sys.executable, "-m", "be.app", str(workers)], env=dict(os.environ))
+    try:
+        wait_ready()
+        wl = Workload()
+        wl.gen_database()
+        sessions = [Session(wl) for _ in range(wl.session)]
+        before = time.perf_counter()
+        for ss in sessions:
+            ss.start()
+        for ss in sessions:
+            ss.join()
+        seconds = time.perf_counter() - before
+        done = sum(ss.new_order_ok + ss.payment_ok for ss in sessions)
+        return done / seconds
+    finally:
+        requests.get(urljoin(conf.URL, "shutdown"))
+        backend.wait(timeout=60)
+
+
+def run_bench_workers():
+    base = None
+    for workers in Workers:
+        tps = run_once(workers)
+        base = base or tps
+        print("{} workers: {:8.0f} ok requests/s  x{:.2f}".format(workers, tps, tps / base))
+
+
+if __name__ == "__main__":
+    run_bench_workers()
@@ -0,0 +1,25 @@
+import time
+
+
+def percentile(samples: [float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def measure(func, repeat: int) -> [float]:
+    # 返回每次调用的耗时(秒)
+    samples = []
+    for _ in range(repeat):
+        before = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - before)
+    return samples
+
+
+def report(name: str, samples: [float]) -> str:
+    return "{:<32} n={:<5} p50={:8.3f}ms p99={:8.3f}ms".format(
+        name, len(samples), percentile(samples, 50) * 1000, percentile(samples, 99) * 1000
+    )
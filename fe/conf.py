@@ -9,3 +9,5 @@ Default_Stock_Level = 1000000
 Default_User_Funds = 10000000
 Data_Batch_Size = 100
 Use_Large_DB = False
+# be/aio 的 asyncio 后端(test_async 在该端口启动)
+Async_URL = "http://127.0.0.1:5001/"
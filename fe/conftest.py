@@ -1,8 +1,9 @@
 import requests
 import threading
 from urllib.parse import urljoin
+from be import conf as be_conf
 from be import serve
-from be.model.store import init_completed_event
+from be.model.store import init_completed_event, query_shapes
 from fe import conf
 
 thread: threading.Thread = None
@@ -17,9 +18,17 @@ def run_backend():
 def pytest_configure(config):
     global thread
     print("frontend begin test")
+    # 记录启动之后模型发出的查询，test_index.py 最后检查它们的查询计划
+    be_conf.Record_Query_Shapes = True
     thread = threading.Thread(target=run_backend)
     thread.start()
     init_completed_event.wait()
+    query_shapes.recording = True
+
+
+def pytest_collection_modifyitems(session, config, items):
+    # test_index.py explains the queries the other tests sent, so it runs last
+    items.sort(key=lambda item: item.fspath.basename == "test_index.py")
 
 
 def pytest_unconfigure(config):
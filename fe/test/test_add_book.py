@@ -2,8 +2,11 @@ import pytest
 
 from fe import conf
 from fe.access.new_seller import register_new_seller
+from fe.access.new_buyer import register_new_buyer
 from fe.access import book
+from fe.access.search import RequestSearch
 import uuid
+from be.model.store import get_db_conn
 
 
 class TestAddBook:
@@ -49,3 +52,55 @@ class TestAddBook:
             self.seller.seller_id = self.seller.seller_id + "_x"
             code = self.seller.add_book(self.store_id, 0, b)
             assert code != 200
+
+    def test_shared_catalog_entry(self):
+        # 同一本书在多个店铺上架，目录中只有一条
+        other_store_id = self.store_id + "_other"
+        code = self.seller.create_store(other_store_id)
+        assert code == 200
+        b = self.books[0]
+        b.id = "test_add_books_book_id_{}".format(str(uuid.uuid1()))
+        b.title = b.id
+        for store_id in [self.store_id, other_store_id]:
+            code = self.seller.add_book(store_id, 0, b)
+            assert code == 200
+
+        rs = RequestSearch()
+        code, data = rs.request_search_data("title", title=b.title)
+        assert code == 200
+        assert [r["id"] for r in data] == [b.id]
+        for store_id in [self.store_id, other_store_id]:
+            code, data = rs.request_search_data("title_in_store", title=b.title, store_id=store_id)
+            assert code == 200
+            assert len(data) == 1
+
+    def test_other_store_cannot_rewrite_catalog(self):
+        # 其他卖家上架同一本书不会改写目录条目，每家店按自己的售价收款
+        b = self.books[0]
+        b.id = "test_add_books_book_id_{}".format(str(uuid.uuid1()))
+        b.title = b.id
+        b.price = 100
+        code = self.seller.add_book(self.store_id, 10, b)
+        assert code == 200
+
+        other_seller_id = self.seller_id + "_other"
+        other_store_id = self.store_id + "_other"
+        other = register_new_seller(other_seller_id, other_seller_id)
+        assert other.create_store(other_store_id) == 200
+        b.title = b.id + "_rewritten"
+        b.price = 1
+        code = other.add_book(other_store_id, 10, b)
+        assert code == 200
+
+        rs = RequestSearch()
+        code, _ = rs.request_search_data("title", title=b.id + "_rewritten")
+        assert code != 200
+        code, data = rs.request_search_data("title", title=b.id)
+        assert code == 200 and [r["price"] for r in data] == [100]
+
+        buyer_id = "test_add_books_buyer_id_{}".format(str(uuid.uuid1()))
+        buyer = register_new_buyer(buyer_id, buyer_id)
+        for store_id, price in [(self.store_id, 100), (other_store_id, 1)]:
+            code, order_id = buyer.new_order(store_id, [(b.id, 2)])
+            assert code == 200
+            assert get_db_conn().col_order.find_one({"order_id": order_id})["price"] == 2 * price
@@ -0,0 +1,156 @@
+import base64
+import threading
+import time
+import uuid
+import pytest
+import requests
+from urllib.parse import urljoin, urlparse
+from fe import conf
+from fe.access import book
+from fe.access.auth import Auth
+from fe.access.buyer import Buyer
+from fe.access.metrics import get_metrics
+from fe.access.picture import RequestPicture
+from fe.access.search import RequestSearch
+from fe.access.seller import Seller
+from be.aio import app
+
+
+@pytest.fixture(scope="module", autouse=True)
+def async_backend():
+    # the asyncio back end, beside the Flask one conftest.py starts
+    url = urlparse(conf.Async_URL)
+    thread = threading.Thread(target=app.serve, args=(url.hostname, url.port))
+    thread.start()
+    deadline = time.monotonic() + 60
+    while app.server is None or not app.server.started:
+        assert thread.is_alive() and time.monotonic() < deadline
+        time.sleep(0.1)
+    yield
+    requests.get(urljoin(conf.Async_URL, "shutdown"))
+    thread.join()
+
+
+class TestAsync:
+    @pytest.fixture(autouse=True)
+    def pre_run_initialization(self):
+        self.seller_id = "test_async_seller_id_{}".format(str(uuid.uuid1()))
+        self.store_id = "test_async_store_id_{}".format(str(uuid.uuid1()))
+        self.buyer_id = "test_async_buyer_id_{}".format(str(uuid.uuid1()))
+        self.password = self.seller_id
+        self.auth = Auth(conf.Async_URL)
+        assert self.auth.register(self.seller_id, self.password) == 200
+        assert self.auth.register(self.buyer_id, self.password) == 200
+        self.seller = Seller(conf.Async_URL, self.seller_id, self.password)
+        self.buyer = Buyer(conf.Async_URL, self.buyer_id, self.password)
+        assert self.seller.create_store(self.store_id) == 200
+        self.books = book.BookDB(conf.Use_Large_DB).get_book_info(0, 3)
+        for bk in self.books:
+            assert self.seller.add_book(self.store_id, 10, bk) == 200
+        yield
+
+    def test_auth(self):
+        assert self.auth.register(self.buyer_id, self.password) != 200
+        assert self.auth.logout(self.buyer_id, self.buyer.token) == 200
+        assert self.auth.logout(self.buyer_id, self.buyer.token) != 200
+        assert self.auth.password(self.buyer_id, self.password, self.password + "_new") == 200
+        code, _ = self.auth.login(self.buyer_id, self.password, "terminal")
+        assert code != 200
+
+    def test_seller(self):
+        assert self.seller.create_store(self.store_id) != 200
+        assert self.seller.add_book(self.store_id, 10, self.books[0]) != 200
+        assert self.seller.add_stock_level(self.seller_id, self.store_id, self.books[0].id, 5) == 200
+        assert self.seller.add_stock_level(self.seller_id, self.store_id, self.books[0].id + "_x", 5) != 200
+
+    def test_order_and_pay(self):
+        code, order_id = self.buyer.new_order(self.store_id, [(bk.id, 2) for bk in self.books])
+        assert code == 200
+        assert self.buyer.payment(order_id) != 200
+        assert self.buyer.add_funds(sum((bk.price or 0) * 2 for bk in self.books)) == 200
+        assert self.buyer.payment(order_id) == 200
+        assert self.buyer.payment(order_id) != 200
+        assert self.seller.deliver(self.seller_id, order_id) == 200
+
+    def test_history_and_receive(self):
+        code, order_id = self.buyer.new_order(self.store_id, [(self.books[0].id, 1)])
+        assert code == 200
+        assert self.buyer.receive(self.buyer_id, order_id) != 200
+        assert self.seller.deliver(self.seller_id, order_id) != 200
+        assert self.buyer.add_funds(self.books[0].price or 0) == 200
+        assert self.buyer.payment(order_id) == 200
+        assert self.buyer.receive(self.buyer_id, order_id) != 200
+        assert self.seller.deliver(self.seller_id, order_id) == 200
+        assert self.buyer.receive(self.buyer_id + "_x", order_id) != 200
+        assert self.buyer.receive(self.buyer_id, order_id) == 200
+        code, orders, _ = self.buyer.check_hist_order_page(self.buyer_id)
+        assert code == 200
+        assert [o["order_id"] for o in orders] == [order_id]
+        code, orders, _ = self.buyer.check_hist_order_page(self.buyer_id, status="bad")
+        assert code != 200
+        assert self.buyer.check_hist_order(self.buyer_id + "_x") != 200
+
+    def test_tag_dictionary(self):
+        tag = "test_async_tag_{}".format(str(uuid.uuid1()))
+        bk = book.BookDB(conf.Use_Large_DB).get_book_info(3, 1)[0]
+        # a new catalog entry, only those count their tags
+        bk.id = tag
+        bk.tags = [tag]
+        assert self.seller.add_book(self.store_id, 1, bk) == 200
+        rs = RequestSearch()
+        rs.url_prefix = urljoin(conf.Async_URL, "search")
+        code, tags = rs.request_tag_dictionary(prefix=tag)
+        assert code == 200
+        assert tags == [{"tag": tag, "count": 1}]
+        code, tags = rs.request_tag_dictionary(prefix=tag, limit=0)
+        assert code == 400
+        assert tags == []
+
+    def test_new_order_errors(self):
+        code, _ = self.buyer.new_order(self.store_id + "_x", [(self.books[0].id, 1)])
+        assert code != 200
+        code, _ = self.buyer.new_order(self.store_id, [(self.books[0].id, 11)])
+        assert code != 200
+        code, _ = self.buyer.new_order(self.store_id, [(self.books[0].id + "_x", 1)])
+        assert code != 200
+
+    def test_search(self):
+        r = requests.get(urljoin(conf.Async_URL, "search/title_in_store"),
+                         params={"title": self.books[0].title, "store_id": self.store_id, "fields": "id,title"})
+        res = r.json()
+        assert res["code"] == 200
+        assert [b["id"] for b in res["data"]] == [self.books[0].id]
+        assert set(res["data"][0]) == {"id", "title"}
+        r = requests.get(urljoin(conf.Async_URL, "search/tag"), params={"tag": "x", "mode": "bad"})
+        assert r.json()["code"] != 200
+        r = requests.get(urljoin(conf.Async_URL, "search/nothing"))
+        assert r.status_code == 404
+
+    def test_metrics(self):
+        requests.get(urljoin(conf.Async_URL, "search/nothing"))
+        code, text = get_metrics(conf.Async_URL)
+        assert code == 200
+        assert 'route="/auth/register",method="POST",status="200"' in text
+        assert 'route="unmatched",method="GET",status="404"' in text
+
+    def test_picture_range(self):
+        picture = b"\x89PNG\r\n\x1a\n" + uuid.uuid4().bytes * 64
+        bk = book.BookDB(conf.Use_Large_DB).get_book_info(3, 1)[0]
+        bk.id = "test_async_picture_{}".format(str(uuid.uuid1()))
+        bk.pictures = [base64.b64encode(picture).decode("utf-8")]
+        assert self.seller.add_book(self.store_id, 1, bk) == 200
+        # the same answers as the Flask back end
+        for url in (conf.Async_URL, conf.URL):
+            rp = RequestPicture(url)
+            r = rp.get_picture(bk.id, 0, {"Range": "bytes=0-7"})
+            assert r.status_code == 206
+            assert r.content == picture[:8]
+            assert r.headers["Content-Range"] == "bytes 0-7/{}".format(len(picture))
+            r = rp.get_picture(bk.id, 0, {"Range": "bytes=-4"})
+            assert r.status_code == 206
+            assert r.content == picture[-4:]
+            r = rp.get_picture(bk.id, 0, {"Range": "bytes={}-".format(len(picture))})
+            assert r.status_code == 416
+            r = rp.get_picture(bk.id, 0, {"Range": "bytes=0-7", "If-Range": '"stale"'})
+            assert r.status_code == 200
+            assert r.content == picture
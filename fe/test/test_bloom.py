@@ -0,0 +1,72 @@
+import uuid
+
+import pytest
+from be import conf
+from be.model.bloom import BloomFilter, user_filter, store_filter, book_filter, book_key, rebuild_filters
+from be.model.store import get_db_conn
+from fe.access import auth
+from fe.access.new_buyer import register_new_buyer
+from fe.test.gen_book_data import GenBook
+from fe import conf as fe_conf
+
+
+class TestBloomFilter:
+    @pytest.fixture(autouse=True)
+    def pre_run_initialization(self, monkeypatch):
+        monkeypatch.setattr(conf, "Bloom_Filter", True)
+        rebuild_filters(get_db_conn())
+        self.seller_id = "test_bloom_seller_id_{}".format(str(uuid.uuid1()))
+        self.store_id = "test_bloom_store_id_{}".format(str(uuid.uuid1()))
+        self.buyer_id = "test_bloom_buyer_id_{}".format(str(uuid.uuid1()))
+        self.password = self.buyer_id
+        yield
+
+    def assert_present(self, buy_book_id_list):
+        assert user_filter.might_contain(self.seller_id)
+        assert user_filter.might_contain(self.buyer_id)
+        assert store_filter.might_contain(self.store_id)
+        for book_id, _ in buy_book_id_list:
+            assert book_filter.might_contain(book_key(self.store_id, book_id))
+
+    def test_no_false_negatives(self):
+        assert not user_filter.might_contain(self.buyer_id)
+        assert not store_filter.might_contain(self.store_id)
+        buyer = register_new_buyer(self.buyer_id, self.password)
+        gen_book = GenBook(self.seller_id, self.store_id)
+        ok, buy_book_id_list = gen_book.gen(non_exist_book_id=False, low_stock_level=False)
+        assert ok
+        self.assert_present(buy_book_id_list)
+        code, _ = auth.Auth(fe_conf.URL).login(self.buyer_id, self.password, "terminal")
+        assert code == 200
+        code, _ = buyer.new_order(self.store_id, buy_book_id_list)
+        assert code == 200
+
+    def test_rebuild_after_reset(self):
+        register_new_buyer(self.buyer_id, self.password)
+        gen_book = GenBook(self.seller_id, self.store_id)
+        ok, buy_book_id_list = gen_book.gen(non_exist_book_id=False, low_stock_level=False)
+        assert ok
+        # 跳过模型直接写入的 id 在重建后可见
+        user_id = self.buyer_id + "_direct"
+        get_db_conn().col_user.insert_one({"user_id": user_id})
+        assert not user_filter.might_contain(user_id)
+        rebuild_filters(get_db_conn(), clear=True)
+        assert user_filter.might_contain(user_id)
+        self.assert_present(buy_book_id_list)
+        assert not user_filter.might_contain(user_id + "_x")
+
+    def test_rebuild_keeps_concurrent_adds(self):
+        bloom = BloomFilter(1000, 0.01)
+        bloom.rebuild(["a"])
+
+        def keys():
+            yield "b"
+            # another worker adds an id the rebuild's scan does not see
+            bloom.add("c")
+            yield "d"
+
+        bloom.rebuild(keys())
+        assert all(bloom.might_contain(key) for key in "abcd")
+        bloom.rebuild(["e"], clear=True)
+        assert bloom.might_contain("e")
+        assert not any(bloom.might_contain(key) for key in "abcd")
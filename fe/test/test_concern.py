@@ -0,0 +1,54 @@
+import uuid
+
+import pytest
+from pymongo import WriteConcern
+from pymongo.read_concern import ReadConcern
+from be import conf
+from be.model import store
+from be.model.book import store_page
+from be.model.cache import search_cache, CATALOG_VERSION
+from be.model.store import get_db_conn
+
+
+class TestConcernProfiles:
+    def test_profiles(self):
+        if not conf.Concern_Profiles:
+            pytest.skip("concern profiles are turned off")
+        settlement = store.profile_options(store.SETTLEMENT)
+        assert settlement["write_concern"].document == {"w": "majority", "j": True}
+        assert settlement["read_concern"].level == "majority"
+        assert settlement["read_preference"].mongos_mode == "primary"
+        order_write = store.profile_options(store.ORDER_WRITE)
+        assert order_write["write_concern"].document == {"w": "majority"}
+        assert order_write["read_preference"].mongos_mode == "primary"
+        catalog = store.profile_options(store.CATALOG_READ)
+        assert catalog["write_concern"] == WriteConcern()
+        assert catalog["read_preference"].mongos_mode == conf.Catalog_Read_Preference
+
+    def test_profiles_off(self, monkeypatch):
+        monkeypatch.setattr(conf, "Concern_Profiles", False)
+        for name in store.PROFILES:
+            assert store.profile_options(name) == {}
+            assert store.reads_primary(name)
+
+    def test_unknown_read_preference(self, monkeypatch):
+        with pytest.raises(ValueError):
+            store.read_preference("secondarypreferred")
+        monkeypatch.setattr(conf, "Concern_Profiles", True)
+        monkeypatch.setitem(store.PROFILES, store.CATALOG_READ, (WriteConcern(), ReadConcern("local"), "bogus"))
+        with pytest.raises(ValueError):
+            store.Profile(get_db_conn().database, store.CATALOG_READ)
+
+    def test_secondary_reads_not_cached(self, monkeypatch):
+        monkeypatch.setattr(conf, "Concern_Profiles", True)
+        monkeypatch.setitem(store.PROFILES, store.CATALOG_READ,
+                            (WriteConcern(), ReadConcern("local"), "secondaryPreferred"))
+        assert not store.reads_primary(store.CATALOG_READ)
+        key = ("test_concern", str(uuid.uuid1()))
+        _, versions = search_cache.lookup(key, [CATALOG_VERSION])
+        store_page(key, versions, [{"id": "a"}], 0, 10, True)
+        assert search_cache.lookup(key, [CATALOG_VERSION])[0] is None
+
+        monkeypatch.setitem(store.PROFILES, store.CATALOG_READ, (WriteConcern(), ReadConcern("local"), "primary"))
+        store_page(key, versions, [{"id": "a"}], 0, 10, True)
+        assert search_cache.lookup(key, [CATALOG_VERSION])[0] is not None
@@ -1,7 +1,8 @@
 import pytest
 from fe.test.gen_book_data import GenBook
 from fe.access.new_buyer import register_new_buyer
-from fe.access.book import Book
+from fe import conf
+from fe.access.book import Book, BookDB
 import uuid
 
 import random
@@ -80,3 +81,44 @@ class Testhistoryorder:
     def test_no_orders(self):
         code = self.buyer.check_hist_order(self.buyer_id)
         assert code == 200
+
+    def test_pagination(self):
+        seller_id = "test_check_hist_order_seller_id_{}".format(str(uuid.uuid1()))
+        store_id = "test_check_hist_order_store_id_{}".format(str(uuid.uuid1()))
+        gen_book = GenBook(seller_id, store_id)
+        bk = BookDB(conf.Use_Large_DB).get_book_info(0, 1)[0]
+        code = gen_book.seller.add_book(store_id, 10, bk)
+        assert code == 200
+        order_ids = []
+        for i in range(3):
+            code, order_id = self.buyer.new_order(store_id, [(bk.id, 1)])
+            assert code == 200
+            order_ids.append(order_id)
+
+        code, orders, cursor = self.buyer.check_hist_order_page(self.buyer_id, page_size=2)
+        assert code == 200
+        assert len(orders) == 2 and cursor is not None
+        code, more, cursor = self.buyer.check_hist_order_page(self.buyer_id, cursor=cursor, page_size=2)
+        assert code == 200
+        assert len(more) == 1 and cursor is None
+        assert sorted(o["order_id"] for o in orders + more) == sorted(order_ids)
+
+        code, orders, _ = self.buyer.check_hist_order_page(self.buyer_id, status="unpaid")
+        assert code == 200
+        assert len(orders) == 3
+        code, orders, _ = self.buyer.check_hist_order_page(self.buyer_id, status="cancelled")
+        assert code == 200
+        assert orders == "No orders found "
+
+    def test_invalid_status(self):
+        code, _, _ = self.buyer.check_hist_order_page(self.buyer_id, status="lost")
+        assert code != 200
+
+    def test_invalid_cursor(self):
+        code, _, _ = self.buyer.check_hist_order_page(self.buyer_id, cursor="x")
+        assert code != 200
+
+    def test_invalid_page_size(self):
+        for page_size in (0, -1, "x"):
+            code, _, _ = self.buyer.check_hist_order_page(self.buyer_id, page_size=page_size)
+            assert code == 400
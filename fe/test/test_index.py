@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import pytest
+
+from be.model.store import get_db_conn, explain_collscans, explain_fetches, query_shapes, QueryShapes, \
+    coverable, placeholders
+
+
+def recorded_shapes() -> [tuple]:
+    # recorded by fe/conftest.py while the other tests ran
+    shapes = query_shapes.shapes()
+    if not shapes:
+        pytest.skip("no queries recorded; run with the rest of fe/test")
+    return shapes
+
+
+class TestIndex:
+    def test_no_collscan(self):
+        collscans = explain_collscans(get_db_conn().database, recorded_shapes())
+        assert collscans == [], "queries without index: {}".format(collscans)
+
+    def test_covered_lookups(self):
+        fetches = explain_fetches(get_db_conn().database, recorded_shapes())
+        assert fetches == [], "lookups reading documents: {}".format(fetches)
+
+    def test_shapes_recorded(self):
+        shapes = QueryShapes()
+
+        def send(name, command):
+            shapes.started(SimpleNamespace(command_name=name, command=dict({name: command.pop("on")}, **command)))
+
+        send("find", {"on": "user", "filter": {"user_id": "a"}, "limit": 1})
+        shapes.recording = True
+        send("find", {"on": "user", "filter": {"user_id": "b"}, "projection": {"_id": 0, "user_id": 1}, "limit": 1})
+        send("find", {"on": "user", "filter": {"user_id": "c"}, "projection": {"_id": 0, "user_id": 1}, "limit": 1})
+        send("update", {"on": "order", "updates": [{"q": {"order_id": "o", "status": 1}, "u": {}}]})
+        send("aggregate", {"on": "inventory", "pipeline": [
+            {"$match": {"store_id": "s", "book_id": {"$in": ["x", "y"]}}},
+            {"$lookup": {"from": "books", "localField": "book_id", "foreignField": "id", "as": "b"}},
+        ]})
+        send("find", {"on": "books", "filter": {"tags": {"$regex": "^abc"}}, "sort": {"id": 1}})
+        recorded = [(c, f) for c, f, *_ in shapes.shapes()]
+        assert len(recorded) == 5
+        for shape in [
+            ("user", {"user_id": ""}),
+            ("order", {"order_id": "", "status": 0}),
+            ("inventory", {"store_id": "", "book_id": {"$in": [""]}}),
+            ("books", {"id": ""}),
+            ("books", {"tags": {"$regex": "^x"}}),
+        ]:
+            assert shape in recorded
+
+    def test_placeholders(self):
+        condition = {"$or": [{"order_id": "a", "status": 1}, {"order_id": "a", "create_time": {"$lt": 3}}],
+                     "book_id": {"$in": ["a", "b", "c"]}}
+        assert placeholders(condition) == {
+            "$or": [{"order_id": "", "status": 0}, {"order_id": "", "create_time": {"$lt": 0}}],
+            "book_id": {"$in": [""]}}
+
+    def test_coverable(self):
+        assert coverable("inventory", {"store_id": "", "book_id": ""}, {"_id": 0, "store_id": 1, "book_id": 1})
+        assert coverable("order", {"order_id": "", "status": 0}, {"_id": 0, "order_id": 1, "status": 1})
+        assert not coverable("store", {"store_id": ""}, {"_id": 0, "store_id": 1, "user_id": 1})
+        assert not coverable("user", {"user_id": ""}, {"_id": 1, "user_id": 1, "password": 1})
@@ -1,7 +1,11 @@
 import time
 
 import pytest
+import requests
+from urllib.parse import urljoin
 
+from be.model import identity
+from be.model.user import User
 from fe.access import auth
 from fe import conf
 
@@ -37,3 +41,55 @@ class TestLogin:
     def test_error_password(self):
         code, token = self.auth.login(self.user_id, self.password + "_x", self.terminal)
         assert code == 401
+
+    def test_logout_twice(self):
+        code, token = self.auth.login(self.user_id, self.password, self.terminal)
+        assert code == 200
+
+        code = self.auth.logout(self.user_id, token)
+        assert code == 200
+
+        code = self.auth.logout(self.user_id, token)
+        assert code == 401
+
+    def test_old_token_after_login(self):
+        code, old_token = self.auth.login(self.user_id, self.password, self.terminal)
+        assert code == 200
+        code, token = self.auth.login(self.user_id, self.password, self.terminal)
+        assert code == 200
+
+        code = self.auth.logout(self.user_id, old_token)
+        assert code == 401
+
+        code = self.auth.logout(self.user_id, token)
+        assert code == 200
+
+    def test_token_checked_once_per_request(self, monkeypatch):
+        code, token = self.auth.login(self.user_id, self.password, self.terminal)
+        assert code == 200
+        checks = []
+        reads = []
+        check_token = User._check_token
+        get_user = User.get_user
+        monkeypatch.setattr(User, "_check_token", lambda u, *args: checks.append(args) or check_token(u, *args))
+        monkeypatch.setattr(User, "get_user", lambda u, user_id: reads.append(user_id) or get_user(u, user_id))
+        # checked before the view and again by User.logout: one check, one read
+        code = self.auth.logout(self.user_id, token)
+        assert code == 200
+        assert checks == [(self.user_id, token)]
+        assert len(reads) <= 1
+
+        # endpoints that do not authenticate never check the token
+        checks.clear()
+        requests.post(urljoin(conf.URL, "buyer/add_funds"), headers={"token": token},
+                      json={"user_id": self.user_id, "password": self.password, "add_value": 1})
+        assert checks == []
+
+    def test_preload_error(self, monkeypatch):
+        def fail(*args):
+            raise RuntimeError("preload failed")
+
+        monkeypatch.setattr(identity, "preload", fail)
+        r = requests.post(urljoin(conf.URL, "seller/create_store"), json={"user_id": self.user_id, "store_id": "x"})
+        assert r.status_code == 530
+        assert r.json() == {"message": "preload failed"}
@@ -0,0 +1,103 @@
+import json
+import os
+import re
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+from urllib.parse import urljoin
+
+from be.model import metrics
+from be.model.metrics import Histogram
+from be.model.pool import PoolMetrics
+from fe.access import auth
+from fe.access.metrics import get_metrics
+from fe import conf
+
+# name{labels} value
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[^}]*\})? [-+0-9.eEInf]+$')
+
+
+def series_value(text: str, prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+class TestMetrics:
+    @pytest.fixture(autouse=True)
+    def pre_run_initialization(self):
+        self.auth = auth.Auth(conf.URL)
+        self.user_id = "test_metrics_{}".format(time.time())
+        assert self.auth.register(self.user_id, self.user_id) == 200
+        yield
+
+    def test_format(self):
+        code, text = get_metrics(conf.URL)
+        assert code == 200
+        for line in text.splitlines():
+            assert line.startswith("# HELP ") or line.startswith("# TYPE ") or SAMPLE.match(line), line
+        assert "# TYPE bookstore_http_request_duration_seconds histogram" in text
+        assert "# TYPE bookstore_mongo_command_duration_seconds histogram" in text
+        assert "# TYPE bookstore_expiry_sweep_duration_seconds histogram" in text
+
+    def test_request_counted(self):
+        count = 'bookstore_http_request_duration_seconds_count{route="/auth/login",method="POST",status="401"}'
+        _, text = get_metrics(conf.URL)
+        before = series_value(text, count)
+        code, _ = self.auth.login(self.user_id, self.user_id + "_x", "terminal")
+        assert code == 401
+        _, text = get_metrics(conf.URL)
+        assert series_value(text, count) == before + 1
+
+    def test_unmatched_route(self):
+        r = requests.get(urljoin(conf.URL, "no_such_route"))
+        assert r.status_code == 404
+        _, text = get_metrics(conf.URL)
+        assert 'route="unmatched",method="GET",status="404"' in text
+
+    def test_pool(self, monkeypatch):
+        # a client's pool events, exported under its label
+        pool = PoolMetrics()
+        monkeypatch.setitem(metrics.pool_sources, "test", pool.stats)
+        pool.connection_created(None)
+        pool.connection_checked_out(SimpleNamespace(duration=0.25))
+        pool.connection_checked_out(SimpleNamespace(duration=0.5))
+        pool.connection_checked_in(None)
+        _, text = get_metrics(conf.URL)
+        assert series_value(text, 'bookstore_mongo_pool_checkouts_total{client="test"}') == 2
+        assert series_value(text, 'bookstore_mongo_pool_checkout_wait_seconds_total{client="test"}') == 0.75
+        assert series_value(text, 'bookstore_mongo_pool_connections{client="test"}') == 1
+        assert series_value(text, 'bookstore_mongo_pool_checked_out{client="test"}') == 1
+        assert 'bookstore_mongo_pool_connections{client="sync"}' in text
+
+    def test_histogram_buckets(self):
+        h = Histogram("h", "test", ("a",), (0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            h.observe(("x",), value)
+        lines = h.render()
+        assert 'h_bucket{a="x",le="0.1"} 2' in lines
+        assert 'h_bucket{a="x",le="1.0"} 3' in lines
+        assert 'h_bucket{a="x",le="+Inf"} 4' in lines
+        assert 'h_count{a="x"} 4' in lines
+
+    def test_workers_summed(self, tmp_path, monkeypatch):
+        # another worker's snapshot file is added to this process's series
+        monkeypatch.setattr(metrics, "_shared_dir", str(tmp_path))
+        labels = ["/auth/login", "POST", "401"]
+        before = metrics.collect()[0].get(tuple(labels))
+        buckets = [1] + [0] * len(metrics.LATENCY_BUCKETS) + [0.0002]
+        (tmp_path / "1.json").write_text(json.dumps({
+            metrics.http_request_seconds.name: [[labels, buckets]],
+            metrics.mongo_command_failures.name: [[["find", "x"], 2]],
+        }))
+        merged = metrics.collect()
+        series = merged[0][tuple(labels)]
+        assert sum(series[:-1]) == (sum(before[:-1]) if before else 0) + 1
+        assert merged[2][("find", "x")] >= 2
+        metrics.flush()
+        assert (tmp_path / "{}.json".format(os.getpid())).exists()
+        _, text = get_metrics(conf.URL)
+        assert 'bookstore_mongo_command_failures_total{command="find",collection="x"}' in text
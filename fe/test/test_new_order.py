@@ -1,8 +1,14 @@
+import threading
+
 import pytest
 
+from fe import conf
+from fe.access import book
 from fe.test.gen_book_data import GenBook
 from fe.access.new_buyer import register_new_buyer
 import uuid
+from be.model.buyer import Buyer
+from be.model.store import get_db_conn
 
 
 class TestNewOrder:
@@ -56,3 +62,34 @@ class TestNewOrder:
         assert ok
         code, _ = self.buyer.new_order(self.store_id + "_x", buy_book_id_list)
         assert code != 200
+
+    def test_low_stock_level_releases_reserved(self):
+        seller = self.gen_book.seller
+        books = book.BookDB(conf.Use_Large_DB).get_book_info(0, 3)
+        for bk in books:
+            code = seller.add_book(self.store_id, 10, bk)
+            assert code == 200
+        # 库存在下单检查之后被买走：最后一项预留失败，前面已预留的库存应被释放，且不会插入新的库存行
+        ok, book_id = Buyer()._reserve_stock(self.store_id, [(books[0].id, 10), (books[1].id, 10), (books[2].id, 11)])
+        assert not ok and book_id == books[2].id
+        col_inventory = get_db_conn().col_inventory
+        for bk in books:
+            rows = list(col_inventory.find({"store_id": self.store_id, "book_id": bk.id}))
+            assert [r["stock_level"] for r in rows] == [10]
+        code, _ = self.buyer.new_order(self.store_id, [(books[0].id, 10), (books[1].id, 10)])
+        assert code == 200
+
+    def test_concurrent_orders_never_oversell(self):
+        seller = self.gen_book.seller
+        bk = book.BookDB(conf.Use_Large_DB).get_book_info(0, 1)[0]
+        assert seller.add_book(self.store_id, 10, bk) == 200
+        codes = []
+        threads = [threading.Thread(target=lambda: codes.append(self.buyer.new_order(self.store_id, [(bk.id, 3)])[0]))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert codes.count(200) == 3
+        row = get_db_conn().col_inventory.find_one({"store_id": self.store_id, "book_id": bk.id})
+        assert row["stock_level"] == 1
@@ -1,3 +1,5 @@
+import threading
+
 import pytest
 
 from fe.access.buyer import Buyer
@@ -5,6 +7,7 @@ from fe.test.gen_book_data import GenBook
 from fe.access.new_buyer import register_new_buyer
 from fe.access.book import Book
 import uuid
+from be.model.store import get_db_conn
 
 
 class TestPayment:
@@ -70,3 +73,34 @@ class TestPayment:
 
         code = self.buyer.payment(self.order_id)
         assert code != 200
+
+    def test_not_suff_funds_then_pay(self):
+        code = self.buyer.add_funds(self.total_price - 1)
+        assert code == 200
+        code = self.buyer.payment(self.order_id)
+        assert code != 200
+        # the failed payment left the order unpaid and both balances untouched
+        seller = get_db_conn().col_user.find_one({"user_id": self.seller_id})
+        assert seller["balance"] == 0
+        code = self.buyer.add_funds(1)
+        assert code == 200
+        code = self.buyer.payment(self.order_id)
+        assert code == 200
+        user = get_db_conn().col_user.find_one({"user_id": self.buyer_id})
+        assert user["balance"] == 0
+
+    def test_concurrent_pay(self):
+        code = self.buyer.add_funds(self.total_price * 2)
+        assert code == 200
+        codes = []
+        threads = [threading.Thread(target=lambda: codes.append(self.buyer.payment(self.order_id)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert codes.count(200) == 1
+        user = get_db_conn().col_user.find_one({"user_id": self.buyer_id})
+        assert user["balance"] == self.total_price
+        seller = get_db_conn().col_user.find_one({"user_id": self.seller_id})
+        assert seller["balance"] == self.total_price
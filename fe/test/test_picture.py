@@ -0,0 +1,63 @@
+import base64
+import hashlib
+import json
+import pytest
+import uuid
+from fe import conf
+from fe.access import book
+from fe.access.new_seller import register_new_seller
+from fe.access.picture import RequestPicture
+from fe.access.search import RequestSearch
+
+
+class TestPicture:
+    @pytest.fixture(autouse=True)
+    def pre_run_initialization(self):
+        self.seller_id = "test_picture_seller_id_{}".format(str(uuid.uuid1()))
+        self.store_id = "test_picture_store_id_{}".format(str(uuid.uuid1()))
+        self.seller = register_new_seller(self.seller_id, self.seller_id)
+        code = self.seller.create_store(self.store_id)
+        assert code == 200
+
+        self.picture = b"\x89PNG\r\n\x1a\n" + uuid.uuid4().bytes * 64
+        self.book = book.BookDB().get_book_info(0, 1)[0]
+        self.book.id = "test_picture_book_id_{}".format(str(uuid.uuid1()))
+        self.book.title = self.book.id
+        self.book.pictures = [base64.b64encode(self.picture).decode("utf-8")] * 2
+        code = self.seller.add_book(self.store_id, 0, self.book)
+        assert code == 200
+        self.rp = RequestPicture(conf.URL)
+        yield
+
+    def test_ok(self):
+        r = self.rp.get_picture(self.book.id, 1)
+        assert r.status_code == 200
+        assert r.content == self.picture
+        assert r.headers["Content-Type"] == "image/png"
+        assert r.headers["ETag"].strip('"') == hashlib.sha256(self.picture).hexdigest()
+
+    def test_book_holds_references(self):
+        code, data = RequestSearch().request_search_data("title", title=self.book.title, fields="pictures")
+        assert code == 200
+        refs = [b["pictures"] for b in data if b["id"] == self.book.id][0]
+        assert refs == [hashlib.sha256(self.picture).hexdigest()] * 2
+
+    def test_not_modified(self):
+        etag = self.rp.get_picture(self.book.id, 0).headers["ETag"]
+        r = self.rp.get_picture(self.book.id, 0, {"If-None-Match": etag})
+        assert r.status_code == 304
+        assert r.content == b""
+
+    def test_range(self):
+        r = self.rp.get_picture(self.book.id, 0, {"Range": "bytes=0-7"})
+        assert r.status_code == 206
+        assert r.content == self.picture[:8]
+        assert r.headers["Content-Range"] == "bytes 0-7/{}".format(len(self.picture))
+
+    def test_non_exist_picture(self):
+        r = self.rp.get_picture(self.book.id, 2)
+        assert r.status_code == 529
+        assert json.loads(r.text)["message"] != ""
+
+        r = self.rp.get_picture(self.book.id + "_x", 0)
+        assert r.status_code == 515
@@ -5,6 +5,18 @@ from fe.access.new_buyer import register_new_buyer
 from fe.access.new_seller import register_new_seller
 from fe.access.search import RequestSearch
 from fe.access import book
+from be import conf as be_conf
+from be.model.cache import VersionStamps, version_stamps, CATALOG_VERSION, store_version, user_version
+from be.model.search_engine import InvertedIndexEngine
+from be.model.store import get_db_conn
+
+
+def fresh_books(size: int) -> [book.Book]:
+    # 目录条目只在首次上架时写入，改了标题或标签的书要用新的书号
+    books = book.BookDB().get_book_info(0, size)
+    for bk in books:
+        bk.id = "test_search_book_{}".format(str(uuid.uuid1()))
+    return books
 
 
 class TestSearch:
@@ -22,8 +34,7 @@ class TestSearch:
         assert code == 200
         self.keyword = "hello"
         self.rs = RequestSearch()
-        book_db = book.BookDB()
-        self.book_example = book_db.get_book_info(0, 1)[0]
+        self.book_example = fresh_books(1)[0]
 
     def test_all_field_search(self):
         content, code = self.buyer.search(self.keyword)
@@ -47,6 +58,58 @@ class TestSearch:
         code = self.rs.request_search_title(title=title + "x")
         assert code == 501
 
+    def test_search_title_after_add_book(self):
+        # 缓存的空结果在上新书后失效
+        title = f"hello_{str(uuid.uuid1())}"
+        code = self.rs.request_search_title_in_store(title=title, store_id=self.store_id)
+        assert code == 501
+
+        self.book_example.title = title
+        code = self.seller.add_book(self.store_id, 0, self.book_example)
+        assert code == 200
+
+        code = self.rs.request_search_title_in_store(title=title, store_id=self.store_id)
+        assert code == 200
+        code = self.rs.request_search_title(title=title)
+        assert code == 200
+
+    def test_search_fields(self):
+        title = f"hello_{str(uuid.uuid1())}"
+        self.book_example.title = title
+        code = self.seller.add_book(self.store_id, 0, self.book_example)
+        assert code == 200
+
+        code, data = self.rs.request_search_data("title", title=title)
+        assert code == 200
+        assert data[0]["title"] == title
+        assert set(data[0]) <= {"id", "title", "author", "price", "tags"}
+
+        code, data = self.rs.request_search_data("title_in_store", title=title, store_id=self.store_id,
+                                                 fields="title,pictures")
+        assert code == 200
+        assert set(data[0]) == {"id", "title", "pictures"}
+
+        code, data = self.rs.request_search_data("title", title=title, fields="title,nope")
+        assert code == 501
+
+    def test_invalid_page(self):
+        title = f"hello_{str(uuid.uuid1())}"
+        for page_num, page_size in ((1, 0), (1, -1), (0, 10), (1, "x"), ("x", 10)):
+            code, data = self.rs.request_search_data("title", title=title, page_num=page_num, page_size=page_size)
+            assert code == 400 and data == []
+        content, code = self.buyer.search(title, page=0)
+        assert code == 400
+
+    def test_page_size_clamped(self, monkeypatch):
+        monkeypatch.setattr(be_conf, "Max_Page_Size", 5)
+        title = f"hello_{str(uuid.uuid1())}"
+        books = fresh_books(6)
+        for bk in books:
+            bk.title = title
+            assert self.seller.add_book(self.store_id, 0, bk) == 200
+        code, data, cursor = self.rs.request_search_page("title", title=title, page_size=10 ** 9)
+        assert code == 200 and len(data) == 5 and cursor is not None
+
     def test_search_title_in_store(self):
         title = f"hello_{str(uuid.uuid1())}"
         self.book_example.title = title
@@ -59,6 +122,33 @@ class TestSearch:
                                                      store_id=self.store_id)
         assert code == 501
 
+    def test_search_title_in_store_after_listing(self):
+        # 店内搜索的缓存随本店上架失效，其他店铺上架新书不影响它
+        title = f"hello_{str(uuid.uuid1())}"
+        books = fresh_books(3)
+        for bk in books:
+            bk.title = title
+        other_store_id = "test_create_store_store_{}".format(str(uuid.uuid1()))
+        assert self.seller.create_store(other_store_id) == 200
+        assert self.seller.add_book(self.store_id, 0, books[0]) == 200
+        code, data = self.rs.request_search_data("title_in_store", title=title, store_id=self.store_id)
+        assert code == 200 and len(data) == 1
+        catalog = version_stamps.get(CATALOG_VERSION)
+        assert self.seller.add_book(self.store_id, 0, books[1]) == 200
+        code, data = self.rs.request_search_data("title_in_store", title=title, store_id=self.store_id)
+        assert code == 200 and len(data) == 2
+        # 上架已在目录中的书只推进店铺版本
+        assert self.seller.add_book(other_store_id, 0, books[0]) == 200
+        assert version_stamps.get(CATALOG_VERSION) == catalog + 1
+
+    def test_version_stamp_domains(self):
+        stamps = VersionStamps({"catalog": 1, "store": 4, "user": 4})
+        for i in range(16):
+            stamps.bump(store_version(str(i)))
+        assert stamps.get(CATALOG_VERSION) == 0
+        assert all(stamps.get(user_version(str(i))) == 0 for i in range(16))
+        assert stamps.bump(CATALOG_VERSION) == 1
+
     def test_search_tag(self):
         tag = f"hello_{str(uuid.uuid1())}"
         self.book_example.tags = [tag]
@@ -70,6 +160,46 @@ class TestSearch:
         code = self.rs.request_search_tag(tag=tag + "x")
         assert code == 501
 
+    def test_search_tag_mode(self):
+        tag = f"hello_{str(uuid.uuid1())}"
+        self.book_example.tags = [tag]
+        code = self.seller.add_book(self.store_id, 0, self.book_example)
+        assert code == 200
+
+        code = self.rs.request_search_tag(tag=tag[:-4], mode="prefix")
+        assert code == 200
+        code = self.rs.request_search_tag(tag=tag[:-4], mode="exact")
+        assert code == 501
+        code = self.rs.request_search_tag(tag=tag, mode="exact")
+        assert code == 200
+
+    def test_tag_dictionary(self):
+        tag = f"hello_{str(uuid.uuid1())}"
+        for bk in fresh_books(2):
+            bk.tags = [tag, tag]
+            code = self.seller.add_book(self.store_id, 0, bk)
+            assert code == 200
+
+        code, tags = self.rs.request_tag_dictionary(prefix=tag)
+        assert code == 200
+        assert tags == [{"tag": tag, "count": 2}]
+
+    def test_tag_dictionary_limit(self, monkeypatch):
+        tag = f"hello_{str(uuid.uuid1())}"
+        for i, bk in enumerate(fresh_books(2)):
+            bk.tags = [tag + str(i)]
+            code = self.seller.add_book(self.store_id, 0, bk)
+            assert code == 200
+
+        for limit in ("abc", 0, -1):
+            code, tags = self.rs.request_tag_dictionary(prefix=tag, limit=limit)
+            assert code == 400
+            assert tags == []
+        monkeypatch.setattr(be_conf, "Max_Page_Size", 1)
+        code, tags = self.rs.request_tag_dictionary(prefix=tag, limit=1000)
+        assert code == 200
+        assert len(tags) == 1
+
     def test_search_tag_in_store(self):
         tag = f"hello_{str(uuid.uuid1())}"
         self.book_example.tags = [tag]
@@ -129,4 +259,115 @@ class TestSearch:
                                                        store_id=self.store_id)
         assert code == 501
 
+    def test_search_content_inverted(self):
+        key = "hello13"
+        book_intro = f"{str(uuid.uuid1())} {key} {str(uuid.uuid1())}"
+        self.book_example.book_intro = book_intro
+        self.seller.add_book(self.store_id, 0, self.book_example)
+
+        code = self.rs.request_search_content(content=key, engine="inverted")
+        assert code == 200
+
+        code = self.rs.request_search_content(content=key + "x", engine="inverted")
+        assert code == 501
+
+        code = self.rs.request_search_content(content=key, engine="nope")
+        assert code == 501
+
+    def test_search_inverted_sees_other_workers(self):
+        key = "hello{}".format(uuid.uuid1().hex)
+        self.book_example.book_intro = key
+        self.seller.add_book(self.store_id, 0, self.book_example)
+        assert self.rs.request_search_content(content=key, engine="inverted") == 200
+        # 另一个工作进程上架的新书：只写入目录并推进目录版本号
+        other = fresh_books(1)[0]
+        get_db_conn().col_book.insert_one({"id": other.id, "title": key + "z"})
+        version_stamps.bump(CATALOG_VERSION)
+        content, code = self.buyer.search(key + "z", engine="inverted")
+        assert code == 200
+        assert [b["id"] for b in json.loads(content)["message"]] == [other.id]
+
+    def test_inverted_rank_and_compact(self):
+        engine = InvertedIndexEngine()
+        engine.compact_min = 2
+        engine.build([{"id": "a", "title": "x y"}, {"id": "b", "title": "x"}, {"id": "c", "title": "y"}])
+        assert engine.rank("x", 1) == ["b"]
+        assert engine.rank("x") == ["b", "a"]
+        assert list(engine.ranked("x y")) == engine.rank("x y")
+        # 替换的条目达到四分之一后压缩
+        engine.build([{"id": "b", "title": "z"}, {"id": "c", "title": "x"}])
+        assert engine.stats()["docs"] == 3 and len(engine._book_ids) == 3
+        assert sorted(engine.rank("x")) == ["a", "c"]
+        assert engine.rank("z") == ["b"]
+
+    def test_search_chinese_content_in_store(self):
+        # 随机的中文词，按二元组切分后能在简介中命中
+        key = "".join(chr(0x4e00 + b % 0x5000) for b in uuid.uuid4().bytes[:4])
+        self.book_example.book_intro = f"这是一本关于{key}的书"
+        self.seller.add_book(self.store_id, 0, self.book_example)
+
+        code = self.rs.request_search_content_in_store(content=key, store_id=self.store_id,
+                                                       engine="inverted")
+        assert code == 200
+
+        content, code = self.buyer.search(key, self.store_id, engine="inverted")
+        assert code == 200
+        assert len(json.loads(content)['message']) == 1
+
+        code = self.rs.request_search_content_in_store(content=key, store_id=self.store_id + "x",
+                                                       engine="inverted")
+        assert code == 501
+
+    def test_search_title_in_small_store(self):
+        # 同名书籍大多在其他店铺，本店的书排在第一页之后也应被找到
+        title = f"hello_{str(uuid.uuid1())}"
+        other_store_id = "test_create_store_store_{}".format(str(uuid.uuid1()))
+        code = self.seller.create_store(other_store_id)
+        assert code == 200
+        books = fresh_books(12)
+        for bk in books:
+            bk.title = title
+        for bk in books[:11]:
+            code = self.seller.add_book(other_store_id, 0, bk)
+            assert code == 200
+        code = self.seller.add_book(self.store_id, 0, books[11])
+        assert code == 200
+
+        code = self.rs.request_search_title_in_store(title=title, store_id=self.store_id)
+        assert code == 200
+
+
+    def test_search_cursor(self):
+        # 游标翻页与页码翻页结果一致，且不重复、不遗漏
+        title = f"hello_{str(uuid.uuid1())}"
+        books = book.BookDB().get_book_info(0, 12)
+        for bk in books:
+            bk.id = f"{title}_{bk.id}"
+            bk.title = title
+            code = self.seller.add_book(self.store_id, 0, bk)
+            assert code == 200
+
+        for endpoint, params in [("title", {}), ("title_in_store", {"store_id": self.store_id})]:
+            ids = []
+            cursor = None
+            pages = 0
+            while True:
+                if cursor is not None:
+                    params["cursor"] = cursor
+                code, data, cursor = self.rs.request_search_page(endpoint, title=title, page_size=5, **params)
+                assert code == 200
+                ids.extend(b["id"] for b in data)
+                pages += 1
+                if cursor is None:
+                    break
+            assert pages == 3
+            assert ids == sorted(bk.id for bk in books)
+
+            params.pop("cursor", None)
+            code, data, _ = self.rs.request_search_page(endpoint, title=title, page_size=5, page_num=2, **params)
+            assert code == 200
+            assert [b["id"] for b in data] == ids[5:10]
 
+    def test_search_invalid_cursor(self):
+        code, data, _ = self.rs.request_search_page("title", title="hello", cursor="not a cursor")
+        assert code == 526